@@ -9,8 +9,11 @@ import os
 import sys
 import logging
 import time
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from bisect import bisect_right
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
 
 # 添加 core 模組到路徑
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -18,13 +21,36 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from core.config_loader import ConfigLoader
 from core.snmp_helper import SNMPHelper
 from core.rrd_manager import RRDManager
+from core.map_cache import load_map
+from core.interface_codec import InterfaceTemplate, get_template
+from core.log_summary import LogSummary
+from core.run_metrics import MetricSet, append_run_record
+from core.user_table import UserTable, UserView
+from core.counter_join import CounterTable, join_counters
+from core.counter_state import load_counters, save_counters
+from collectors import sharding
+from collectors.pipeline import WalkPipeline
+
+# 斷路器、RTT、清冊與 RADIUS 來源依配置啟用（SQLite / 資料庫），
+# 於 __init__ 中才匯入，未啟用時不增加收集器的啟動時間
+if TYPE_CHECKING:
+    from core.device_breaker import DeviceBreaker
+    from core.inventory import Inventory
+    from core.radius_source import RadiusMapSource
+    from core.rtt_estimator import RttEstimator
+    from core.snmp_probe import ProbeResult
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
 class UserData:
-    """用戶資料結構"""
+    """
+    用戶資料結構
+    
+    收集器內部以 UserTable 儲存用戶，迭代時取得的是具相同屬性的
+    UserView；此類別保留給 build_interface_name 型別標註及外部程式使用
+    """
     username: str
     slot: int
     port: int
@@ -46,6 +72,46 @@ class CollectionStats:
     skipped: int = 0
     start_time: float = 0
     end_time: float = 0
+    processes: int = 1
+    # 設備斷路器開啟，本次未做任何查詢
+    breaker_open: bool = False
+    # 依頻寬方案彙總: {"download_upload": [inbound, outbound, user_count]}
+    bandwidth_totals: Dict[str, List[int]] = field(default_factory=dict)
+    # 依電路彙總: {circuit_id: [inbound_rate, outbound_rate, user_count]}（位元組/秒）
+    circuit_totals: Dict[str, List[float]] = field(default_factory=dict)
+    # 沒有前次計數器（首次收集或設備重新開機），本次電路速率不可用
+    circuit_baseline: bool = False
+    # 各階段耗時（秒）；walk_out / walk_in 同時進行，串流模式下 walk 與
+    # rrd_write 也互相重疊，加總不等於 duration
+    phases: Dict[str, float] = field(default_factory=dict)
+    # SNMP PDU 數、接收位元組、重試，RRD 建立/更新數與寫入延遲
+    metrics: MetricSet = field(default_factory=MetricSet)
+    
+    @contextmanager
+    def phase(self, name: str):
+        """累計一個階段的耗時（可由多個執行緒記錄不同階段）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - started
+    
+    def to_record(self) -> Dict:
+        """輸出為 JSON 可序列化的執行紀錄"""
+        record = {
+            'started_at': round(self.start_time, 3),
+            'duration': round(self.duration, 3),
+            'total': self.total,
+            'success': self.success,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'success_rate': round(self.success_rate, 2),
+            'processes': self.processes,
+            'breaker_open': self.breaker_open,
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+        }
+        record.update(self.metrics.to_dict())
+        return record
     
     @property
     def duration(self) -> float:
@@ -62,6 +128,12 @@ class CollectionStats:
         return 0
 
 
+def _render_failure(exemplar: Tuple[str, object]) -> str:
+    """彙總範例: 用戶 (原因)"""
+    username, error = exemplar
+    return f"{username} ({error})" if error else username
+
+
 class BaseCollector:
     """收集器基類"""
     
@@ -74,24 +146,35 @@ class BaseCollector:
             device_ip: 設備 IP
             device_type: 設備類型 (1=E320, 2=MX960, 3=MX240, 4=ACX7024)
             map_file: Map 檔案路徑
-            config: 配置載入器，None 則自動建立
+            config: 配置載入器或快照，None 則自動建立
         """
         self.device_ip = device_ip
         self.device_type = device_type
         self.map_file = map_file
         
-        # 載入配置
-        self.config = config if config else ConfigLoader()
+        # 載入配置（使用不可變快照，熱路徑存取不經過 configparser）
+        self.config = (config if config else ConfigLoader()).snapshot()
+        
+        # 各設備 RTT 估算（自動調整 SNMP 逾時）
+        self.rtt: Optional['RttEstimator'] = None
+        if self.config.snmp_adaptive_timeout:
+            from core import rtt_estimator
+            self.rtt = rtt_estimator.RttEstimator(
+                self.config.rtt_db,
+                self.config.snmp_min_timeout,
+                self.config.snmp_max_timeout
+            )
         
         # 初始化 SNMP Helper
-        timeout = self.config.get_device_timeout(device_type)
         retries = self.config.get_device_retries(device_type)
         self.snmp = SNMPHelper(
             device_ip,
             self.config.snmp_community,
-            timeout,
-            retries
+            self.device_timeout(),
+            retries,
+            self.config.snmp_version
         )
+        self.snmp.walk_timeout = self.walk_timeout()
         
         # 初始化 RRD Manager
         self.rrd = RRDManager(
@@ -100,12 +183,61 @@ class BaseCollector:
             self.config.rrd_heartbeat
         )
         
+        # 設備斷路器（跨執行保存連續失敗次數）
+        self.breaker: Optional['DeviceBreaker'] = None
+        if self.config.breaker_enabled:
+            from core import device_breaker
+            self.breaker = device_breaker.DeviceBreaker(
+                self.config.breaker_db,
+                self.config.breaker_threshold,
+                self.config.breaker_probe_interval
+            )
+        
+        # 設備與用戶清冊（寫回解析出的 ifindex）
+        self.inventory: Optional['Inventory'] = None
+        if self.config.inventory_enabled:
+            from core import inventory
+            self.inventory = inventory.Inventory(self.config.inventory_db)
+        
+        # 調度器預檢結果（每次收集使用一次）
+        self.probe: Optional['ProbeResult'] = None
+        
+        # 用戶來源：RADIUS 資料庫（[database] map_source）或 Map 檔案
+        self.map_source: Optional['RadiusMapSource'] = None
+        if self.config.database_map_source:
+            from core import radius_source
+            self.map_source = radius_source.RadiusMapSource(self.config)
+        
+        # 介面名稱範本（依設備類型，見 core.interface_codec）
+        self.interface_template: Optional[InterfaceTemplate] = get_template(device_type)
+        # 解析後的介面表 (slot, port, vpi, vci) -> ifIndex，及其來源 ifDescr 表
+        self._interface_keys: Dict[Tuple[int, int, int, int], Optional[int]] = {}
+        self._interface_keys_source = None
+        
         # 用戶資料
-        self.users: List[UserData] = []
+        self.users: UserTable = UserTable.empty(namer=self.build_interface_name)
+        self._map_signature = None
+        self._refresh_interfaces = False
+        
+        # 電路對應: (slot, port, pic) -> CircuitID，由調度器依 BRAS-Map 設定
+        self.circuit_ports: Dict[Tuple[int, int, int], str] = {}
+        # 電路用戶的前次計數器 (取樣時間, {ifindex: (in, out)})，首次使用時由狀態檔載入
+        self._circuit_previous: Optional[Tuple[float, Dict[int, Tuple[int, int]]]] = None
+        self._circuit_loaded = False
+        # 本次取樣時間、與前次的間隔及電路用戶的計數器
+        self._circuit_time = 0.0
+        self._circuit_elapsed = 0.0
+        self._circuit_counters: Dict[int, Tuple[int, int]] = {}
         
         # 統計資訊
         self.stats = CollectionStats()
         
+        # 本次收集的截止時間（epoch 秒），由 collect_all_users 依時間預算設定
+        self.deadline: Optional[float] = None
+        
+        # 收集迴圈中的逐用戶警告，每次收集結束時彙總輸出
+        self.log = LogSummary(logger, f"設備 {device_ip}")
+        
         # 設備名稱
         self.device_names = {
             1: 'MX240',
@@ -132,93 +264,188 @@ class BaseCollector:
             介面名稱
         
         Note:
-            子類別應覆寫此方法以提供設備專用的介面格式
+            依設備類型的介面範本產生（core.interface_codec.TEMPLATES）
             - DeviceType 1 (MX240): ge-fpc/pic/port:vci
             - DeviceType 2 (MX960): ge-fpc/pic/port:vci
             - DeviceType 3 (E320): ge-slot/port/pic.vci
             - DeviceType 4 (ACX7024): ge-fpc/pic/port:vci
+            其他設備類型需註冊範本，或由子類別覆寫此方法並將
+            interface_template 設為 None（改以介面名稱查詢 ifindex）
         """
-        raise NotImplementedError("子類別必須實作 build_interface_name 方法")
+        if self.interface_template is None:
+            raise NotImplementedError(f"設備類型 {self.device_type} 沒有介面範本")
+        return self.interface_template.name_for(user)
     
     def parse_map_file(self) -> bool:
         """
-        解析 Map 檔案
+        解析 Map 檔案（設定資料庫來源時改由 RADIUS 資料庫載入）
         
         Returns:
             是否成功
         """
+        if self.map_source is not None:
+            return self._load_from_database()
+        
         if not os.path.exists(self.map_file):
             logger.error(f"Map 檔案不存在: {self.map_file}")
             return False
         
         logger.info(f"讀取 Map 檔案: {self.map_file}")
         
-        with open(self.map_file, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # 跳過空行和註解
-                if not line or line.startswith('#'):
-                    continue
-                
-                try:
-                    parts = line.split(',')
-                    if len(parts) != 4:
-                        logger.warning(f"第 {line_num} 行格式錯誤: {line}")
-                        continue
-                    
-                    username, interface, bandwidth, account = [p.strip() for p in parts]
-                    
-                    # 解析介面
-                    iface_parts = interface.split('_')
-                    if len(iface_parts) != 4:
-                        logger.warning(f"第 {line_num} 行介面格式錯誤: {interface}")
-                        continue
-                    
-                    slot, port, vpi, vci = [int(x) for x in iface_parts]
-                    
-                    # 解析頻寬
-                    bw_parts = bandwidth.split('_')
-                    if len(bw_parts) != 2:
-                        logger.warning(f"第 {line_num} 行頻寬格式錯誤: {bandwidth}")
-                        continue
-                    
-                    download, upload = [int(x) for x in bw_parts]
-                    
-                    # 建立用戶資料
-                    user = UserData(
-                        username=username,
-                        slot=slot,
-                        port=port,
-                        vpi=vpi,
-                        vci=vci,
-                        download=download,
-                        upload=upload,
-                        account=account
-                    )
-                    
-                    # 建立介面名稱
-                    user.interface_name = self.build_interface_name(user)
-                    
-                    self.users.append(user)
-                    
-                except Exception as e:
-                    logger.warning(f"第 {line_num} 行解析失敗: {e}")
-                    continue
+        st = os.stat(self.map_file)
+        self._map_signature = (st.st_mtime_ns, st.st_size)
+        compiled = load_map(self.map_file, use_cache=self.config.map_cache_enabled)
+        self._replace_users(UserTable.from_compiled(compiled, namer=self.build_interface_name))
         
         logger.info(f"載入 {len(self.users)} 筆用戶資料")
         return len(self.users) > 0
     
-    def test_connectivity(self) -> bool:
+    def _load_from_database(self) -> bool:
+        """由 RADIUS 資料庫串流載入用戶（先取水位，載入期間的變更下次再載入）"""
+        self._map_signature = self.map_source.watermark(self.device_ip)
+        self._replace_users(self.map_source.load(self.device_ip, namer=self.build_interface_name))
+        return len(self.users) > 0
+    
+    def _replace_users(self, users: UserTable):
+        """
+        換上重新載入的用戶資料
+        
+        已有用戶資料時（常駐執行中 Map 變更）與舊資料比對，介面未變更的用戶
+        沿用已解析的 ifindex，只有新增與介面變更的用戶需要重新解析
+        """
+        old, self.users = self.users, users
+        if len(old) == 0:
+            return
+        
+        diff = users.adopt(old)
+        if diff:
+            logger.info(f"用戶資料變更: {diff.summary()}，沿用 {diff.carried} 個 ifindex")
+        # 新用戶的介面可能是快取之後才建立的，解析不到時重新查詢介面描述
+        self._refresh_interfaces = bool(diff.added or diff.moved)
+    
+    def map_changed(self) -> bool:
+        """用戶來源自上次載入後是否有變更（尚未載入視為變更）"""
+        if self.map_source is not None:
+            return self.map_source.watermark(self.device_ip) != self._map_signature
+        try:
+            st = os.stat(self.map_file)
+        except OSError:
+            return True
+        return self._map_signature != (st.st_mtime_ns, st.st_size)
+    
+    def ensure_map_loaded(self) -> bool:
+        """
+        確保用戶資料為最新
+        
+        Map 檔案未變更時沿用已載入的用戶資料（包含已解析的 ifindex），
+        常駐執行時每個 step 不需重新解析與查詢介面描述；變更時只有新增與
+        介面變更的用戶需要重新解析 ifindex
+        
+        Returns:
+            是否有可收集的用戶
+        """
+        if len(self.users) > 0 and not self.map_changed():
+            return True
+        return self.parse_map_file()
+    
+    def device_timeout(self) -> float:
+        """
+        SNMP GET 逾時（秒）
+        
+        有 RTT 樣本時依估算調整，否則使用設備類型的固定值
+        """
+        timeout = self.config.get_device_timeout(self.device_type)
+        if self.rtt is None:
+            return timeout
+        return self.rtt.timeout(self.device_ip, timeout)
+    
+    def walk_timeout(self, get_timeout: float = None) -> float:
+        """
+        snmpwalk 每個 PDU 的逾時（秒）
+        
+        RTT 樣本只來自單一 GET，設備連續回應 GETNEXT 時可能慢得多，
+        因此以設備類型的固定值為下限，退避後的估算值較大時才延長
+        
+        Args:
+            get_timeout: 已取得的 GET 逾時，None 則重新估算
+        """
+        if get_timeout is None:
+            get_timeout = self.device_timeout()
+        return max(get_timeout, self.config.get_device_timeout(self.device_type))
+    
+    def test_connectivity(self, max_retries: int = None) -> bool:
         """
         測試 SNMP 連線
         
+        Args:
+            max_retries: 最大重試次數，None 則使用設備設定
+        
         Returns:
             是否成功
         """
-        return self.snmp.test_connectivity()
+        return self.snmp.test_connectivity(max_retries)
+    
+    def check_reachable(self) -> bool:
+        """
+        確認設備可連線
+        
+        有調度器預檢結果時直接沿用，不再查詢；否則依斷路器狀態：
+        開啟時直接返回 False（不做 SNMP 查詢），半開時僅做一次不重試的探測
+        
+        Returns:
+            是否可進行收集
+        """
+        breaker = self.breaker
+        state = breaker.state(self.device_ip) if breaker else None
+        
+        probe, self.probe = self.probe, None
+        if probe is not None and time.time() - probe.probed_at > self.config.rrd_step:
+            probe = None
+        
+        if probe is not None:
+            connected = probe.reachable
+            if connected:
+                logger.info(f"預檢可連線: RTT {probe.rtt * 1000:.0f}ms")
+                if probe.rebooted:
+                    self.reset_interface_mapping()
+            else:
+                logger.error(f"預檢無法連線: {probe.error}")
+        elif breaker and state == breaker.OPEN:
+            logger.warning(f"設備 {self.device_ip} 斷路器開啟，略過本次收集")
+            self.stats.breaker_open = True
+            self.stats.skipped = len(self.users)
+            return False
+        elif breaker and state == breaker.HALF_OPEN:
+            logger.info(f"設備 {self.device_ip} 斷路器半開，探測連線")
+            connected = self.test_connectivity(max_retries=0)
+        else:
+            connected = self.test_connectivity()
+        
+        if probe is None and self.rtt is not None:
+            if self.snmp.last_rtt is not None:
+                self.rtt.sample(self.device_ip, self.snmp.last_rtt)
+            elif not connected:
+                self.rtt.backoff(self.device_ip)
+        
+        if breaker is not None:
+            if connected:
+                if state != breaker.CLOSED:
+                    logger.info(f"設備 {self.device_ip} 恢復連線，關閉斷路器")
+                breaker.record_success(self.device_ip)
+            else:
+                breaker.record_failure(self.device_ip)
+        return connected
+    
+    def reset_interface_mapping(self):
+        """設備重新開機：ifIndex 可能重新編號，清除已解析的 ifindex 與介面快取"""
+        logger.warning(f"設備 {self.device_ip} 已重新開機，重新查詢 ifindex（計數器已歸零）")
+        self.users.clear_if_index()
+        self.snmp.clear_interface_cache()
+        # ifindex 重新編號後前次計數器無法對應
+        self._circuit_previous = None
+        self._circuit_loaded = True
     
-    def collect_user_traffic(self, user: UserData) -> bool:
+    def collect_user_traffic(self, user: UserView) -> bool:
         """
         收集單一用戶流量
         
@@ -232,33 +459,43 @@ class BaseCollector:
             # 取得流量計數器
             counters = self.snmp.get_interface_counters(user.interface_name)
             if counters is None:
-                logger.debug(f"無法取得用戶 {user.username} 的計數器")
+                self.log.add("個用戶無法取得計數器", user.username)
                 return False
             
             inbound, outbound = counters
             
             # 更新用戶 RRD
-            if self.rrd.update_user_rrd(user.username, inbound, outbound):
+            if self.rrd.update_user_rrd(user.username, inbound, outbound, quiet=True):
                 return True
             else:
-                logger.warning(f"更新用戶 {user.username} RRD 失敗")
+                self.log.add("個用戶 RRD 更新失敗", (user.username, self.rrd.last_error),
+                             render=_render_failure)
                 return False
             
         except Exception as e:
-            logger.error(f"收集用戶 {user.username} 失敗: {e}")
+            self.log.add("個用戶收集失敗", (user.username, e), level=logging.ERROR,
+                         render=_render_failure)
             return False
     
     def collect_all_users(self) -> CollectionStats:
         """
         收集所有用戶流量（使用 snmpwalk 批次查詢優化版）
         
+        設有時間預算時，超過即中斷 walk：已取得計數器的用戶照常寫入，
+        其餘記為略過（stats.skipped），慢速設備只損失部分資料
+        
         Returns:
             收集統計
         """
-        self.stats = CollectionStats()
+        # run() 剛建立的統計保留連線與 Map 載入階段，其餘情況重新開始
+        if self.stats.start_time:
+            self.stats = CollectionStats()
         self.stats.total = len(self.users)
         self.stats.start_time = time.time()
         
+        budget = self.config.collection_time_budget
+        self.deadline = self.stats.start_time + budget if budget > 0 else None
+        
         logger.info(f"開始收集 {self.stats.total} 個用戶")
         
         # 使用批次 snmpwalk 收集
@@ -266,17 +503,29 @@ class BaseCollector:
             logger.info("使用 snmpwalk 批次收集模式")
             success_count = self._collect_batch_snmpwalk()
             self.stats.success = success_count
-            self.stats.failed = self.stats.total - success_count
+            self.stats.failed = self.stats.total - success_count - self.stats.skipped
         else:
-            # 逐個收集（原始方式）
+            # 逐個收集（原始方式）；不計算電路速率
             logger.info("使用逐個收集模式")
-            for user in self.users:
-                if self.collect_user_traffic(user):
-                    self.stats.success += 1
-                else:
-                    self.stats.failed += 1
+            self.stats.circuit_baseline = bool(self.circuit_ports)
+            with self.stats.phase('poll'):
+                for i, user in enumerate(self.users):
+                    if self.deadline is not None and time.time() >= self.deadline:
+                        self.stats.skipped = self.stats.total - i
+                        break
+                    if self.collect_user_traffic(user):
+                        self.stats.success += 1
+                    else:
+                        self.stats.failed += 1
         
         self.stats.end_time = time.time()
+        self.log.flush()
+        self._take_metrics()
+        
+        if self.stats.skipped:
+            logger.warning(
+                f"超過時間預算 {budget:g} 秒，{self.stats.skipped} 個用戶未收集"
+            )
         
         logger.info(
             f"收集完成: 成功={self.stats.success}, 失敗={self.stats.failed}, "
@@ -292,104 +541,347 @@ class BaseCollector:
         Returns:
             成功收集的用戶數
         """
-        # 建立介面索引映射
+        users = self.users
+        
         # 對於沒有 ifindex 的用戶，需要先查詢介面清單建立映射
-        users_need_ifindex = [u for u in self.users if u.if_index is None]
-        users_have_ifindex = [u for u in self.users if u.if_index is not None]
+        unresolved = users.unresolved_positions()
+        if unresolved:
+            logger.info(f"{len(unresolved)} 個用戶需要查詢 ifindex")
+            with self.stats.phase('ifdescr'):
+                self._resolve_interfaces(unresolved)
         
-        # 如果有用戶需要查詢 ifindex，先建立介面映射
-        if_name_to_index = {}
-        if users_need_ifindex:
-            logger.info(f"{len(users_need_ifindex)} 個用戶需要查詢 ifindex")
-            
-            # 取得所有介面
-            interfaces = self.snmp.get_interface_descriptions(use_cache=True)
-            
-            # 建立名稱到索引的映射
-            for if_index, if_descr in interfaces.items():
-                if_name_to_index[if_descr] = if_index
-            
-            # 為用戶填入 ifindex
-            for user in users_need_ifindex:
-                if user.interface_name in if_name_to_index:
-                    user.if_index = if_name_to_index[user.interface_name]
-                else:
-                    logger.warning(f"找不到介面 {user.interface_name} 的索引")
-        
-        # 收集所有需要的 ifindex
-        required_indexes = set()
-        for user in self.users:
-            if user.if_index:
-                required_indexes.add(str(user.if_index))
-        
-        if not required_indexes:
+        if not any(users.if_index):
             logger.error("沒有有效的 ifindex，無法收集")
             return 0
         
-        logger.info(f"使用 snmpwalk 查詢 {len(required_indexes)} 個介面")
-        
-        # 執行 snmpwalk 批次查詢
-        # 查詢出站流量 (ifHCOutOctets)
-        out_octets_results = self.snmp.snmpwalk_cli(
-            self.snmp.OID_IF_HC_OUT_OCTETS,
-            required_indexes
-        )
-        
-        # 查詢入站流量 (ifHCInOctets)
-        in_octets_results = self.snmp.snmpwalk_cli(
-            self.snmp.OID_IF_HC_IN_OCTETS,
-            required_indexes
-        )
-        
-        if not out_octets_results and not in_octets_results:
-            logger.error("snmpwalk 查詢失敗")
+        processes = self._shard_processes()
+        self._begin_circuit_sample()
+        
+        # 串流管線：walk 與 RRD 寫入同時進行（分片模式需取得完整結果後才 fork）
+        if processes == 1 and self.config.walk_pipeline_enabled:
+            pipeline = WalkPipeline(self, deadline=self.deadline)
+            success_count, totals = pipeline.run()
+            self.stats.bandwidth_totals = totals
+            self.stats.circuit_totals = pipeline.circuit_totals
+            self.stats.skipped = pipeline.skipped
+            self._commit_circuit_sample(success_count)
+            return success_count
+        
+        # 執行 snmpwalk 批次查詢，結果為依 ifindex 排序的欄位陣列
+        # 出站 (ifHCOutOctets) 與入站 (ifHCInOctets) 同時進行，
+        # 時間預算用盡時兩個方向涵蓋的範圍相近
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='walk') as pool:
+            out_future = pool.submit(self._walk_columns, 'walk_out', self.snmp.OID_IF_HC_OUT_OCTETS)
+            in_future = pool.submit(self._walk_columns, 'walk_in', self.snmp.OID_IF_HC_IN_OCTETS)
+            out_walk = out_future.result()
+            in_walk = in_future.result()
+        
+        # walk 中斷時只保留兩個方向都已走過的範圍，其餘用戶記為略過
+        out_walk, in_walk = self._truncate_walks(out_walk, in_walk)
+        
+        if not out_walk[0] and not in_walk[0]:
+            if not self.stats.skipped:
+                logger.error("snmpwalk 查詢失敗")
             return 0
         
         logger.info(
-            f"取得 {len(out_octets_results)} 個出站計數器, "
-            f"{len(in_octets_results)} 個入站計數器"
+            f"取得 {len(out_walk[0])} 個出站計數器, "
+            f"{len(in_walk[0])} 個入站計數器"
         )
         
+        # 合併計數器與用戶（略過缺漏及零流量用戶）
+        with self.stats.phase('join'):
+            counters = CounterTable.from_walks(in_walk, out_walk)
+            positions, inbound, outbound = join_counters(users.if_index, counters)
+            
+            # 同一次 walk 的結果分送至設備上的每個電路
+            self.stats.circuit_totals = self._circuit_totals(positions, inbound, outbound)
+        
+        no_data = len(users) - len(users.unresolved_positions()) - len(positions)
+        if no_data:
+            logger.debug(f"{no_data} 個用戶無流量資料")
+        
         # 更新每個用戶的 RRD
-        success_count = 0
-        for user in self.users:
-            if not user.if_index:
+        with self.stats.phase('rrd_write'):
+            if processes > 1 and len(positions) > 1:
+                success_count, totals = sharding.write_sharded(
+                    self, positions, inbound, outbound, processes
+                )
+                self.stats.processes = processes
+            else:
+                success_count, totals = self._write_user_counters(positions, inbound, outbound)
+        
+        self.stats.bandwidth_totals = totals
+        self._commit_circuit_sample(success_count)
+        return success_count
+    
+    def _resolve_interfaces(self, unresolved: List[int]):
+        """查詢介面描述，為尚未解析的用戶填入 ifindex"""
+        users = self.users
+        
+        # 取得所有介面，依介面範本解析後以用戶欄位查詢
+        lookup = self._interface_lookup(use_cache=True)
+        
+        # Map 變更新增的用戶找不到介面時，快取可能早於介面建立，重新查詢一次
+        if self._refresh_interfaces:
+            self._refresh_interfaces = False
+            if any(lookup(pos) is None for pos in unresolved):
+                lookup = self._interface_lookup(use_cache=False)
+        
+        # 為用戶填入 ifindex
+        resolved = []
+        for pos in unresolved:
+            if_index = lookup(pos)
+            if if_index is not None:
+                users.if_index[pos] = if_index
+                resolved.append((users.usernames[pos], if_index))
+            else:
+                self.log.add("個介面找不到索引", pos, render=users.interface_name)
+        
+        if self.inventory is not None and resolved:
+            self.inventory.record_if_indexes(self.device_ip, resolved)
+    
+    def _walk_columns(self, phase: str, oid: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """walk 單一計數器欄位並記錄階段耗時（於 walk 執行緒執行）"""
+        with self.stats.phase(phase):
+            return self.snmp.snmpwalk_columns(oid, self.deadline)
+    
+    def _interface_lookup(self, use_cache: bool = True) -> Callable[[int], Optional[int]]:
+        """
+        取得用戶位置 -> ifindex 的查詢函式
+        
+        有介面範本時以範本一次解析整張 ifDescr 表為 (slot, port, vpi, vci) -> ifindex
+        （介面描述更新時才重新解析），直接以用戶欄位查詢，不需產生介面名稱；
+        沒有範本或鍵不明確（多個介面對應同一個鍵）時以介面名稱查詢，完整名稱優先
+        """
+        users = self.users
+        interfaces = self.snmp.get_interface_descriptions(use_cache)
+        lookup_name = self.snmp.lookup_interface_index
+        if self.interface_template is None:
+            return lambda pos: lookup_name(users.interface_name(pos))
+        
+        if interfaces is not self._interface_keys_source:
+            self._interface_keys = self.interface_template.resolve(interfaces)
+            self._interface_keys_source = interfaces
+        keys = self._interface_keys
+        slot, port, vpi, vci = users.slot, users.port, users.vpi, users.vci
+        
+        def lookup(pos: int) -> Optional[int]:
+            key = (slot[pos], port[pos], vpi[pos], vci[pos])
+            if_index = keys.get(key)
+            if if_index is None and key in keys:
+                return lookup_name(users.interface_name(pos))
+            return if_index
+        
+        return lookup
+    
+    def _truncate_walks(self, out_walk: Tuple[Sequence[int], Sequence[int]],
+                        in_walk: Tuple[Sequence[int], Sequence[int]]):
+        """
+        處理因時間預算中斷的 walk
+        
+        walk 依 ifindex 遞增返回，中斷的 walk 只涵蓋到最後取得的 ifindex；
+        兩個方向截至較小者為止的結果是完整的，超出部分捨棄，
+        對應的用戶記入 stats.skipped
+        
+        Returns:
+            (出站 walk, 入站 walk)
+        """
+        walks = {
+            self.snmp.OID_IF_HC_OUT_OCTETS: out_walk,
+            self.snmp.OID_IF_HC_IN_OCTETS: in_walk,
+        }
+        truncated = [walk for oid, walk in walks.items() if oid in self.snmp.truncated_walks]
+        if not truncated:
+            return out_walk, in_walk
+        
+        limit = min(walk[0][-1] if len(walk[0]) else 0 for walk in truncated)
+        self.stats.skipped = sum(1 for if_index in self.users.if_index if if_index > limit)
+        
+        def cut(walk):
+            end = bisect_right(walk[0], limit)
+            return walk[0][:end], walk[1][:end]
+        
+        return cut(out_walk), cut(in_walk)
+    
+    def _shard_processes(self) -> int:
+        """
+        決定寫入 RRD 的進程數
+        
+        用戶數超過 fork_threshold 時使用 max_processes 個進程，否則單一進程
+        """
+        if not self.config.enable_multiprocessing:
+            return 1
+        if len(self.users) <= self.config.fork_threshold:
+            return 1
+        if not sharding.fork_available():
+            logger.warning("系統不支援 fork，使用單一進程收集")
+            return 1
+        return max(1, self.config.max_processes)
+    
+    @property
+    def circuit_state_path(self) -> str:
+        """電路用戶前次計數器的狀態檔案"""
+        return os.path.join(self.rrd.circuit_dir, 'state', f"{self.device_ip}.counters")
+    
+    def _begin_circuit_sample(self):
+        """開始一次電路取樣：載入前次計數器並記錄取樣時間"""
+        self._circuit_counters = {}
+        if not self.circuit_ports:
+            return
+        if not self._circuit_loaded:
+            self._circuit_previous = load_counters(self.circuit_state_path)
+            self._circuit_loaded = True
+        
+        self._circuit_time = time.time()
+        previous = self._circuit_previous
+        self._circuit_elapsed = self._circuit_time - previous[0] if previous else 0.0
+        if self._circuit_elapsed <= 0:
+            self.stats.circuit_baseline = True
+    
+    def _commit_circuit_sample(self, success_count: int):
+        """
+        保存本次電路用戶的計數器，作為下次計算速率的基準
+        
+        因時間預算只取得部分計數器時保留前次基準，下次速率涵蓋兩次間隔
+        """
+        if not self.circuit_ports or not success_count or self.stats.skipped:
+            return
+        self._circuit_previous = (self._circuit_time, self._circuit_counters)
+        try:
+            save_counters(self.circuit_state_path, self._circuit_time, self._circuit_counters)
+        except OSError as e:
+            logger.warning(f"無法寫入電路計數器狀態 {self.circuit_state_path}: {e}")
+    
+    def _circuit_totals(self, positions: Sequence[int], inbound: Sequence[int],
+                        outbound: Sequence[int]) -> Dict[str, List[float]]:
+        """
+        依用戶的 (slot, port, vpi) 將速率彙總至所屬電路
+        
+        各用戶以前次計數器計算速率後加總：用戶加入或離開電路不會使
+        總和跳動；沒有前次計數器（新用戶）或計數器歸零的用戶本次不計入速率
+        
+        Returns:
+            {circuit_id: [inbound_rate, outbound_rate, user_count]}（位元組/秒），
+            未設定電路則為空
+        """
+        totals: Dict[str, List[float]] = {}
+        if not self.circuit_ports:
+            return totals
+        
+        users = self.users
+        slot, port, vpi, if_indexes = users.slot, users.port, users.vpi, users.if_index
+        circuit_ports = self.circuit_ports
+        counters = self._circuit_counters
+        elapsed = self._circuit_elapsed
+        previous = self._circuit_previous[1] if elapsed > 0 else {}
+        for pos, user_in, user_out in zip(positions, inbound, outbound):
+            circuit_id = circuit_ports.get((slot[pos], port[pos], vpi[pos]))
+            if circuit_id is None:
                 continue
-            
-            ifindex_str = str(user.if_index)
-            
-            # 取得計數器值
-            outbound = out_octets_results.get(ifindex_str, 0)
-            inbound = in_octets_results.get(ifindex_str, 0)
-            
-            if outbound == 0 and inbound == 0:
-                logger.debug(f"用戶 {user.username} (ifindex={ifindex_str}) 無流量資料")
+            if_index = if_indexes[pos]
+            counters[if_index] = (user_in, user_out)
+            total = totals.get(circuit_id)
+            if total is None:
+                total = totals[circuit_id] = [0.0, 0.0, 0]
+            total[2] += 1
+            last = previous.get(if_index)
+            if last is not None and user_in >= last[0] and user_out >= last[1]:
+                total[0] += (user_in - last[0]) / elapsed
+                total[1] += (user_out - last[1]) / elapsed
+        
+        return totals
+    
+    def _write_user_counters(self, positions: Sequence[int], inbound: Sequence[int],
+                             outbound: Sequence[int]) -> Tuple[int, Dict[str, List[int]]]:
+        """
+        寫入用戶 RRD，並依頻寬方案彙總流量
+        
+        Args:
+            positions: 用戶位置
+            inbound: 入站計數器
+            outbound: 出站計數器
+        
+        Returns:
+            (成功數, {plan: [inbound, outbound, user_count]})
+        """
+        users = self.users
+        usernames = users.usernames
+        download = users.download
+        upload = users.upload
+        
+        success_count = 0
+        totals: Dict[str, List[int]] = {}
+        for pos, user_in, user_out in zip(positions, inbound, outbound):
+            username = usernames[pos]
+            if not self.rrd.update_user_rrd(username, user_in, user_out, quiet=True):
+                self.log.add("個用戶 RRD 更新失敗", (username, self.rrd.last_error),
+                             render=_render_failure)
                 continue
             
-            # 更新 RRD
-            if self.rrd.update_user_rrd(user.username, inbound, outbound):
-                success_count += 1
+            success_count += 1
+            plan = f"{download[pos]}_{upload[pos]}"
+            total = totals.get(plan)
+            if total is None:
+                totals[plan] = [user_in, user_out, 1]
             else:
-                logger.warning(f"更新用戶 {user.username} RRD 失敗")
+                total[0] += user_in
+                total[1] += user_out
+                total[2] += 1
         
-        return success_count
+        return success_count, totals
+    
+    def _take_metrics(self):
+        """將 SNMP 與 RRD 計數器移入本次收集統計"""
+        self.stats.metrics.merge(self.snmp.metrics.take())
+        self.stats.metrics.merge(self.rrd.metrics.take())
+    
+    def run_record(self) -> Dict:
+        """
+        本次收集的執行紀錄（JSON 可序列化）
+        
+        Returns:
+            包含設備、各階段耗時、SNMP/RRD 計數器與 RRD 寫入延遲的字典
+        """
+        record = {
+            'timestamp': round(time.time(), 3),
+            'device': self.device_ip,
+            'device_type': self.device_type,
+            'device_name': self.device_name,
+        }
+        record.update(self.stats.to_record())
+        return record
     
     def run(self) -> bool:
         """
         執行完整收集流程
         
+        設定 [monitoring] run_log 時，結束後將執行紀錄附加於該檔案
+        
         Returns:
             是否成功
         """
+        self.stats = CollectionStats()
+        # 捨棄收集之外（例如工具程式直接呼叫）累積的計數
+        self.snmp.metrics.take()
+        self.rrd.metrics.take()
+        self.snmp.timeout = self.device_timeout()
+        self.snmp.walk_timeout = self.walk_timeout(self.snmp.timeout)
+        logger.debug(f"SNMP 逾時: GET {self.snmp.timeout:.2f} 秒, walk {self.snmp.walk_timeout:.2f} 秒")
         try:
-            # 1. 測試連線
+            # 1. 測試連線（沿用預檢結果，或依斷路器狀態）
             logger.info(f"測試 SNMP 連線: {self.device_ip}")
-            if not self.test_connectivity():
-                logger.error("SNMP 連線失敗")
+            with self.stats.phase('connect'):
+                reachable = self.check_reachable()
+            if not reachable:
+                if not self.stats.breaker_open:
+                    logger.error("SNMP 連線失敗")
                 return False
             
-            # 2. 解析 Map 檔案
-            if not self.parse_map_file():
+            # 2. 解析 Map 檔案（未變更則沿用已載入的用戶資料）
+            with self.stats.phase('map_load'):
+                loaded = self.ensure_map_loaded()
+            if not loaded:
                 logger.error("Map 檔案解析失敗")
                 return False
             
@@ -407,6 +899,13 @@ class BaseCollector:
         except Exception as e:
             logger.error(f"收集流程失敗: {e}", exc_info=True)
             return False
+        finally:
+            self._take_metrics()
+            if self.config.monitoring_run_log:
+                try:
+                    append_run_record(self.config.monitoring_run_log, self.run_record())
+                except OSError as e:
+                    logger.warning(f"無法寫入執行紀錄 {self.config.monitoring_run_log}: {e}")
 
 
 # 測試程式
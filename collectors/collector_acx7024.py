@@ -5,15 +5,12 @@ DeviceType: 4 - Fixed IP Services
 """
 import sys, os, logging, argparse
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from collectors.base_collector import BaseCollector, UserData
+from collectors.base_collector import BaseCollector
 logger = logging.getLogger(__name__)
 
 class ACX7024Collector(BaseCollector):
     def __init__(self, device_ip: str, map_file: str, config=None):
         super().__init__(device_ip, device_type=4, map_file=map_file, config=config)
-    
-    def build_interface_name(self, user: UserData) -> str:
-        return f"ge-{user.slot}/{user.vpi}/{user.port}:{user.vci}"
 
 def main():
     parser = argparse.ArgumentParser(description='ACX7024 流量收集器')
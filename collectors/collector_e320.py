@@ -17,7 +17,7 @@ import argparse
 # 添加父目錄到路徑
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from collectors.base_collector import BaseCollector, UserData
+from collectors.base_collector import BaseCollector
 
 logger = logging.getLogger(__name__)
 
@@ -35,25 +35,6 @@ class E320Collector(BaseCollector):
             config: 配置載入器
         """
         super().__init__(device_ip, device_type=3, map_file=map_file, config=config)
-    
-    def build_interface_name(self, user: UserData) -> str:
-        """
-        建立 E320 介面名稱
-        
-        格式: ge-slot/port/pic.vci
-        範例: ge-1/2/0.3490
-        
-        Args:
-            user: 用戶資料
-        
-        Returns:
-            介面名稱
-        """
-        # E320 介面格式: ge-slot/port/pic.vci
-        # 可能是 GE 或 XE，這裡假設是 GE，如果需要可以從 map 檔案擴展
-        interface_type = 'ge'  # 預設使用 GE
-        
-        return f"{interface_type}-{user.slot}/{user.port}/{user.vpi}.{user.vci}"
 
 
 def main():
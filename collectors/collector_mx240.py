@@ -15,7 +15,7 @@ import logging
 import argparse
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from collectors.base_collector import BaseCollector, UserData
+from collectors.base_collector import BaseCollector
 
 logger = logging.getLogger(__name__)
 
@@ -25,21 +25,6 @@ class MX240Collector(BaseCollector):
     
     def __init__(self, device_ip: str, map_file: str, config=None):
         super().__init__(device_ip, device_type=1, map_file=map_file, config=config)
-    
-    def build_interface_name(self, user: UserData) -> str:
-        """
-        建立 MX240 介面名稱
-        
-        格式: ge-fpc/pic/port:vci
-        範例: ge-1/0/2:3490
-        
-        Note:
-            MX 系列格式: slot=fpc, vpi=pic
-        """
-        interface_type = 'ge'  # 預設使用 GE
-        
-        # MX 系列格式: ge-fpc/pic/port:vci
-        return f"{interface_type}-{user.slot}/{user.vpi}/{user.port}:{user.vci}"
 
 
 def main():
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+pipeline.py - 串流 walk / 寫入管線
+
+將單一設備的收集拆成同時執行的三個階段：
+
+    walk (OUT, IN 各一) ──► join ──► RRD 寫入
+
+walk 每收到一批計數器就交給 join 階段；某個 ifindex 的入站與出站
+計數器都到齊後，立即將對應用戶送往寫入階段。階段之間使用有界佇列，
+整體耗時接近 max(walk, 寫入) 而非兩者相加。
+
+設定截止時間時，walk 超過即中斷；walk 依 ifindex 遞增返回，因此兩個
+方向都已取得的範圍照常寫入，範圍之外的用戶記為略過（skipped）。
+
+任一階段失敗時設定停止旗標：各階段的佇列操作以逾時輪詢旗標後結束，
+執行中的 snmpwalk 程序被終止，run() 等待所有執行緒結束後重新拋出
+第一個錯誤，該設備記為收集失敗。
+"""
+
+import queue
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from collectors.sharding import merge_totals
+
+logger = logging.getLogger(__name__)
+
+# 方向標記
+_IN = 0
+_OUT = 1
+
+# 各方向 walk 的階段名稱（CollectionStats.phases）
+_WALK_PHASES = ('walk_in', 'walk_out')
+
+# 佇列操作檢查停止旗標的間隔（秒）
+_POLL_INTERVAL = 0.1
+
+
+class _Stopped(Exception):
+    """管線已停止（其他階段失敗），結束目前階段"""
+
+
+class WalkPipeline:
+    """單一設備的串流收集管線"""
+
+    def __init__(self, collector, queue_size: int = 64, batch_size: int = 500,
+                 deadline: float = None):
+        """
+        Args:
+            collector: BaseCollector 實例（ifindex 已解析）
+            queue_size: 各階段佇列的最大批次數
+            batch_size: 每批最多筆數
+            deadline: walk 截止時間（epoch 秒），None 則不限制
+        """
+        self.collector = collector
+        self.batch_size = batch_size
+        self.deadline = deadline
+        self._join_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._received = [0, 0]
+        # 各方向最後取得的 ifindex，以及 walk 是否因截止時間中斷
+        self._last_index = [0, 0]
+        self._truncated = [False, False]
+        self._errors: List[BaseException] = []
+        self._stop = threading.Event()
+        # 依電路彙總的速率（run() 完成後可用）
+        self.circuit_totals: Dict[str, List[float]] = {}
+        # 因截止時間未取得計數器的用戶數（run() 完成後可用）
+        self.skipped = 0
+
+    def _targets(self) -> Dict[int, List[int]]:
+        """建立 ifindex -> 用戶位置列表"""
+        targets: Dict[int, List[int]] = {}
+        for pos, if_index in enumerate(self.collector.users.if_index):
+            if if_index:
+                targets.setdefault(if_index, []).append(pos)
+        return targets
+
+    def _put(self, target: queue.Queue, item):
+        """放入佇列；管線停止時拋出 _Stopped（下游已不再讀取）"""
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: queue.Queue):
+        """取出佇列；管線停止時拋出 _Stopped（上游已不再放入）"""
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _fail(self, error: BaseException, message: str):
+        """記錄錯誤並停止整個管線"""
+        self._errors.append(error)
+        logger.error(f"{message}: {error}")
+        self._stop.set()
+        self.collector.snmp.cancel_streams()
+
+    def _walk(self, direction: int, oid: str):
+        """walk 階段：將每批計數器送往 join 階段"""
+        snmp = self.collector.snmp
+        stream = snmp.snmpwalk_stream(oid, self.batch_size, self.deadline)
+        try:
+            with self.collector.stats.phase(_WALK_PHASES[direction]):
+                for batch in stream:
+                    self._received[direction] += len(batch)
+                    self._last_index[direction] = batch[-1][0]
+                    self._put(self._join_queue, (direction, batch))
+            self._truncated[direction] = oid in snmp.truncated_walks
+            self._put(self._join_queue, (direction, None))
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._fail(e, "snmpwalk 串流失敗")
+        finally:
+            # 提前結束時終止 snmpwalk 程序
+            stream.close()
+
+    def _join(self, targets: Dict[int, List[int]]):
+        """join 階段：入站與出站都到齊的 ifindex，立即送往寫入階段"""
+        pending = ({}, {})
+        done = [False, False]
+        out_batch = ([], [], [])
+
+        def emit(if_index: int, inbound: int, outbound: int):
+            if inbound == 0 and outbound == 0:
+                return
+            for pos in targets[if_index]:
+                out_batch[0].append(pos)
+                out_batch[1].append(inbound)
+                out_batch[2].append(outbound)
+            if len(out_batch[0]) >= self.batch_size:
+                flush()
+
+        def flush():
+            nonlocal out_batch
+            if out_batch[0]:
+                self._put(self._write_queue, out_batch)
+                out_batch = ([], [], [])
+
+        try:
+            while not all(done):
+                direction, batch = self._get(self._join_queue)
+                if batch is None:
+                    done[direction] = True
+                    continue
+
+                mine = pending[direction]
+                other = pending[1 - direction]
+                for if_index, value in batch:
+                    if if_index not in targets:
+                        continue
+                    other_value = other.pop(if_index, None)
+                    if other_value is None:
+                        mine[if_index] = value
+                    elif direction == _IN:
+                        emit(if_index, value, other_value)
+                    else:
+                        emit(if_index, other_value, value)
+
+            # walk 中斷時，只有兩個方向都已走過的範圍是完整的
+            limit = min(
+                (self._last_index[d] for d in (_IN, _OUT) if self._truncated[d]),
+                default=None
+            )
+            if limit is not None:
+                self.skipped = sum(len(positions) for if_index, positions in targets.items()
+                                   if if_index > limit)
+
+            # 僅出現在單邊的介面，缺少的一方視為 0
+            for if_index, value in pending[_IN].items():
+                if limit is None or if_index <= limit:
+                    emit(if_index, value, 0)
+            for if_index, value in pending[_OUT].items():
+                if limit is None or if_index <= limit:
+                    emit(if_index, 0, value)
+            flush()
+            self._put(self._write_queue, None)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._fail(e, "計數器合併失敗")
+
+    def _timed_join(self, targets: Dict[int, List[int]]):
+        with self.collector.stats.phase('join'):
+            self._join(targets)
+
+    def run(self) -> Tuple[int, Dict[str, List[int]]]:
+        """
+        執行管線，寫入階段在呼叫端執行緒進行
+
+        Returns:
+            (成功數, 依頻寬方案彙總)
+
+        Raises:
+            任一階段的錯誤（所有執行緒結束後重新拋出）
+        """
+        snmp = self.collector.snmp
+        threads = [
+            threading.Thread(target=self._walk, args=(_OUT, snmp.OID_IF_HC_OUT_OCTETS),
+                             name='walk-out', daemon=True),
+            threading.Thread(target=self._walk, args=(_IN, snmp.OID_IF_HC_IN_OCTETS),
+                             name='walk-in', daemon=True),
+            threading.Thread(target=self._timed_join, args=(self._targets(),),
+                             name='join', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        success = 0
+        totals: Dict[str, List[int]] = {}
+        stats = self.collector.stats
+        try:
+            while True:
+                batch = self._get(self._write_queue)
+                if batch is None:
+                    break
+                # 只計入寫入本身，不含等待 walk 的時間
+                with stats.phase('rrd_write'):
+                    batch_success, batch_totals = self.collector._write_user_counters(*batch)
+                    success += batch_success
+                    merge_totals(totals, batch_totals)
+                    merge_totals(self.circuit_totals, self.collector._circuit_totals(*batch))
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._fail(e, "RRD 寫入失敗")
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        if not any(self._received):
+            if not any(self._truncated):
+                logger.error("snmpwalk 查詢失敗")
+        else:
+            logger.info(
+                f"取得 {self._received[_OUT]} 個出站計數器, "
+                f"{self._received[_IN]} 個入站計數器"
+            )
+
+        return success, totals
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+registry.py - 收集器註冊表
+
+依 DeviceType 取得對應的收集器類別
+"""
+
+import os
+import sys
+from typing import Dict, Optional, Type
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.base_collector import BaseCollector
+from collectors.collector_mx240 import MX240Collector
+from collectors.collector_mx960 import MX960Collector
+from collectors.collector_e320 import E320Collector
+from collectors.collector_acx7024 import ACX7024Collector
+
+# DeviceType -> 收集器類別 (1=MX240, 2=MX960, 3=E320, 4=ACX7024)
+COLLECTOR_CLASSES: Dict[int, Type[BaseCollector]] = {
+    1: MX240Collector,
+    2: MX960Collector,
+    3: E320Collector,
+    4: ACX7024Collector,
+}
+
+
+def get_collector_class(device_type: int) -> Optional[Type[BaseCollector]]:
+    """
+    取得設備類型對應的收集器類別
+    
+    Args:
+        device_type: 設備類型
+    
+    Returns:
+        收集器類別，不支援則返回 None
+    """
+    return COLLECTOR_CLASSES.get(device_type)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+sharding.py - 多進程分片收集
+
+用戶數超過 fork_threshold 時，將合併後的計數器放入共享記憶體，
+切分為 max_processes 個分片，由子進程各自寫入 RRD 並彙總，
+結果再合併回父進程。
+"""
+
+import logging
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Sequence, Tuple
+
+from core.run_metrics import MetricSet
+
+logger = logging.getLogger(__name__)
+
+# 子進程狀態（由 _init_worker 設定）
+_worker = {}
+
+
+def fork_available() -> bool:
+    """是否支援 fork 啟動方式（子進程直接繼承用戶資料表，不需序列化）"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def shard_ranges(count: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    將 count 筆資料切分為最多 shards 個連續區間
+
+    Returns:
+        [(start, end), ...]，不含空區間
+    """
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    ranges = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class SharedCounters:
+    """合併後的 (用戶位置, 入站, 出站) 三個欄位，存放於單一共享記憶體區塊"""
+
+    _ITEM_SIZE = 8
+
+    def __init__(self, positions: Sequence[int], inbound: Sequence[int],
+                 outbound: Sequence[int]):
+        self.count = len(positions)
+        size = max(1, 3 * self._ITEM_SIZE * self.count)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+
+        positions_view, inbound_view, outbound_view = self.views()
+        positions_view[:] = _as_buffer('q', positions)
+        inbound_view[:] = _as_buffer('Q', inbound)
+        outbound_view[:] = _as_buffer('Q', outbound)
+        del positions_view, inbound_view, outbound_view
+
+    def views(self) -> Tuple[memoryview, memoryview, memoryview]:
+        """取得三個欄位的 memoryview（不複製資料）"""
+        n = self.count * self._ITEM_SIZE
+        buf = self.shm.buf
+        return (buf[0:n].cast('q'), buf[n:2 * n].cast('Q'), buf[2 * n:3 * n].cast('Q'))
+
+    def release(self):
+        """關閉並刪除共享記憶體"""
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _as_buffer(typecode: str, values: Sequence[int]):
+    """將整數序列轉為可指派給 memoryview 的 array"""
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    return array(typecode, values)
+
+
+def _init_worker(collector, counters: SharedCounters):
+    """子進程初始化：保存繼承自父進程的收集器與共享計數器"""
+    # 捨棄 fork 前父進程已累積的日誌彙總與 RRD 計數，只傳回子進程本身的部分
+    collector.log.take()
+    collector.rrd.metrics.take()
+    _worker['collector'] = collector
+    _worker['views'] = counters.views()
+
+
+def _write_shard(start: int, end: int
+                 ) -> Tuple[int, Dict[str, List[int]], Dict[str, List], MetricSet]:
+    """子進程：寫入一個分片的用戶 RRD 並彙總（連同日誌彙總與 RRD 計數傳回父進程）"""
+    positions, inbound, outbound = _worker['views']
+    collector = _worker['collector']
+    success, totals = collector._write_user_counters(
+        positions[start:end], inbound[start:end], outbound[start:end]
+    )
+    return success, totals, collector.log.take(), collector.rrd.metrics.take()
+
+
+def write_sharded(collector, positions: Sequence[int], inbound: Sequence[int],
+                  outbound: Sequence[int], processes: int
+                  ) -> Tuple[int, Dict[str, List[int]]]:
+    """
+    以多個子進程分片寫入用戶 RRD
+
+    Args:
+        collector: BaseCollector 實例（子進程以 fork 繼承）
+        positions: 用戶位置
+        inbound: 入站計數器
+        outbound: 出站計數器
+        processes: 子進程數
+
+    Returns:
+        (成功數, 依頻寬方案彙總 {plan: [inbound, outbound, user_count]})
+    """
+    ranges = shard_ranges(len(positions), processes)
+    counters = SharedCounters(positions, inbound, outbound)
+
+    success = 0
+    totals: Dict[str, List[int]] = {}
+    try:
+        logger.info(f"分片寫入: {len(positions)} 個用戶, {len(ranges)} 個進程")
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(collector, counters)) as pool:
+            futures = [pool.submit(_write_shard, start, end) for start, end in ranges]
+            for future in futures:
+                shard_success, shard_totals, shard_log, shard_metrics = future.result()
+                success += shard_success
+                merge_totals(totals, shard_totals)
+                collector.log.merge(shard_log)
+                collector.rrd.metrics.merge(shard_metrics)
+    finally:
+        counters.release()
+
+    return success, totals
+
+
+def merge_totals(into: Dict[str, List[int]], part: Dict[str, List[int]]):
+    """合併頻寬方案彙總"""
+    for plan, values in part.items():
+        current = into.get(plan)
+        if current is None:
+            into[plan] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
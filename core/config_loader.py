@@ -3,17 +3,32 @@
 config_loader.py - 配置載入器
 
 負責載入和管理系統配置
+
+ConfigLoader 每次存取屬性都會經過 configparser；收集器、調度器等
+熱路徑改用 snapshot() 產生的 ConfigSnapshot：所有屬性一次算好的
+不可變物件，可直接 pickle 傳給子進程。常駐程式以 ConfigWatcher
+在配置檔案變更時才重新解析。
 """
 
 import os
+import socket
 import configparser
 import logging
-from typing import Dict, List, Optional
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 
+def _mtime_ns(path: str) -> Optional[int]:
+    """取得檔案修改時間，不存在則返回 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
 class ConfigLoader:
     """配置載入器類別"""
     
@@ -41,6 +56,7 @@ class ConfigLoader:
         
         self.config_file = config_file
         self.config = configparser.ConfigParser()
+        self._snapshot: Optional['ConfigSnapshot'] = None
         self._load_config()
         
         logger.info(f"配置已載入: {config_file}")
@@ -50,8 +66,29 @@ class ConfigLoader:
         if not os.path.exists(self.config_file):
             raise FileNotFoundError(f"配置檔案不存在: {self.config_file}")
         
+        self._mtime_ns = _mtime_ns(self.config_file)
         self.config.read(self.config_file, encoding='utf-8')
     
+    def snapshot(self) -> 'ConfigSnapshot':
+        """
+        取得不可變的配置快照（第一次呼叫時計算所有屬性，之後沿用）
+        
+        Returns:
+            ConfigSnapshot
+        """
+        if self._snapshot is None:
+            values = {
+                f.name: getattr(self, f.name) for f in fields(ConfigSnapshot)
+                if f.name not in ('config_file', 'mtime_ns')
+            }
+            values['dispatcher_optional_areas'] = tuple(values['dispatcher_optional_areas'])
+            # dict 不可雜湊，快照以排序後的 (類型, 上限) 保存，使用時以 dict() 複製
+            values['dispatcher_type_limits'] = tuple(sorted(values['dispatcher_type_limits'].items()))
+            self._snapshot = ConfigSnapshot(
+                config_file=self.config_file, mtime_ns=self._mtime_ns, **values
+            )
+        return self._snapshot
+    
     def get(self, section: str, key: str, fallback=None):
         """
         取得配置值
@@ -105,6 +142,64 @@ class ConfigLoader:
         """系統根路徑"""
         return self.get('base', 'root_path', '/opt/isp_monitor')
     
+    @property
+    def database_enabled(self) -> bool:
+        """是否使用 RADIUS 資料庫"""
+        return self.getboolean('database', 'enabled', False)
+    
+    @property
+    def database_map_source(self) -> bool:
+        """收集器是否直接由資料庫載入用戶（取代 Map 檔案）"""
+        return self.database_enabled and self.getboolean('database', 'map_source', False)
+    
+    @property
+    def database_driver(self) -> str:
+        """資料庫 driver（mysql 或 sqlite）"""
+        return self.get('database', 'driver', 'mysql')
+    
+    @property
+    def database_host(self) -> str:
+        """資料庫主機"""
+        return self.get('database', 'host', 'localhost')
+    
+    @property
+    def database_port(self) -> int:
+        """資料庫埠"""
+        return self.getint('database', 'port', 3306)
+    
+    @property
+    def database_user(self) -> str:
+        """資料庫帳號"""
+        return self.get('database', 'user', '')
+    
+    @property
+    def database_password(self) -> str:
+        """資料庫密碼"""
+        return self.get('database', 'password', '')
+    
+    @property
+    def database_name(self) -> str:
+        """資料庫名稱"""
+        return self.get('database', 'database', '')
+    
+    @property
+    def database_path(self) -> str:
+        """SQLite 資料庫檔案（driver = sqlite 時使用）"""
+        path = self.get('database', 'path', 'data/radius.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def database_map_table(self) -> str:
+        """用戶對應資料表或檢視表"""
+        return self.get('database', 'map_table', 'subscriber_map')
+    
+    @property
+    def database_chunk_size(self) -> int:
+        """由資料庫串流讀取時每批筆數"""
+        return self.getint('database', 'chunk_size', 5000)
+    
     @property
     def snmp_community(self) -> str:
         """SNMP Community"""
@@ -120,6 +215,11 @@ class ConfigLoader:
         """SNMP 重試次數"""
         return self.getint('snmp', 'retries', 2)
     
+    @property
+    def snmp_version(self) -> str:
+        """SNMP 版本（命令行 snmpwalk 使用）"""
+        return self.get('snmp', 'version', '2c')
+    
     @property
     def use_snmpwalk_batch(self) -> bool:
         """是否使用 snmpwalk 批次收集（預設開啟）"""
@@ -163,6 +263,133 @@ class ConfigLoader:
         """最大進程數"""
         return self.getint('collection', 'max_processes', 4)
     
+    @property
+    def enable_multiprocessing(self) -> bool:
+        """是否啟用多進程分片收集"""
+        return self.getboolean('collection', 'enable_multiprocessing', True)
+    
+    @property
+    def walk_pipeline_enabled(self) -> bool:
+        """是否使用串流 walk / 寫入管線（單一進程收集時）"""
+        return self.getboolean('collection', 'walk_pipeline', True)
+    
+    @property
+    def collection_time_budget(self) -> float:
+        """
+        每台設備的收集時間預算（秒），預設為 RRD step 的 90%，0 表示不限制
+        
+        超過時中斷 walk，只寫入已取得計數器的用戶，其餘記為略過
+        """
+        return self.getfloat('collection', 'time_budget', self.rrd_step * 0.9)
+    
+    @property
+    def dispatcher_max_workers(self) -> int:
+        """調度器同時收集的設備數上限"""
+        return self.getint('dispatcher', 'max_workers', 8)
+    
+    @property
+    def dispatcher_type_limits(self) -> Dict[int, int]:
+        """
+        各設備類型同時收集的上限
+        
+        格式: type_limits = 3:2, 2:4 （DeviceType:上限，未列出者僅受 max_workers 限制）
+        """
+        limits = {}
+        raw = self.get('dispatcher', 'type_limits', '')
+        for item in raw.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                device_type, limit = item.split(':')
+                limits[int(device_type)] = int(limit)
+            except ValueError:
+                logger.warning(f"dispatcher type_limits 格式錯誤: {item}")
+        return limits
+    
+    @property
+    def dispatcher_history_db(self) -> str:
+        """調度器收集歷史資料庫（SQLite）"""
+        path = self.get('dispatcher', 'history_db', 'data/dispatcher_history.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def dispatcher_preflight(self) -> bool:
+        """每次調度前是否並行探測所有設備（sysUpTime / sysDescr）"""
+        return self.getboolean('dispatcher', 'preflight', True)
+    
+    @property
+    def dispatcher_optional_areas(self) -> List[str]:
+        """預估超過 RRD step 時可略過的區域"""
+        raw = self.get('dispatcher', 'optional_areas', '')
+        return [area.strip() for area in raw.split(',') if area.strip()]
+    
+    @property
+    def scheduler_spread(self) -> float:
+        """輪詢排程器相位分散範圍佔 RRD step 的比例"""
+        return self.getfloat('scheduler', 'spread', 0.75)
+    
+    @property
+    def scheduler_jitter(self) -> float:
+        """輪詢排程器每次取樣的隨機抖動上限（秒）"""
+        return self.getfloat('scheduler', 'jitter', 5.0)
+    
+    @property
+    def breaker_enabled(self) -> bool:
+        """是否啟用設備斷路器"""
+        return self.getboolean('breaker', 'enabled', True)
+    
+    @property
+    def breaker_threshold(self) -> int:
+        """開啟斷路器的連續連線失敗次數"""
+        return self.getint('breaker', 'failure_threshold', 3)
+    
+    @property
+    def breaker_probe_interval(self) -> float:
+        """斷路器開啟後的探測間隔（秒）"""
+        return self.getfloat('breaker', 'probe_interval', 3600.0)
+    
+    @property
+    def breaker_db(self) -> str:
+        """設備斷路器狀態資料庫（SQLite）"""
+        path = self.get('breaker', 'db', 'data/device_breaker.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def cluster_enabled(self) -> bool:
+        """是否啟用多節點分散收集"""
+        return self.getboolean('cluster', 'enabled', False)
+    
+    @property
+    def cluster_node_id(self) -> str:
+        """本節點 ID（預設為主機名稱）"""
+        return self.get('cluster', 'node_id', '') or socket.gethostname()
+    
+    @property
+    def cluster_membership_dir(self) -> str:
+        """成員清單目錄（所有節點共用）"""
+        path = self.get('cluster', 'membership_dir', 'data/cluster')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def cluster_member_ttl(self) -> float:
+        """節點心跳逾時（秒），預設為兩個 RRD step"""
+        return self.getfloat('cluster', 'member_ttl', 2.0 * self.rrd_step)
+    
+    @property
+    def daemon_socket(self) -> str:
+        """常駐收集程式的本機控制 socket"""
+        path = self.get('daemon', 'socket', 'data/rrdw-daemon.sock')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
     @property
     def log_dir(self) -> str:
         """日誌目錄"""
@@ -192,6 +419,50 @@ class ConfigLoader:
             bras_map = os.path.join(self.root_path, bras_map)
         return bras_map
     
+    @property
+    def map_cache_enabled(self) -> bool:
+        """是否使用 Map 編譯快取（預設開啟）"""
+        return self.getboolean('performance', 'map_cache_enabled', True)
+    
+    @property
+    def inventory_enabled(self) -> bool:
+        """是否維護設備與用戶清冊（調度時增量更新，收集器寫回 ifindex）"""
+        return self.getboolean('inventory', 'enabled', False)
+    
+    @property
+    def inventory_db(self) -> str:
+        """設備與用戶清冊資料庫（SQLite）"""
+        path = self.get('inventory', 'db', 'data/inventory.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def monitoring_run_log(self) -> str:
+        """每次收集的執行紀錄（JSON Lines），空字串表示不記錄"""
+        path = self.get('monitoring', 'run_log', '')
+        if path and not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def monitoring_metrics_textfile(self) -> str:
+        """OpenMetrics 指標檔案（node_exporter textfile collector），空字串表示不輸出"""
+        path = self.get('monitoring', 'metrics_textfile', '')
+        if path and not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
+    @property
+    def monitoring_metrics_http_port(self) -> int:
+        """常駐程式的 HTTP /metrics 埠，0 表示不啟用"""
+        return self.getint('monitoring', 'metrics_http_port', 0)
+    
+    @property
+    def monitoring_metrics_http_host(self) -> str:
+        """HTTP /metrics 監聽位址"""
+        return self.get('monitoring', 'metrics_http_host', '127.0.0.1')
+    
     def get_device_timeout(self, device_type: int) -> int:
         """
         根據設備類型取得 SNMP 超時時間
@@ -206,6 +477,29 @@ class ConfigLoader:
             return self.e320_timeout
         return self.snmp_timeout
     
+    @property
+    def snmp_adaptive_timeout(self) -> bool:
+        """是否依各設備觀察到的 RTT 自動調整 SNMP 逾時"""
+        return self.getboolean('snmp', 'adaptive_timeout', False)
+    
+    @property
+    def snmp_min_timeout(self) -> float:
+        """自動調整逾時的下限（秒）"""
+        return self.getfloat('snmp', 'min_timeout', 1.0)
+    
+    @property
+    def snmp_max_timeout(self) -> float:
+        """自動調整逾時的上限（秒）"""
+        return self.getfloat('snmp', 'max_timeout', 30.0)
+    
+    @property
+    def rtt_db(self) -> str:
+        """各設備 RTT 估算資料庫（SQLite）"""
+        path = self.get('snmp', 'rtt_db', 'data/device_rtt.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(self.root_path, path)
+        return path
+    
     def get_device_retries(self, device_type: int) -> int:
         """
         根據設備類型取得 SNMP 重試次數
@@ -282,6 +576,150 @@ class ConfigLoader:
         return os.path.join(self.map_file_dir, map_filename)
 
 
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    不可變的配置快照
+    
+    屬性名稱與 ConfigLoader 相同，值在建立時一次算好，存取只是一般
+    屬性讀取；內容只有基本型別與 tuple（可雜湊），可直接 pickle 傳給子進程。
+    由 ConfigLoader.snapshot() 或 ConfigWatcher 建立。
+    """
+    config_file: str
+    mtime_ns: Optional[int]
+    
+    root_path: str
+    
+    database_enabled: bool
+    database_map_source: bool
+    database_driver: str
+    database_host: str
+    database_port: int
+    database_user: str
+    database_password: str
+    database_name: str
+    database_path: str
+    database_map_table: str
+    database_chunk_size: int
+    
+    snmp_community: str
+    snmp_timeout: int
+    snmp_retries: int
+    snmp_version: str
+    use_snmpwalk_batch: bool
+    e320_timeout: int
+    e320_retries: int
+    snmp_adaptive_timeout: bool
+    snmp_min_timeout: float
+    snmp_max_timeout: float
+    rtt_db: str
+    
+    rrd_base_dir: str
+    rrd_step: int
+    rrd_heartbeat: int
+    
+    fork_threshold: int
+    max_processes: int
+    enable_multiprocessing: bool
+    walk_pipeline_enabled: bool
+    collection_time_budget: float
+    
+    dispatcher_max_workers: int
+    dispatcher_type_limits: Tuple[Tuple[int, int], ...]
+    dispatcher_history_db: str
+    dispatcher_preflight: bool
+    dispatcher_optional_areas: Tuple[str, ...]
+    
+    scheduler_spread: float
+    scheduler_jitter: float
+    
+    breaker_enabled: bool
+    breaker_threshold: int
+    breaker_probe_interval: float
+    breaker_db: str
+    
+    cluster_enabled: bool
+    cluster_node_id: str
+    cluster_membership_dir: str
+    cluster_member_ttl: float
+    
+    daemon_socket: str
+    
+    log_dir: str
+    log_level: str
+    
+    map_file_dir: str
+    bras_map_file: str
+    map_cache_enabled: bool
+    
+    inventory_enabled: bool
+    inventory_db: str
+    
+    monitoring_run_log: str
+    monitoring_metrics_textfile: str
+    monitoring_metrics_http_port: int
+    monitoring_metrics_http_host: str
+    
+    # 只依賴屬性的方法與 ConfigLoader 共用
+    get_device_timeout = ConfigLoader.get_device_timeout
+    get_device_retries = ConfigLoader.get_device_retries
+    get_map_file_path = ConfigLoader.get_map_file_path
+    load_bras_map = ConfigLoader.load_bras_map
+    
+    def snapshot(self) -> 'ConfigSnapshot':
+        """已是快照，返回自身（與 ConfigLoader.snapshot() 介面一致）"""
+        return self
+    
+    def changed(self) -> bool:
+        """配置檔案自建立快照後是否有變更"""
+        return _mtime_ns(self.config_file) != self.mtime_ns
+
+
+class ConfigWatcher:
+    """
+    配置檔案監看
+    
+    以修改時間判斷配置檔案是否變更，只在變更時重新解析並產生新快照；
+    未變更時每次檢查只有一次 stat()
+    """
+    
+    def __init__(self, config):
+        """
+        Args:
+            config: ConfigLoader、ConfigSnapshot 或配置檔案路徑
+        """
+        if isinstance(config, str):
+            config = ConfigLoader(config)
+        self.snapshot: ConfigSnapshot = config.snapshot()
+        self._force = False
+    
+    def invalidate(self):
+        """下次 poll() 無論檔案是否變更都重新載入（例如收到 SIGHUP）"""
+        self._force = True
+    
+    def poll(self) -> bool:
+        """
+        檢查配置檔案，有變更時重新載入
+        
+        Returns:
+            配置內容是否有變更（新快照在 self.snapshot）
+        """
+        if not self._force and not self.snapshot.changed():
+            return False
+        
+        self._force = False
+        try:
+            snapshot = ConfigLoader(self.snapshot.config_file).snapshot()
+        except (OSError, configparser.Error, ValueError) as e:
+            logger.error(f"重新載入配置失敗，沿用目前配置: {e}")
+            return False
+        
+        # 只更新修改時間（例如 touch）不視為變更
+        changed = replace(snapshot, mtime_ns=self.snapshot.mtime_ns) != self.snapshot
+        self.snapshot = snapshot
+        return changed
+
+
 # 測試程式
 if __name__ == '__main__':
     # 設定日誌
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+counter_join.py - 計數器與用戶資料表合併
+
+將 snmpwalk 取得的排序計數器欄位（ifindex, in, out）與 UserTable 的
+if_index 欄位合併，一次完成缺漏遮罩與零流量過濾。
+安裝 NumPy 時以 searchsorted 向量化處理，否則使用標準庫實作。
+"""
+
+import logging
+from array import array
+from typing import List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_numpy_module = None
+_numpy_checked = False
+
+
+def _numpy():
+    """
+    延遲載入 NumPy（選用套件）
+
+    載入 NumPy 需要數十毫秒，只在實際合併計數器時才載入
+
+    Returns:
+        numpy 模組，未安裝則返回 None
+    """
+    global _numpy_module, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ImportError:
+            _numpy_module = None
+        _numpy_checked = True
+    return _numpy_module
+
+
+class CounterTable:
+    """依 ifindex 遞增排序的計數器欄位"""
+
+    def __init__(self, if_index: Sequence[int], inbound: Sequence[int],
+                 outbound: Sequence[int]):
+        """
+        Args:
+            if_index: 遞增排序的 ifindex
+            inbound: 對應的入站計數器
+            outbound: 對應的出站計數器
+        """
+        self.if_index = if_index
+        self.inbound = inbound
+        self.outbound = outbound
+
+    def __len__(self) -> int:
+        return len(self.if_index)
+
+    @classmethod
+    def from_walks(cls, in_walk: Tuple[Sequence[int], Sequence[int]],
+                   out_walk: Tuple[Sequence[int], Sequence[int]]) -> 'CounterTable':
+        """
+        合併入站、出站兩次 walk 的結果
+
+        兩邊 ifindex 集合不同時取聯集，缺少的一方計數器為 0
+
+        Args:
+            in_walk: (ifindex, ifHCInOctets)，ifindex 遞增
+            out_walk: (ifindex, ifHCOutOctets)，ifindex 遞增
+
+        Returns:
+            計數器表
+        """
+        in_idx, in_val = in_walk
+        out_idx, out_val = out_walk
+
+        # 常見情況：兩次 walk 涵蓋相同介面，直接沿用
+        if len(in_idx) == len(out_idx) and in_idx == out_idx:
+            return cls(in_idx, in_val, out_val)
+
+        np = _numpy()
+        if np is not None:
+            in_idx_np = np.asarray(in_idx, dtype=np.int64)
+            out_idx_np = np.asarray(out_idx, dtype=np.int64)
+            keys = np.union1d(in_idx_np, out_idx_np)
+            inbound = np.zeros(len(keys), dtype=np.uint64)
+            outbound = np.zeros(len(keys), dtype=np.uint64)
+            inbound[np.searchsorted(keys, in_idx_np)] = np.asarray(in_val, dtype=np.uint64)
+            outbound[np.searchsorted(keys, out_idx_np)] = np.asarray(out_val, dtype=np.uint64)
+            return cls(keys, inbound, outbound)
+
+        in_map = dict(zip(in_idx, in_val))
+        out_map = dict(zip(out_idx, out_val))
+        keys = array('q', sorted(in_map.keys() | out_map.keys()))
+        inbound = array('Q', [in_map.get(k, 0) for k in keys])
+        outbound = array('Q', [out_map.get(k, 0) for k in keys])
+        return cls(keys, inbound, outbound)
+
+
+def join_counters(user_if_index: Sequence[int], counters: CounterTable
+                  ) -> Tuple[List[int], List[int], List[int]]:
+    """
+    將用戶 if_index 與計數器表合併
+
+    略過未解析（0）、walk 中不存在、以及入站與出站皆為 0 的用戶
+
+    Args:
+        user_if_index: 每位用戶的 if_index（UserTable.if_index）
+        counters: 計數器表
+
+    Returns:
+        (用戶位置, 入站計數器, 出站計數器) 三個等長列表
+    """
+    if len(counters) == 0 or len(user_if_index) == 0:
+        return [], [], []
+
+    if _numpy() is not None:
+        return _join_numpy(user_if_index, counters)
+    return _join_python(user_if_index, counters)
+
+
+def _join_numpy(user_if_index, counters: CounterTable):
+    """以 searchsorted 一次完成合併"""
+    np = _numpy()
+    keys = np.asarray(counters.if_index, dtype=np.int64)
+    inbound = np.asarray(counters.inbound, dtype=np.uint64)
+    outbound = np.asarray(counters.outbound, dtype=np.uint64)
+    users = np.asarray(user_if_index, dtype=np.int64)
+
+    pos = np.searchsorted(keys, users)
+    np.minimum(pos, len(keys) - 1, out=pos)
+    found = keys[pos] == users
+    found &= users != 0
+
+    user_in = inbound[pos]
+    user_out = outbound[pos]
+    found &= (user_in != 0) | (user_out != 0)
+
+    selected = np.flatnonzero(found)
+    return (selected.tolist(), user_in[selected].tolist(), user_out[selected].tolist())
+
+
+def _join_python(user_if_index, counters: CounterTable):
+    """標準庫實作：建立一次 ifindex 查詢表後逐位用戶合併"""
+    lookup = {k: (i, o) for k, i, o in zip(counters.if_index, counters.inbound,
+                                           counters.outbound) if i or o}
+    positions = []
+    inbound = []
+    outbound = []
+    for pos, if_index in enumerate(user_if_index):
+        pair = lookup.get(if_index)
+        if pair is not None:
+            positions.append(pos)
+            inbound.append(pair[0])
+            outbound.append(pair[1])
+    return positions, inbound, outbound
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+counter_state.py - 前次計數器狀態
+
+電路層以用戶速率彙總（見 BaseCollector._circuit_totals）：每次收集
+需要同一批介面的前次計數器。收集器結束時將電路用戶的計數器寫入
+緊湊的二進位檔案，下次收集（可能是新的子進程）再載入。
+"""
+
+import os
+import struct
+import logging
+import tempfile
+from array import array
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 狀態檔案格式
+#   header: magic | timestamp(d) | count
+#   body:   if_index(q) | inbound(Q) | outbound(Q)
+STATE_MAGIC = b'RRDWCTR\x01'
+_HEADER = struct.Struct('<8sdQ')
+
+
+def load_counters(path: str) -> Optional[Tuple[float, Dict[int, Tuple[int, int]]]]:
+    """
+    載入前次計數器
+
+    Args:
+        path: 狀態檔案路徑
+
+    Returns:
+        (取樣時間, {ifindex: (inbound, outbound)})；不存在或格式不符返回 None
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"無法讀取計數器狀態 {path}: {e}")
+        return None
+
+    if len(data) < _HEADER.size:
+        return None
+    magic, timestamp, count = _HEADER.unpack_from(data)
+    if magic != STATE_MAGIC or len(data) != _HEADER.size + count * 24:
+        logger.warning(f"計數器狀態格式不符，重新建立: {path}")
+        return None
+
+    columns = []
+    offset = _HEADER.size
+    for typecode in ('q', 'Q', 'Q'):
+        column = array(typecode)
+        column.frombytes(data[offset:offset + count * 8])
+        columns.append(column)
+        offset += count * 8
+    if_index, inbound, outbound = columns
+    return timestamp, dict(zip(if_index, zip(inbound, outbound)))
+
+
+def save_counters(path: str, timestamp: float, counters: Dict[int, Tuple[int, int]]):
+    """
+    原子寫入本次計數器
+
+    Args:
+        path: 狀態檔案路徑
+        timestamp: 取樣時間
+        counters: {ifindex: (inbound, outbound)}
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    if_index = array('q', counters)
+    inbound = array('Q', (value[0] for value in counters.values()))
+    outbound = array('Q', (value[1] for value in counters.values()))
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.rrdw-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(STATE_MAGIC, timestamp, len(if_index)))
+            f.write(if_index.tobytes())
+            f.write(inbound.tobytes())
+            f.write(outbound.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
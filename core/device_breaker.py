@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+device_breaker.py - 設備斷路器
+
+無法連線的設備每次測試連線都要等待 timeout * (retries + 1) 加上重試間隔，
+持續佔用收集工作槽。斷路器以本機 SQLite 記錄每台設備的連續失敗次數
+（跨執行保存）：
+
+- CLOSED: 正常收集
+- OPEN: 連續失敗達門檻，直接略過，不做任何 SNMP 查詢
+- HALF_OPEN: 開啟後每隔 probe_interval 允許一次單發（不重試）的探測，
+  成功即恢復 CLOSED
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_breaker (
+    ip           TEXT PRIMARY KEY,
+    failures     INTEGER NOT NULL,
+    last_attempt REAL    NOT NULL
+);
+"""
+
+
+class DeviceBreaker:
+    """設備斷路器（SQLite，多進程共用）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, db_path: str, threshold: int = 3, probe_interval: float = 3600):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+            threshold: 開啟斷路器的連續失敗次數
+            probe_interval: 開啟後探測間隔（秒）
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每次操作使用獨立連線，可跨進程與執行緒使用"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def state(self, ip: str) -> str:
+        """
+        取得設備目前狀態
+
+        Args:
+            ip: 設備 IP
+
+        Returns:
+            CLOSED、OPEN 或 HALF_OPEN
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT failures, last_attempt FROM device_breaker WHERE ip = ?", (ip,)
+            ).fetchone()
+
+        if row is None or row[0] < self.threshold:
+            return self.CLOSED
+        if time.time() - row[1] >= self.probe_interval:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def record_success(self, ip: str):
+        """連線成功，重設失敗次數"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM device_breaker WHERE ip = ?", (ip,))
+
+    def record_failure(self, ip: str) -> int:
+        """
+        連線失敗，累計失敗次數
+
+        Returns:
+            連續失敗次數
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO device_breaker (ip, failures, last_attempt) VALUES (?, 1, ?) "
+                "ON CONFLICT(ip) DO UPDATE SET failures = failures + 1, "
+                "last_attempt = excluded.last_attempt",
+                (ip, time.time())
+            )
+            failures = conn.execute(
+                "SELECT failures FROM device_breaker WHERE ip = ?", (ip,)
+            ).fetchone()[0]
+
+        if failures == self.threshold:
+            logger.warning(f"設備 {ip} 連續 {failures} 次連線失敗，開啟斷路器")
+        return failures
+
+    def failing(self) -> List[Tuple[str, int, float]]:
+        """取得所有有失敗紀錄的設備 (IP, 連續失敗次數, 最近嘗試時間)"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT ip, failures, last_attempt FROM device_breaker "
+                "ORDER BY failures DESC, ip"
+            ).fetchall()
+
+    def reset(self, ip: str = None):
+        """重設指定設備（None 則全部）"""
+        with self._connect() as conn:
+            if ip is None:
+                conn.execute("DELETE FROM device_breaker")
+            else:
+                conn.execute("DELETE FROM device_breaker WHERE ip = ?", (ip,))
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    from core.config_loader import ConfigLoader
+
+    parser = argparse.ArgumentParser(description='設備斷路器狀態')
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    parser.add_argument('--reset', nargs='?', const='', metavar='IP',
+                        help='重設指定設備（未指定 IP 則全部）')
+    args = parser.parse_args()
+
+    config = ConfigLoader(args.config) if args.config else ConfigLoader()
+    breaker = DeviceBreaker(config.breaker_db, config.breaker_threshold,
+                            config.breaker_probe_interval)
+
+    if args.reset is not None:
+        breaker.reset(args.reset or None)
+        print("✓ 已重設")
+        sys.exit(0)
+
+    for ip, failures, last_attempt in breaker.failing():
+        state = breaker.state(ip)
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_attempt))
+        print(f"{ip}\t{state}\t失敗 {failures} 次\t最近嘗試 {when}")
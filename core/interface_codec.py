@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+interface_codec.py - 介面名稱編解碼
+
+各設備類型的介面名稱格式以範本描述，例如 MX 的 "{type}-{slot}/{vpi}/{port}:{vci}"，
+編譯為格式化字串與解析用正規表示式，收集器（用戶 → 介面名稱）與工具
+（介面名稱 → slot/port/vpi/vci）共用同一份定義。
+
+- ge/xe/et 等乙太網路類型視為相同，"." 與 ":" 單元分隔視為相同
+- resolve() 將整張 ifDescr 表合併後以單一正規表示式一次解析，
+  得到 (slot, port, vpi, vci) -> ifIndex，收集器可直接以用戶欄位查詢；
+  多個介面對應同一個鍵時標記為不明確（None），由呼叫端改以完整名稱查詢
+"""
+
+import re
+import logging
+from collections import Counter
+from itertools import chain
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Junos 介面名稱: {類型}-{n}/{n}/{n}[.:]{unit}
+_INTERFACE_NAME = re.compile(r'^([a-z]+)-(\d+)/(\d+)/(\d+)(?:[.:](\d+))?$')
+
+# 乙太網路介面類型（速率不同，slot/pic/port 編號方式相同）
+ETHERNET_TYPES = ('ge', 'xe', 'et', 'fe', 'mge')
+
+_FIELD = re.compile(r'\{(\w+)\}')
+KEY_FIELDS = ('slot', 'port', 'vpi', 'vci')
+
+
+def normalize_interface_name(name: str) -> Optional[Tuple]:
+    """
+    將介面名稱正規化為與設備類型無關的查詢鍵
+
+    ge/xe/et 等乙太網路類型視為相同，E320 的 "." 與 MX 的 ":" 分隔視為相同，
+    例如 ge-1/0/2:3490 與 xe-1/0/2.3490 都得到 ('eth', 1, 0, 2, 3490)
+
+    Args:
+        name: 介面名稱
+
+    Returns:
+        (類型, n, n, n, unit)，無法解析則返回 None
+    """
+    match = _INTERFACE_NAME.match(name.strip().lower())
+    if match is None:
+        return None
+    kind, a, b, c, unit = match.groups()
+    if kind in ETHERNET_TYPES:
+        kind = 'eth'
+    return (kind, int(a), int(b), int(c), int(unit) if unit is not None else None)
+
+
+class InterfaceTemplate:
+    """單一設備類型的介面名稱範本"""
+
+    def __init__(self, pattern: str, interface_type: str = 'ge'):
+        """
+        Args:
+            pattern: 範本，欄位為 {type}、{slot}、{port}、{vpi}、{vci}
+            interface_type: 產生名稱時使用的介面類型
+        """
+        fields = _FIELD.findall(pattern)
+        if sorted(set(fields) - {'type'}) != sorted(KEY_FIELDS):
+            raise ValueError(f"介面範本必須包含 slot/port/vpi/vci: {pattern}")
+
+        self.pattern = pattern
+        self.interface_type = interface_type
+        self._format = pattern.replace('{type}', interface_type).format
+
+        # 解析用正規表示式：類型接受所有乙太網路類型，"." / ":" 視為相同
+        regex = ''
+        pos = 0
+        for match in _FIELD.finditer(pattern):
+            regex += self._literal(pattern[pos:match.start()])
+            if match.group(1) == 'type':
+                regex += '(?:' + '|'.join(ETHERNET_TYPES) + ')'
+            else:
+                regex += f'(?P<{match.group(1)}>\\d+)'
+            pos = match.end()
+        regex += self._literal(pattern[pos:])
+        self._regex = re.compile(f'^{regex}$')
+        # resolve() 使用：每行 "{ifIndex}\t{ifDescr}"
+        self._table_regex = re.compile(f'^(?P<if_index>\\d+)\\t{regex}$', re.M)
+        self._groups = self._table_regex.groups
+        self._order = tuple(self._table_regex.groupindex[name] - 1 for name in KEY_FIELDS)
+
+    @staticmethod
+    def _literal(text: str) -> str:
+        return ''.join('[.:]' if ch in '.:' else re.escape(ch) for ch in text)
+
+    def format(self, slot: int, port: int, vpi: int, vci: int) -> str:
+        """產生介面名稱"""
+        return self._format(slot=slot, port=port, vpi=vpi, vci=vci)
+
+    def name_for(self, user) -> str:
+        """產生用戶（UserData / UserView）的介面名稱"""
+        return self._format(slot=user.slot, port=user.port, vpi=user.vpi, vci=user.vci)
+
+    def parse(self, name: str) -> Optional[Tuple[int, int, int, int]]:
+        """
+        解析介面名稱
+
+        Returns:
+            (slot, port, vpi, vci)，不符合範本則返回 None
+        """
+        match = self._regex.match(name.strip().lower())
+        if match is None:
+            return None
+        return tuple(int(match.group(field)) for field in KEY_FIELDS)
+
+    def resolve(self, interfaces: Dict[int, str]) -> Dict[Tuple[int, int, int, int], Optional[int]]:
+        """
+        將整張 ifDescr 表解析為 (slot, port, vpi, vci) -> ifIndex
+
+        所有介面合併為單一字串後以一個正規表示式掃描（findall），數字欄位
+        一次以 map(int) 轉換，不逐一呼叫 parse()。同一個鍵對應多個介面時
+        （例如同時有 ge-1/0/0.5 與 xe-1/0/0:5）值為 None，表示不明確，
+        與 SNMPHelper 的正規化索引相同，只能以完整介面名稱查詢
+
+        Args:
+            interfaces: {ifIndex: ifDescr}
+
+        Returns:
+            {(slot, port, vpi, vci): ifIndex 或 None（不明確）}
+        """
+        text = '\n'.join(map('{0[0]}\t{0[1]}'.format, interfaces.items())).lower()
+        numbers = list(map(int, chain.from_iterable(self._table_regex.findall(text))))
+        step = self._groups
+        keys = list(zip(*(numbers[i::step] for i in self._order)))
+        resolved: Dict[Tuple[int, int, int, int], Optional[int]] = dict(zip(keys, numbers[0::step]))
+        if len(resolved) != len(keys):
+            for key, count in Counter(keys).items():
+                if count > 1:
+                    resolved[key] = None
+        return resolved
+
+
+# DeviceType -> 介面範本 (1=MX240, 2=MX960, 3=E320, 4=ACX7024)
+MX_TEMPLATE = InterfaceTemplate('{type}-{slot}/{vpi}/{port}:{vci}')
+E320_TEMPLATE = InterfaceTemplate('{type}-{slot}/{port}/{vpi}.{vci}')
+
+TEMPLATES: Dict[int, InterfaceTemplate] = {
+    1: MX_TEMPLATE,
+    2: MX_TEMPLATE,
+    3: E320_TEMPLATE,
+    4: MX_TEMPLATE,
+}
+
+
+def get_template(device_type: int) -> Optional[InterfaceTemplate]:
+    """
+    取得設備類型的介面範本
+
+    Args:
+        device_type: 設備類型
+
+    Returns:
+        介面範本，不支援則返回 None
+    """
+    return TEMPLATES.get(device_type)
+
+
+def register_template(device_type: int, template: InterfaceTemplate):
+    """註冊（或取代）設備類型的介面範本"""
+    TEMPLATES[device_type] = template
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 3:
+        print("用法: python3 interface_codec.py <DeviceType> <介面名稱 | slot_port_vpi_vci> ...")
+        sys.exit(1)
+
+    template = get_template(int(sys.argv[1]))
+    if template is None:
+        print(f"不支援的設備類型: {sys.argv[1]}")
+        sys.exit(1)
+
+    for arg in sys.argv[2:]:
+        parts = arg.split('_')
+        if len(parts) == 4 and all(p.isdigit() for p in parts):
+            print(f"{arg}\t{template.format(*map(int, parts))}")
+        else:
+            print(f"{arg}\t{template.parse(arg)}")
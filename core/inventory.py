@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+inventory.py - 設備與用戶清冊
+
+將 BRAS-Map 與所有 Map 檔案編譯為本機 SQLite（WAL）資料庫，
+以索引回答「用戶 X 在哪台設備、哪個 ifindex」、「電路 Y 上有哪些用戶」
+等查詢，不需逐一掃描文字檔案。
+
+- 依各來源檔案的 mtime 與大小增量更新，未變更的檔案不重新匯入
+- Map 檔案經由 map_cache 載入（沿用編譯快取）
+- 收集器解析 ifindex 後寫回清冊；重新匯入 Map 時保留未變更用戶的 ifindex
+- WAL 模式下更新時仍可同時查詢
+- 啟用時調度器由清冊取得 BRAS-Map 電路與各設備用戶數（bras_map_rows、
+  user_counts），不再每次解析文字檔案
+"""
+
+import os
+import sqlite3
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from core.map_cache import load_map
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_file (
+    path      TEXT PRIMARY KEY,
+    device_ip TEXT,
+    mtime_ns  INTEGER NOT NULL,
+    size      INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS circuit (
+    area           TEXT    NOT NULL,
+    device_type    INTEGER NOT NULL,
+    device_ip      TEXT    NOT NULL,
+    circuit_id     TEXT    NOT NULL,
+    slot           INTEGER NOT NULL,
+    port           INTEGER NOT NULL,
+    interface_type TEXT    NOT NULL,
+    bandwidth_max  INTEGER NOT NULL,
+    if_assign      INTEGER NOT NULL,
+    pic            INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_circuit_id ON circuit (circuit_id);
+CREATE INDEX IF NOT EXISTS idx_circuit_area ON circuit (area);
+CREATE INDEX IF NOT EXISTS idx_circuit_port ON circuit (device_ip, slot, port, pic);
+CREATE TABLE IF NOT EXISTS subscriber (
+    username  TEXT    NOT NULL,
+    device_ip TEXT    NOT NULL,
+    slot      INTEGER NOT NULL,
+    port      INTEGER NOT NULL,
+    vpi       INTEGER NOT NULL,
+    vci       INTEGER NOT NULL,
+    download  INTEGER NOT NULL,
+    upload    INTEGER NOT NULL,
+    account   TEXT    NOT NULL,
+    if_index  INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_subscriber_username ON subscriber (username);
+CREATE INDEX IF NOT EXISTS idx_subscriber_port ON subscriber (device_ip, slot, port, vpi);
+CREATE INDEX IF NOT EXISTS idx_subscriber_plan ON subscriber (download, upload);
+"""
+
+# 用戶的 (slot, port, vpi) 對應 BRAS-Map 電路的 (slot, port, pic)
+_SUBSCRIBER_CIRCUIT = """
+SELECT s.username, s.device_ip, c.device_type, c.area, c.circuit_id,
+       s.slot, s.port, s.vpi, s.vci, s.download, s.upload, s.account, s.if_index
+FROM subscriber s
+LEFT JOIN circuit c
+  ON c.device_ip = s.device_ip AND c.slot = s.slot AND c.port = s.port AND c.pic = s.vpi
+"""
+
+_MAP_PREFIX = 'map_'
+_MAP_SUFFIX = '.txt'
+
+
+def map_file_ip(name: str) -> Optional[str]:
+    """由 Map 檔案名稱（map_<ip>.txt）取得設備 IP，不符合則返回 None"""
+    if name.startswith(_MAP_PREFIX) and name.endswith(_MAP_SUFFIX):
+        return name[len(_MAP_PREFIX):-len(_MAP_SUFFIX)] or None
+    return None
+
+
+class Inventory:
+    """設備與用戶清冊（SQLite，多進程共用）"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+        """
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每次操作使用獨立連線，可跨進程與執行緒使用"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # 更新
+
+    def update(self, config, use_cache: bool = None) -> Dict[str, int]:
+        """
+        依來源檔案的 mtime 與大小增量更新清冊
+
+        Args:
+            config: 配置載入器或快照（bras_map_file、map_file_dir）
+            use_cache: 是否使用 Map 編譯快取，None 則使用配置
+
+        Returns:
+            {'bras_map': 是否重新匯入, 'maps': 重新匯入的 Map 數, 'removed': 移除的 Map 數}
+        """
+        if use_cache is None:
+            use_cache = config.map_cache_enabled
+
+        with self._connect() as conn:
+            known = {row['path']: (row['mtime_ns'], row['size'])
+                     for row in conn.execute("SELECT path, mtime_ns, size FROM source_file")}
+
+        stats = {'bras_map': 0, 'maps': 0, 'removed': 0}
+
+        bras_map = config.bras_map_file
+        signature = _signature(bras_map)
+        if signature is not None and known.get(bras_map) != signature:
+            self._import_bras_map(config.load_bras_map(), bras_map, signature)
+            stats['bras_map'] = 1
+
+        map_dir = config.map_file_dir
+        present = set()
+        try:
+            names = sorted(os.listdir(map_dir))
+        except OSError as e:
+            logger.warning(f"無法讀取 Map 目錄 {map_dir}: {e}")
+            names = []
+
+        for name in names:
+            ip = map_file_ip(name)
+            if ip is None:
+                continue
+            path = os.path.join(map_dir, name)
+            signature = _signature(path)
+            if signature is None:
+                continue
+            present.add(path)
+            if known.get(path) == signature:
+                continue
+            try:
+                self._import_map(path, ip, signature, use_cache)
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"匯入 Map 檔案失敗 {path}: {e}")
+                continue
+            stats['maps'] += 1
+
+        for path in known:
+            if path != bras_map and path not in present:
+                self._remove_map(path)
+                stats['removed'] += 1
+
+        if any(stats.values()):
+            logger.info(
+                f"清冊已更新: BRAS-Map {'已' if stats['bras_map'] else '未'}重新匯入, "
+                f"Map {stats['maps']} 個更新, {stats['removed']} 個移除"
+            )
+        return stats
+
+    def _import_bras_map(self, rows: List[Dict], path: str, signature: Tuple[int, int]):
+        """重新匯入 BRAS-Map"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM circuit")
+            conn.executemany(
+                "INSERT INTO circuit (area, device_type, device_ip, circuit_id, slot, port, "
+                "interface_type, bandwidth_max, if_assign, pic) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row['area'], row['device_type'], row['ip'], row['circuit_id'], row['slot'],
+                  row['port'], row['interface_type'], row['bandwidth_max'], row['if_assign'],
+                  row['pic']) for row in rows]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO source_file (path, device_ip, mtime_ns, size) "
+                "VALUES (?, NULL, ?, ?)", (path,) + signature
+            )
+
+    def _import_map(self, path: str, ip: str, signature: Tuple[int, int], use_cache: bool):
+        """重新匯入單一設備的 Map 檔案，保留用戶與介面未變更者的 ifindex"""
+        compiled = load_map(path, use_cache=use_cache)
+
+        with self._connect() as conn:
+            if_indexes = {
+                tuple(row[:5]): row[5] for row in conn.execute(
+                    "SELECT username, slot, port, vpi, vci, if_index FROM subscriber "
+                    "WHERE device_ip = ? AND if_index IS NOT NULL", (ip,)
+                )
+            }
+            conn.execute("DELETE FROM subscriber WHERE device_ip = ?", (ip,))
+            conn.executemany(
+                "INSERT INTO subscriber (username, device_ip, slot, port, vpi, vci, "
+                "download, upload, account, if_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((username, ip, slot, port, vpi, vci, download, upload, account,
+                  if_indexes.get((username, slot, port, vpi, vci)))
+                 for username, slot, port, vpi, vci, download, upload, account in compiled.rows())
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO source_file (path, device_ip, mtime_ns, size) "
+                "VALUES (?, ?, ?, ?)", (path, ip) + signature
+            )
+
+        logger.debug(f"匯入 Map 檔案: {path} ({len(compiled)} 筆)")
+
+    def _remove_map(self, path: str):
+        """移除已刪除的 Map 檔案的用戶"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT device_ip FROM source_file WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and row['device_ip']:
+                conn.execute("DELETE FROM subscriber WHERE device_ip = ?", (row['device_ip'],))
+            conn.execute("DELETE FROM source_file WHERE path = ?", (path,))
+
+    def record_if_indexes(self, device_ip: str, pairs: Iterable[Tuple[str, int]]):
+        """
+        寫回收集器解析的 ifindex
+
+        Args:
+            device_ip: 設備 IP
+            pairs: [(username, if_index), ...]
+        """
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE subscriber SET if_index = ? WHERE device_ip = ? AND username = ?",
+                ((if_index, device_ip, username) for username, if_index in pairs)
+            )
+
+    # 查詢
+
+    def bras_map_rows(self, area: str = None) -> List[Dict]:
+        """
+        BRAS-Map 電路（欄位與 ConfigLoader.load_bras_map() 相同，依檔案順序）
+
+        Args:
+            area: 只取指定區域，None 表示全部
+        """
+        query = (
+            "SELECT area, device_type, device_ip AS ip, circuit_id, slot, port, "
+            "interface_type, bandwidth_max, if_assign, pic FROM circuit"
+        )
+        params: Tuple = ()
+        if area:
+            query += " WHERE area = ?"
+            params = (area,)
+        query += " ORDER BY rowid"
+
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def user_counts(self) -> Dict[str, int]:
+        """各設備的用戶數（只包含已匯入 Map 檔案的設備）"""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT device_ip, COUNT(*) FROM subscriber GROUP BY device_ip"
+            ).fetchall())
+
+    def device_type(self, device_ip: str) -> Optional[int]:
+        """設備在 BRAS-Map 中的 DeviceType，不存在則返回 None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT device_type FROM circuit WHERE device_ip = ? ORDER BY rowid LIMIT 1",
+                (device_ip,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def device_ports(self, device_ip: str) -> Set[Tuple[int, int, int, int]]:
+        """設備上已有用戶的 (slot, port, vpi, vci)"""
+        with self._connect() as conn:
+            return set(tuple(row) for row in conn.execute(
+                "SELECT DISTINCT slot, port, vpi, vci FROM subscriber WHERE device_ip = ?",
+                (device_ip,)
+            ))
+
+    def find_user(self, username: str) -> List[Dict]:
+        """
+        查詢用戶所在的設備、電路與 ifindex
+
+        Returns:
+            符合的紀錄（同一用戶可能出現在多台設備）
+        """
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                _SUBSCRIBER_CIRCUIT + "WHERE s.username = ? ORDER BY s.device_ip, c.circuit_id",
+                (username,)
+            )]
+
+    def circuit_users(self, circuit_id: str) -> List[Dict]:
+        """查詢電路上的所有用戶"""
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT s.username, s.device_ip, c.device_type, c.area, c.circuit_id, "
+                "s.slot, s.port, s.vpi, s.vci, s.download, s.upload, s.account, s.if_index "
+                "FROM circuit c JOIN subscriber s "
+                "  ON s.device_ip = c.device_ip AND s.slot = c.slot AND s.port = c.port "
+                "  AND s.vpi = c.pic "
+                "WHERE c.circuit_id = ? ORDER BY s.device_ip, s.username", (circuit_id,)
+            )]
+
+    def devices(self, area: str = None) -> List[Dict]:
+        """
+        查詢設備（可限定區域）
+
+        Returns:
+            [{'device_ip', 'device_type', 'circuits', 'users'}, ...]
+        """
+        query = (
+            "SELECT c.device_ip, c.device_type, COUNT(DISTINCT c.circuit_id) AS circuits, "
+            "(SELECT COUNT(*) FROM subscriber s WHERE s.device_ip = c.device_ip) AS users "
+            "FROM circuit c"
+        )
+        params: Tuple = ()
+        if area:
+            query += " WHERE c.area = ?"
+            params = (area,)
+        query += " GROUP BY c.device_ip ORDER BY c.device_ip"
+
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def plan_counts(self, device_ip: str = None) -> List[Tuple[int, int, int]]:
+        """
+        依頻寬方案統計用戶數
+
+        Returns:
+            [(download, upload, 用戶數), ...]
+        """
+        query = "SELECT download, upload, COUNT(*) FROM subscriber"
+        params: Tuple = ()
+        if device_ip:
+            query += " WHERE device_ip = ?"
+            params = (device_ip,)
+        query += " GROUP BY download, upload ORDER BY download, upload"
+
+        with self._connect() as conn:
+            return [tuple(row) for row in conn.execute(query, params)]
+
+
+def open_inventory(config) -> Optional[Inventory]:
+    """
+    啟用清冊時（[inventory] enabled）依來源檔案增量更新
+
+    Args:
+        config: 配置載入器或快照
+
+    Returns:
+        已更新的清冊，未啟用則返回 None
+    """
+    if not config.inventory_enabled:
+        return None
+    inventory = Inventory(config.inventory_db)
+    inventory.update(config)
+    return inventory
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    """檔案的 (mtime_ns, size)，不存在則返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    from core.config_loader import ConfigLoader
+
+    parser = argparse.ArgumentParser(description='設備與用戶清冊')
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    parser.add_argument('--update', action='store_true', help='依 BRAS-Map 與 Map 檔案更新清冊')
+    parser.add_argument('--user', help='查詢用戶')
+    parser.add_argument('--circuit', help='查詢電路上的用戶')
+    parser.add_argument('--devices', nargs='?', const='', metavar='AREA',
+                        help='列出設備（可指定區域）')
+    parser.add_argument('--plans', nargs='?', const='', metavar='IP',
+                        help='依頻寬方案統計用戶數（可指定設備）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    config = ConfigLoader(args.config) if args.config else ConfigLoader()
+    inventory = Inventory(config.inventory_db)
+
+    if args.update:
+        print(inventory.update(config))
+
+    def show(rows):
+        for row in rows:
+            print(f"{row['username']}\t{row['device_ip']}\t{row['circuit_id'] or '-'}\t"
+                  f"{row['slot']}_{row['port']}_{row['vpi']}_{row['vci']}\t"
+                  f"{row['download']}_{row['upload']}\tifindex={row['if_index'] or '-'}")
+
+    if args.user:
+        show(inventory.find_user(args.user))
+    if args.circuit:
+        show(inventory.circuit_users(args.circuit))
+    if args.devices is not None:
+        for row in inventory.devices(args.devices or None):
+            print(f"{row['device_ip']}\tType {row['device_type']}\t"
+                  f"電路 {row['circuits']}\t用戶 {row['users']}")
+    if args.plans is not None:
+        for download, upload, count in inventory.plan_counts(args.plans or None):
+            print(f"{download}_{upload}\t{count}")
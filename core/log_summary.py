@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+log_summary.py - 熱路徑日誌彙總
+
+收集迴圈中每位用戶一筆的警告（找不到介面、RRD 更新失敗、Map 格式錯誤等）
+改為依訊息分類計數，只保留前幾個範例，一次收集結束時每類輸出一筆：
+
+    設備 61.64.191.78: 3,412 個介面找不到索引，前 5 個: ge-1/0/2:3490, ...
+
+- add() 只做計數，範例只在名額內才產生（render 延遲呼叫），不格式化字串
+- 內容只有基本型別，可由分片子進程傳回父進程合併
+- 相同的彙總（計數不變）在 repeat_interval 內重複出現時降為 DEBUG，
+  常駐執行時同一份錯誤的 Map 不會每個 step 都輸出警告
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+# 最近輸出的彙總: (logger 名稱, 前綴, 訊息) -> (計數, 時間)
+_recent: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+_recent_lock = threading.Lock()
+
+
+class LogSummary:
+    """依訊息分類的日誌彙總"""
+
+    def __init__(self, logger: logging.Logger, prefix: str = '', exemplars: int = 5,
+                 repeat_interval: float = 3600):
+        """
+        Args:
+            logger: 輸出彙總的 logger
+            prefix: 訊息前綴（例如 "設備 61.64.191.78"）
+            exemplars: 每類保留的範例數
+            repeat_interval: 相同彙總降為 DEBUG 的期間（秒），0 則不降級
+        """
+        self.logger = logger
+        self.prefix = prefix
+        self.exemplars = exemplars
+        self.repeat_interval = repeat_interval
+        # 訊息 -> [level, 計數, 範例]
+        self._entries: Dict[str, List] = {}
+
+    def add(self, message: str, exemplar: Any = None, level: int = logging.WARNING,
+            render: Callable[[Any], str] = None):
+        """
+        記錄一次事件
+
+        Args:
+            message: 分類訊息（例如 "個介面找不到索引"），彙總時接在計數之後
+            exemplar: 範例（名額已滿時忽略）
+            level: 彙總的日誌等級（同一分類取最高者）
+            render: 將範例轉為字串的函式，只在保留範例時呼叫
+        """
+        entry = self._entries.get(message)
+        if entry is None:
+            entry = self._entries[message] = [level, 0, []]
+        elif level > entry[0]:
+            entry[0] = level
+        entry[1] += 1
+        if exemplar is not None and len(entry[2]) < self.exemplars:
+            entry[2].append(render(exemplar) if render else str(exemplar))
+
+    def count(self, message: str) -> int:
+        """取得分類的計數"""
+        entry = self._entries.get(message)
+        return entry[1] if entry else 0
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def take(self) -> Dict[str, List]:
+        """取出並清除目前的彙總內容（分片子進程傳回父進程用）"""
+        entries, self._entries = self._entries, {}
+        return entries
+
+    def merge(self, entries: Dict[str, List]):
+        """合併另一份彙總內容（take() 的結果）"""
+        for message, (level, count, exemplars) in entries.items():
+            entry = self._entries.get(message)
+            if entry is None:
+                entry = self._entries[message] = [level, 0, []]
+            entry[0] = max(entry[0], level)
+            entry[1] += count
+            entry[2].extend(exemplars[:self.exemplars - len(entry[2])])
+
+    def flush(self):
+        """每個分類輸出一筆彙總並清除"""
+        now = time.time()
+        prefix = f"{self.prefix}: " if self.prefix else ''
+        for message, (level, count, exemplars) in self.take().items():
+            text = f"{prefix}{count:,} {message}"
+            if exemplars:
+                text += f"，前 {len(exemplars)} 個: {', '.join(exemplars)}"
+
+            key = (self.logger.name, self.prefix, message)
+            with _recent_lock:
+                previous = _recent.get(key)
+                repeated = (previous is not None and previous[0] == count
+                            and now - previous[1] < self.repeat_interval)
+                if not repeated:
+                    _recent[key] = (count, now)
+            if repeated:
+                self.logger.debug("%s（與上次相同）", text)
+            else:
+                self.logger.log(level, text)
+
+    def __enter__(self) -> 'LogSummary':
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
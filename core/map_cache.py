@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+map_cache.py - Map 檔案編譯快取
+
+將 CSV 格式的 Map 檔案編譯為緊湊的二進位格式（欄位陣列 + 字串表），
+存放於 Map 檔案旁邊，僅在來源檔案變更時重新編譯，載入時使用 mmap。
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+from array import array
+from typing import List, Optional, Tuple
+
+from core.log_summary import LogSummary
+
+logger = logging.getLogger(__name__)
+
+# 快取檔案格式
+#   header: magic | src_mtime_ns | src_size | src_digest | count | users_len | accounts_len
+#   body:   download(q) | upload(q) | slot(i) | port(i) | vpi(i) | vci(i)
+#           | usernames ('\n' 分隔) | accounts ('\n' 分隔)
+CACHE_MAGIC = b'RRDWMAP\x01'
+CACHE_SUFFIX = '.cache'
+_HEADER = struct.Struct('<8sqq16sIII4x')
+
+INT64_COLUMNS = ('download', 'upload')
+INT32_COLUMNS = ('slot', 'port', 'vpi', 'vci')
+_INT32_MAX = 2 ** 31 - 1
+
+
+class CompiledMap:
+    """編譯後的 Map 資料（欄位式儲存）"""
+
+    def __init__(self, usernames: List[str], accounts: List[str], columns: dict,
+                 source: Tuple[int, int, bytes] = (0, 0, b''), buffer=None):
+        """
+        Args:
+            usernames: 用戶名稱列表
+            accounts: 帳號列表
+            columns: 欄位名稱 -> 整數序列（array 或 memoryview）
+            source: (mtime_ns, size, digest) 來源檔案識別
+            buffer: 底層 mmap，需在資料使用期間保持開啟
+        """
+        self.usernames = usernames
+        self.accounts = accounts
+        self.columns = columns
+        self.source = source
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def rows(self):
+        """逐筆產生 (username, slot, port, vpi, vci, download, upload, account)"""
+        c = self.columns
+        return zip(self.usernames, c['slot'], c['port'], c['vpi'], c['vci'],
+                   c['download'], c['upload'], self.accounts)
+
+
+def _file_digest(data: bytes) -> bytes:
+    """計算來源內容摘要"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _render_line(exemplar: Tuple[int, str]) -> str:
+    """彙總範例: 第 N 行 內容"""
+    line_num, content = exemplar
+    return f"第 {line_num} 行 {content}"
+
+
+def parse_map_text(text: str, name: str = '') -> CompiledMap:
+    """
+    解析 Map 檔案內容
+
+    格式: UserID,Slot_Port_VPI_VCI,Download_Upload,AccountID
+    格式錯誤的行依錯誤類型彙總，每類輸出一筆警告
+
+    Args:
+        text: Map 檔案內容
+        name: Map 檔案名稱（用於日誌）
+
+    Returns:
+        編譯後的 Map 資料
+    """
+    usernames = []
+    accounts = []
+    columns = {name: array('q') for name in INT64_COLUMNS}
+    columns.update({name: array('i') for name in INT32_COLUMNS})
+    log = LogSummary(logger, f"Map 檔案 {name}" if name else "Map 檔案")
+
+    for line_num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+
+        # 跳過空行和註解
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            parts = line.split(',')
+            if len(parts) != 4:
+                log.add("行格式錯誤", (line_num, line), render=_render_line)
+                continue
+
+            username, interface, bandwidth, account = [p.strip() for p in parts]
+
+            # 解析介面
+            iface_parts = interface.split('_')
+            if len(iface_parts) != 4:
+                log.add("行介面格式錯誤", (line_num, interface), render=_render_line)
+                continue
+
+            slot, port, vpi, vci = [int(x) for x in iface_parts]
+
+            # 解析頻寬
+            bw_parts = bandwidth.split('_')
+            if len(bw_parts) != 2:
+                log.add("行頻寬格式錯誤", (line_num, bandwidth), render=_render_line)
+                continue
+
+            download, upload = [int(x) for x in bw_parts]
+
+            if not all(0 <= v <= _INT32_MAX for v in (slot, port, vpi, vci)):
+                log.add("行介面數值超出範圍", (line_num, interface), render=_render_line)
+                continue
+
+            # 頻寬可能超出 int64，先寫入 download/upload 再寫入其他欄位
+            columns['download'].append(download)
+            try:
+                columns['upload'].append(upload)
+            except OverflowError:
+                columns['download'].pop()
+                raise
+            columns['slot'].append(slot)
+            columns['port'].append(port)
+            columns['vpi'].append(vpi)
+            columns['vci'].append(vci)
+            usernames.append(username)
+            accounts.append(account)
+
+        except (ValueError, OverflowError) as e:
+            log.add("行解析失敗", (line_num, e), render=_render_line)
+            continue
+
+    log.flush()
+    return CompiledMap(usernames, accounts, columns)
+
+
+def cache_path_for(map_file: str) -> str:
+    """取得 Map 檔案對應的快取檔案路徑"""
+    return map_file + CACHE_SUFFIX
+
+
+def _write_cache(cache_file: str, compiled: CompiledMap) -> bool:
+    """
+    以原子方式寫入快取檔案
+
+    Returns:
+        是否成功
+    """
+    mtime_ns, size, digest = compiled.source
+    users_blob = '\n'.join(compiled.usernames).encode('utf-8')
+    accounts_blob = '\n'.join(compiled.accounts).encode('utf-8')
+
+    header = _HEADER.pack(CACHE_MAGIC, mtime_ns, size, digest,
+                          len(compiled), len(users_blob), len(accounts_blob))
+
+    cache_dir = os.path.dirname(os.path.abspath(cache_file))
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.map_cache_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                for name in INT64_COLUMNS + INT32_COLUMNS:
+                    f.write(compiled.columns[name].tobytes())
+                f.write(users_blob)
+                f.write(accounts_blob)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.debug(f"寫入 Map 快取: {cache_file}")
+        return True
+    except OSError as e:
+        logger.debug(f"無法寫入 Map 快取 {cache_file}: {e}")
+        return False
+
+
+def _touch_cache(cache_file: str, mtime_ns: int, size: int):
+    """來源內容未變（僅 mtime 變更）時，更新快取標頭中的來源時間"""
+    try:
+        with open(cache_file, 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<qq', mtime_ns, size))
+    except OSError as e:
+        logger.debug(f"無法更新 Map 快取標頭 {cache_file}: {e}")
+
+
+def _read_cache_header(cache_file: str) -> Optional[tuple]:
+    """讀取快取標頭，格式不符則返回 None"""
+    try:
+        with open(cache_file, 'rb') as f:
+            raw = f.read(_HEADER.size)
+    except OSError:
+        return None
+
+    if len(raw) != _HEADER.size:
+        return None
+
+    header = _HEADER.unpack(raw)
+    if header[0] != CACHE_MAGIC:
+        return None
+    return header
+
+
+def cached_user_count(map_file: str) -> Optional[int]:
+    """
+    由快取標頭取得 Map 用戶數（不載入資料）
+
+    Returns:
+        用戶數，快取不存在或已過期則返回 None
+    """
+    try:
+        st = os.stat(map_file)
+    except OSError:
+        return None
+
+    header = _read_cache_header(cache_path_for(map_file))
+    if header is None or header[1] != st.st_mtime_ns or header[2] != st.st_size:
+        return None
+    return header[4]
+
+
+def _mmap_cache(cache_file: str) -> Optional[CompiledMap]:
+    """
+    以 mmap 載入快取檔案
+
+    整數欄位直接以 memoryview 映射，不複製資料
+
+    Returns:
+        編譯後的 Map 資料，失敗則返回 None
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        logger.debug(f"無法映射 Map 快取 {cache_file}: {e}")
+        return None
+
+    _, mtime_ns, size, digest, count, users_len, accounts_len = \
+        _HEADER.unpack_from(mm, 0)
+
+    expected = (_HEADER.size + count * (8 * len(INT64_COLUMNS) + 4 * len(INT32_COLUMNS))
+                + users_len + accounts_len)
+    if len(mm) != expected:
+        logger.warning(f"Map 快取長度不符，將重新編譯: {cache_file}")
+        mm.close()
+        return None
+
+    view = memoryview(mm)
+    offset = _HEADER.size
+    columns = {}
+    for name in INT64_COLUMNS:
+        columns[name] = view[offset:offset + 8 * count].cast('q')
+        offset += 8 * count
+    for name in INT32_COLUMNS:
+        columns[name] = view[offset:offset + 4 * count].cast('i')
+        offset += 4 * count
+
+    users_text = mm[offset:offset + users_len].decode('utf-8')
+    offset += users_len
+    accounts_text = mm[offset:offset + accounts_len].decode('utf-8')
+
+    usernames = users_text.split('\n') if count else []
+    accounts = accounts_text.split('\n') if count else []
+
+    return CompiledMap(usernames, accounts, columns,
+                       source=(mtime_ns, size, digest), buffer=mm)
+
+
+def load_map(map_file: str, use_cache: bool = True) -> CompiledMap:
+    """
+    載入 Map 檔案，優先使用編譯快取
+
+    快取依來源檔案的 mtime 與大小判斷是否有效；若 mtime 變更但內容摘要
+    相同（例如每日重新產生的相同檔案），僅更新快取標頭而不重新編譯。
+
+    Args:
+        map_file: Map 檔案路徑
+        use_cache: 是否使用編譯快取
+
+    Returns:
+        編譯後的 Map 資料
+
+    Raises:
+        FileNotFoundError: Map 檔案不存在
+    """
+    st = os.stat(map_file)
+    cache_file = cache_path_for(map_file)
+
+    if use_cache:
+        header = _read_cache_header(cache_file)
+        if header is not None and header[1] == st.st_mtime_ns and header[2] == st.st_size:
+            compiled = _mmap_cache(cache_file)
+            if compiled is not None:
+                logger.debug(f"使用 Map 快取: {cache_file}")
+                return compiled
+
+    with open(map_file, 'rb') as f:
+        data = f.read()
+    digest = _file_digest(data)
+
+    if use_cache and header is not None and header[3] == digest:
+        _touch_cache(cache_file, st.st_mtime_ns, st.st_size)
+        compiled = _mmap_cache(cache_file)
+        if compiled is not None:
+            logger.debug(f"Map 內容未變更，沿用快取: {cache_file}")
+            return compiled
+
+    compiled = parse_map_text(data.decode('utf-8'), map_file)
+    compiled.source = (st.st_mtime_ns, st.st_size, digest)
+
+    if use_cache:
+        logger.info(f"編譯 Map 快取: {cache_file} ({len(compiled)} 筆)")
+        _write_cache(cache_file, compiled)
+
+    return compiled
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+openmetrics.py - OpenMetrics 指標輸出
+
+調度器在每台設備收集完成時（以及預檢、排程時）更新 MetricsRegistry，
+輸出方式有兩種：
+
+- 文字檔：write_textfile() 以暫存檔 + rename 原子更新，
+  供 node_exporter 的 textfile collector 讀取（[monitoring] metrics_textfile）
+- HTTP：常駐程式以 start_http_server() 提供 GET /metrics
+  （[monitoring] metrics_http_port）
+
+收集迴圈內只更新各收集器自己的 MetricSet（見 core.run_metrics），
+每台設備每次收集結束才合併進本模組的 registry 一次，熱路徑不經過共用的鎖。
+"""
+
+import os
+import tempfile
+import threading
+import logging
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from core.run_metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+PREFIX = 'rrdw'
+
+# 指標定義: 名稱 -> (類型, 說明)；counter 的樣本名稱另加 _total
+FAMILIES: Dict[str, Tuple[str, str]] = {
+    'device_up': ('gauge', '最近一次收集是否成功'),
+    'device_poll_duration_seconds': ('gauge', '最近一次收集耗時'),
+    'device_success_ratio': ('gauge', '最近一次收集的成功率 (0-1)'),
+    'device_users': ('gauge', '最近一次收集的用戶數（依狀態）'),
+    'device_last_run_timestamp_seconds': ('gauge', '最近一次收集完成時間'),
+    'device_phase_seconds': ('gauge', '最近一次收集各階段耗時'),
+    'device_polls': ('counter', '收集次數（依結果）'),
+    'snmp_pdus_sent': ('counter', '送出的 SNMP PDU 數'),
+    'snmp_bytes_received': ('counter', 'snmpwalk 接收的位元組數'),
+    'snmp_retries': ('counter', 'SNMP GET 重試次數'),
+    'snmp_errors': ('counter', 'SNMP 查詢錯誤數'),
+    'rrd_created': ('counter', '建立的 RRD 檔案數'),
+    'rrd_updated': ('counter', '更新的 RRD 數'),
+    'rrd_failed': ('counter', 'RRD 建立或更新失敗數'),
+    'snmp_rtt_seconds': ('histogram', 'SNMP GET 回應時間（預檢與收集器）'),
+    'rrd_write_seconds': ('histogram', '單次 RRD 更新延遲'),
+    'dispatch_queue_depth': ('gauge', '調度佇列深度（pending: 等待執行，running: 執行中）'),
+    'dispatch_duration_seconds': ('gauge', '最近一次調度全部設備的耗時'),
+    'scheduler_lag_seconds': ('gauge', '設備實際開始收集與排定取樣時間的差距'),
+}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsRegistry:
+    """
+    指標登錄表
+
+    每個指標以 (名稱, 標籤) 為鍵保存目前的值；更新頻率為每台設備每次收集
+    一次，以單一鎖保護即可
+    """
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # 名稱 -> {排序後的標籤: 值（histogram 為 LatencyHistogram）}
+        self._samples: Dict[str, Dict[Tuple[Tuple[str, str], ...], object]] = {}
+
+    def _series(self, name: str, labels: Dict[str, object]):
+        if name not in FAMILIES:
+            raise KeyError(f"未定義的指標: {name}")
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        return self._samples.setdefault(name, {}), key
+
+    def set(self, name: str, value: float, **labels):
+        """設定 gauge"""
+        with self._lock:
+            series, key = self._series(name, labels)
+            series[key] = value
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        """累加 counter"""
+        with self._lock:
+            series, key = self._series(name, labels)
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        """記錄一次 histogram 樣本"""
+        with self._lock:
+            series, key = self._series(name, labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def merge_histogram(self, name: str, histogram: LatencyHistogram, **labels):
+        """合併一個直方圖（收集器每次收集的 MetricSet）"""
+        with self._lock:
+            series, key = self._series(name, labels)
+            mine = series.get(key)
+            if mine is None:
+                mine = series[key] = LatencyHistogram(histogram.bounds)
+            mine.merge(histogram)
+
+    def discard(self, names: Sequence[str] = None, **labels):
+        """
+        移除帶有指定標籤的序列
+
+        Args:
+            names: 只處理這些指標，None 則為全部
+            labels: 序列須包含的標籤
+        """
+        match = set((k, str(v)) for k, v in labels.items())
+        with self._lock:
+            for name, series in self._samples.items():
+                if names is not None and name not in names:
+                    continue
+                for key in [key for key in series if match <= set(key)]:
+                    del series[key]
+
+    def retain(self, label: str, values: Iterable):
+        """
+        只保留標籤值在 values 中的序列（沒有該標籤的序列不受影響），
+        例如移除已不在 BRAS-Map 或已由其他節點負責的設備
+        """
+        keep = set(str(v) for v in values)
+        with self._lock:
+            for series in self._samples.values():
+                for key in list(series):
+                    value = dict(key).get(label)
+                    if value is not None and value not in keep:
+                        del series[key]
+
+    def render(self) -> str:
+        """輸出 OpenMetrics 文字格式"""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text) in FAMILIES.items():
+                series = self._samples.get(name)
+                if not series:
+                    continue
+                family = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {family} {kind}")
+                lines.append(f"# HELP {family} {_escape(help_text)}")
+                for labels, value in sorted(series.items()):
+                    if kind == 'counter':
+                        lines.append(f"{family}_total{_format_labels(labels)} {value}")
+                    elif kind == 'histogram':
+                        lines.extend(self._render_histogram(family, labels, value))
+                    else:
+                        lines.append(f"{family}{_format_labels(labels)} {_format_value(value)}")
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(family: str, labels, histogram: LatencyHistogram) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            le = _format_labels(labels, f'le="{bound!r}"')
+            lines.append(f"{family}_bucket{le} {cumulative}")
+        cumulative += histogram.counts[-1]
+        inf = _format_labels(labels, 'le="+Inf"')
+        lines.append(f"{family}_bucket{inf} {cumulative}")
+        lines.append(f"{family}_count{_format_labels(labels)} {cumulative}")
+        lines.append(f"{family}_sum{_format_labels(labels)} {histogram.sum!r}")
+        return lines
+
+
+def write_textfile(registry: MetricsRegistry, path: str):
+    """
+    原子更新 node_exporter textfile collector 讀取的指標檔案
+
+    Args:
+        registry: 指標登錄表
+        path: 輸出檔案（node_exporter 只讀取 *.prom）
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.rrdw-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def start_http_server(registry: MetricsRegistry, port: int, host: str = '127.0.0.1'):
+    """
+    於背景執行緒提供 HTTP /metrics
+
+    Args:
+        registry: 指標登錄表
+        port: 監聽埠
+        host: 監聽位址
+
+    Returns:
+        HTTP 伺服器（停止時呼叫 shutdown() 與 server_close()）
+    """
+    # http.server 只有常駐程式需要，不在載入本模組時匯入
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """GET /metrics"""
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("metrics %s - %s", self.address_string(), format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"OpenMetrics 端點: http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+radius_source.py - 由 RADIUS 資料庫直接載入用戶
+
+取代每日產生 Map 文字檔再解析的流程：收集器直接從 RADIUS 資料庫
+串流讀取設備的用戶（用戶 → 介面 → 頻寬方案），填入 UserTable。
+
+- MySQL 使用 server-side cursor（pymysql SSCursor），以 fetchmany 分批讀取，
+  不需將整個結果集載入記憶體
+- 以 (用戶數, MAX(updated_at)) 作為變更水位，未變更時不重新載入；
+  水位改變時重新載入該設備的所有用戶（沒有逐列的差異查詢），再由
+  UserTable.adopt() 與已載入的用戶比對，介面未變更者沿用 ifindex
+- 水位依賴資料庫於更新時設定 updated_at（MySQL 可用
+  ON UPDATE CURRENT_TIMESTAMP）；只更新其他欄位而不更新 updated_at 時不會偵測到
+- driver = sqlite 時連線本機 SQLite（開發與測試用，欄位相同）
+
+資料表（或檢視表，名稱由 [database] map_table 設定）欄位:
+    username, device_ip, slot, port, vpi, vci, download, upload, account, updated_at
+建議在 (device_ip, updated_at) 建立索引，水位查詢才不需掃描整個資料表。
+"""
+
+import os
+import re
+import sqlite3
+import logging
+from array import array
+from typing import Callable, Dict, Tuple
+
+from core.user_table import INT_COLUMNS, StringPool, UserTable
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+_INT32_MAX = 2 ** 31 - 1
+_INT64_MAX = 2 ** 63 - 1
+
+_COLUMNS = 'username, slot, port, vpi, vci, download, upload, account'
+
+
+class RadiusMapSource:
+    """RADIUS 資料庫用戶來源"""
+
+    def __init__(self, config):
+        """
+        Args:
+            config: 配置載入器或快照（[database] 區段）
+        """
+        self.config = config
+        self.driver = config.database_driver
+        self.table = config.database_map_table
+        self.chunk_size = max(1, config.database_chunk_size)
+
+        if self.driver not in ('mysql', 'sqlite'):
+            raise ValueError(f"不支援的資料庫 driver: {self.driver}")
+        if not _IDENTIFIER.match(self.table):
+            raise ValueError(f"map_table 名稱不合法: {self.table}")
+        # pymysql 為選用套件（driver = mysql 時需要），使用時才載入
+        self._pymysql = None
+        if self.driver == 'mysql':
+            try:
+                import pymysql.cursors
+            except ImportError:
+                raise ImportError("driver = mysql 需要安裝 pymysql")
+            self._pymysql = pymysql
+
+        self._param = '%s' if self.driver == 'mysql' else '?'
+
+    def connect(self):
+        """建立資料庫連線"""
+        if self.driver == 'sqlite':
+            return sqlite3.connect(self.config.database_path, timeout=30)
+
+        return self._pymysql.connect(
+            host=self.config.database_host,
+            port=self.config.database_port,
+            user=self.config.database_user,
+            password=self.config.database_password,
+            database=self.config.database_name,
+            charset='utf8mb4',
+            connect_timeout=10,
+        )
+
+    def _cursor(self, conn):
+        """建立串流 cursor（MySQL 使用 server-side cursor）"""
+        if self.driver == 'mysql':
+            return conn.cursor(self._pymysql.cursors.SSCursor)
+        return conn.cursor()
+
+    def watermark(self, device_ip: str) -> Tuple:
+        """
+        取得設備用戶的變更水位
+
+        新增、刪除或更新用戶都會改變 (用戶數, MAX(updated_at))
+
+        Returns:
+            (用戶數, 最後更新時間)
+        """
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT COUNT(*), MAX(updated_at) FROM {self.table} "
+                f"WHERE device_ip = {self._param}", (device_ip,)
+            )
+            return tuple(cursor.fetchone())
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """各設備用戶數（調度器預估耗時用）"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT device_ip, COUNT(*) FROM {self.table} GROUP BY device_ip")
+            return {ip: count for ip, count in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def load(self, device_ip: str, namer: Callable = None) -> UserTable:
+        """
+        串流載入設備的所有用戶
+
+        Args:
+            device_ip: 設備 IP
+            namer: 介面名稱產生函式
+
+        Returns:
+            用戶資料表
+        """
+        usernames = []
+        accounts = StringPool()
+        account_ids = array('I')
+        columns = {name: array(code) for name, code in INT_COLUMNS.items()}
+        slot, port, vpi, vci = (columns[name] for name in ('slot', 'port', 'vpi', 'vci'))
+        download, upload = columns['download'], columns['upload']
+        intern = accounts.intern
+        invalid = 0
+
+        conn = self.connect()
+        try:
+            cursor = self._cursor(conn)
+            cursor.execute(
+                f"SELECT {_COLUMNS} FROM {self.table} WHERE device_ip = {self._param}",
+                (device_ip,)
+            )
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for username, *values, account in rows:
+                    try:
+                        s, p, vp, vc, down, up = map(int, values)
+                    except (TypeError, ValueError):
+                        invalid += 1
+                        continue
+                    if (username is None
+                            or not all(0 <= v <= _INT32_MAX for v in (s, p, vp, vc))
+                            or not all(0 <= v <= _INT64_MAX for v in (down, up))):
+                        invalid += 1
+                        continue
+                    usernames.append(username)
+                    account_ids.append(intern(account or ''))
+                    slot.append(s)
+                    port.append(p)
+                    vpi.append(vp)
+                    vci.append(vc)
+                    download.append(down)
+                    upload.append(up)
+            cursor.close()
+        finally:
+            conn.close()
+
+        if invalid:
+            logger.warning(f"設備 {device_ip} 有 {invalid} 筆資料庫用戶資料不完整或超出範圍，已略過")
+
+        logger.info(f"由資料庫載入設備 {device_ip} 的 {len(usernames)} 筆用戶資料")
+        return UserTable(usernames, accounts, account_ids, columns, namer=namer)
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    from core.config_loader import ConfigLoader
+
+    parser = argparse.ArgumentParser(description='由 RADIUS 資料庫載入用戶')
+    parser.add_argument('ip', nargs='?', help='設備 IP（未指定則列出各設備用戶數）')
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    config = ConfigLoader(args.config) if args.config else ConfigLoader()
+    source = RadiusMapSource(config)
+
+    if args.ip:
+        print(f"水位: {source.watermark(args.ip)}")
+        users = source.load(args.ip)
+        for user in list(users)[:10]:
+            print(f"{user.username}\t{user.slot}_{user.port}_{user.vpi}_{user.vci}\t"
+                  f"{user.download}_{user.upload}\t{user.account}")
+    else:
+        for ip, count in sorted(source.counts().items()):
+            print(f"{ip}\t{count}")
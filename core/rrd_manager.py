@@ -12,6 +12,8 @@ import subprocess
 from typing import Optional, List
 from pathlib import Path
 
+from core.run_metrics import MetricSet
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,10 +43,16 @@ class RRDManager:
         for directory in [self.user_dir, self.sum_dir, self.sum2m_dir, self.circuit_dir]:
             os.makedirs(directory, exist_ok=True)
         
+        # 最近一次建立/更新失敗的原因（quiet 模式下由呼叫端彙總輸出）
+        self.last_error = ''
+        
+        # 建立/更新/失敗數與每次更新的延遲，由收集器每次收集取出（metrics.take()）
+        self.metrics = MetricSet()
+        
         logger.debug(f"RRD Manager 初始化: {base_dir}")
     
     def _create_rrd(self, rrd_path: str, ds_definitions: List[str], 
-                   rra_definitions: List[str] = None) -> bool:
+                   rra_definitions: List[str] = None, quiet: bool = False) -> bool:
         """
         建立 RRD 檔案
         
@@ -52,6 +60,7 @@ class RRDManager:
             rrd_path: RRD 檔案路徑
             ds_definitions: DS 定義列表
             rra_definitions: RRA 定義列表，None 則使用預設
+            quiet: 只以 DEBUG 記錄（失敗原因存於 last_error）
         
         Returns:
             是否成功
@@ -81,16 +90,16 @@ class RRDManager:
         
         try:
             subprocess.run(cmd, check=True, capture_output=True, text=True)
-            logger.info(f"建立 RRD: {rrd_path}")
+            self.metrics.count('rrd_created')
+            logger.log(logging.DEBUG if quiet else logging.INFO, "建立 RRD: %s", rrd_path)
             return True
         except subprocess.CalledProcessError as e:
-            logger.error(f"建立 RRD 失敗: {e.stderr}")
-            return False
+            return self._fail(f"建立 RRD 失敗: {e.stderr.strip()}", quiet)
         except Exception as e:
-            logger.error(f"建立 RRD 異常: {e}")
-            return False
+            return self._fail(f"建立 RRD 異常: {e}", quiet)
     
-    def _update_rrd(self, rrd_path: str, values: str, timestamp: int = None) -> bool:
+    def _update_rrd(self, rrd_path: str, values: str, timestamp: int = None,
+                    quiet: bool = False) -> bool:
         """
         更新 RRD 檔案
         
@@ -98,13 +107,13 @@ class RRDManager:
             rrd_path: RRD 檔案路徑
             values: 更新值字串（例如: "N:1234:5678"）
             timestamp: 時間戳記，None 則使用 N
+            quiet: 只以 DEBUG 記錄（失敗原因存於 last_error）
         
         Returns:
             是否成功
         """
         if not os.path.exists(rrd_path):
-            logger.error(f"RRD 檔案不存在: {rrd_path}")
-            return False
+            return self._fail(f"RRD 檔案不存在: {rrd_path}", quiet)
         
         if timestamp is None:
             update_str = f"N:{values}"
@@ -113,24 +122,33 @@ class RRDManager:
         
         try:
             cmd = ['rrdtool', 'update', rrd_path, update_str]
+            started = time.perf_counter()
             subprocess.run(cmd, check=True, capture_output=True, text=True)
-            logger.debug(f"更新 RRD: {os.path.basename(rrd_path)} = {update_str}")
+            self.metrics.observe('rrd_write_seconds', time.perf_counter() - started)
+            self.metrics.count('rrd_updated')
+            logger.debug("更新 RRD: %s = %s", os.path.basename(rrd_path), update_str)
             return True
         except subprocess.CalledProcessError as e:
-            logger.error(f"更新 RRD 失敗: {e.stderr}")
-            return False
+            return self._fail(f"更新 RRD 失敗: {e.stderr.strip()}", quiet)
         except Exception as e:
-            logger.error(f"更新 RRD 異常: {e}")
-            return False
+            return self._fail(f"更新 RRD 異常: {e}", quiet)
+    
+    def _fail(self, message: str, quiet: bool) -> bool:
+        """記錄失敗原因，quiet 時只以 DEBUG 輸出"""
+        self.last_error = message
+        self.metrics.count('rrd_failed')
+        logger.log(logging.DEBUG if quiet else logging.ERROR, message)
+        return False
     
     # Layer 1: User Layer
     
-    def create_user_rrd(self, username: str) -> bool:
+    def create_user_rrd(self, username: str, quiet: bool = False) -> bool:
         """
         建立用戶 RRD 檔案
         
         Args:
             username: 用戶名稱
+            quiet: 只以 DEBUG 記錄（失敗原因存於 last_error）
         
         Returns:
             是否成功
@@ -142,10 +160,10 @@ class RRDManager:
             f'DS:outbound:COUNTER:{self.heartbeat}:0:U',
         ]
         
-        return self._create_rrd(rrd_path, ds_definitions)
+        return self._create_rrd(rrd_path, ds_definitions, quiet=quiet)
     
     def update_user_rrd(self, username: str, inbound: int, outbound: int, 
-                       timestamp: int = None) -> bool:
+                       timestamp: int = None, quiet: bool = False) -> bool:
         """
         更新用戶 RRD
         
@@ -154,6 +172,7 @@ class RRDManager:
             inbound: 入站流量（bytes）
             outbound: 出站流量（bytes）
             timestamp: 時間戳記
+            quiet: 只以 DEBUG 記錄（收集迴圈中由呼叫端彙總失敗）
         
         Returns:
             是否成功
@@ -162,9 +181,9 @@ class RRDManager:
         
         # 確保 RRD 存在
         if not os.path.exists(rrd_path):
-            self.create_user_rrd(username)
+            self.create_user_rrd(username, quiet)
         
-        return self._update_rrd(rrd_path, f"{inbound}:{outbound}", timestamp)
+        return self._update_rrd(rrd_path, f"{inbound}:{outbound}", timestamp, quiet)
     
     # Layer 2: Sum Layer
     
@@ -293,16 +312,18 @@ class RRDManager:
         rrd_filename = f"{circuit_id}.rrd"
         rrd_path = os.path.join(self.circuit_dir, rrd_filename)
         
+        # 電路由各用戶速率加總（位元組/秒），用戶加入或離開時計數器總和會跳動，
+        # 因此不使用 COUNTER
         ds_definitions = [
-            f'DS:inbound:COUNTER:{self.heartbeat}:0:U',
-            f'DS:outbound:COUNTER:{self.heartbeat}:0:U',
+            f'DS:inbound:GAUGE:{self.heartbeat}:0:U',
+            f'DS:outbound:GAUGE:{self.heartbeat}:0:U',
             f'DS:device_count:GAUGE:{self.heartbeat}:0:U',
             f'DS:user_count:GAUGE:{self.heartbeat}:0:U',
         ]
         
         return self._create_rrd(rrd_path, ds_definitions)
     
-    def update_circuit_rrd(self, circuit_id: str, inbound: int, outbound: int,
+    def update_circuit_rrd(self, circuit_id: str, inbound: float, outbound: float,
                           device_count: int, user_count: int,
                           timestamp: int = None) -> bool:
         """
@@ -310,8 +331,8 @@ class RRDManager:
         
         Args:
             circuit_id: 電路 ID
-            inbound: 入站流量總和
-            outbound: 出站流量總和
+            inbound: 入站速率總和（位元組/秒）
+            outbound: 出站速率總和（位元組/秒）
             device_count: 設備數量
             user_count: 用戶數量
             timestamp: 時間戳記
@@ -326,7 +347,7 @@ class RRDManager:
         if not os.path.exists(rrd_path):
             self.create_circuit_rrd(circuit_id)
         
-        values = f"{inbound}:{outbound}:{device_count}:{user_count}"
+        values = f"{inbound:.2f}:{outbound:.2f}:{device_count}:{user_count}"
         return self._update_rrd(rrd_path, values, timestamp)
     
     def get_rrd_info(self, rrd_path: str) -> Optional[dict]:
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+rtt_estimator.py - 各設備 SNMP 逾時自動調整
+
+依 TCP RTO（RFC 6298）的方式，以各設備觀察到的 SNMP 回應時間估算
+平滑 RTT（SRTT）與變異（RTTVAR），逾時設為 SRTT + 4 * RTTVAR，
+並限制在 [min_timeout, max_timeout]。狀態存於本機 SQLite，跨執行保存。
+
+- 只採用第一次送出即成功的樣本（Karn 演算法，重送後的樣本不明確）
+- 逾時時將倍數加倍（指數退避），下一個有效樣本重設
+"""
+
+import os
+import sqlite3
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_rtt (
+    ip      TEXT PRIMARY KEY,
+    srtt    REAL    NOT NULL,
+    rttvar  REAL    NOT NULL,
+    backoff INTEGER NOT NULL DEFAULT 1
+);
+"""
+
+
+class RttEstimator:
+    """各設備 RTT 估算（SQLite，多進程共用）"""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    # 時鐘粒度（秒），RTTVAR 極小時的下限
+    GRANULARITY = 0.01
+    MAX_BACKOFF = 64
+
+    def __init__(self, db_path: str, min_timeout: float = 1.0, max_timeout: float = 30.0):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+            min_timeout: 逾時下限（秒）
+            max_timeout: 逾時上限（秒）
+        """
+        self.db_path = db_path
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每次操作使用獨立連線，可跨進程與執行緒使用"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def state(self, ip: str) -> Optional[Tuple[float, float, int]]:
+        """取得設備的 (SRTT, RTTVAR, 退避倍數)，沒有樣本則返回 None"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT srtt, rttvar, backoff FROM device_rtt WHERE ip = ?", (ip,)
+            ).fetchone()
+
+    def sample(self, ip: str, rtt: float):
+        """
+        加入一個 RTT 樣本（第一次送出即成功者）
+
+        Args:
+            ip: 設備 IP
+            rtt: 回應時間（秒）
+        """
+        self.sample_many({ip: rtt})
+
+    def sample_many(self, samples: Dict[str, float]):
+        """加入多台設備的 RTT 樣本"""
+        if not samples:
+            return
+
+        with self._connect() as conn:
+            current = {}
+            for ip in samples:
+                row = conn.execute(
+                    "SELECT srtt, rttvar FROM device_rtt WHERE ip = ?", (ip,)
+                ).fetchone()
+                if row is not None:
+                    current[ip] = row
+
+            rows = []
+            for ip, rtt in samples.items():
+                previous = current.get(ip)
+                if previous is None:
+                    srtt, rttvar = rtt, rtt / 2
+                else:
+                    srtt, rttvar = previous
+                    rttvar = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+                    srtt = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+                rows.append((ip, srtt, rttvar))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO device_rtt (ip, srtt, rttvar, backoff) VALUES (?, ?, ?, 1)",
+                rows
+            )
+
+    def backoff(self, ip: str):
+        """發生逾時：退避倍數加倍（沒有樣本的設備不處理）"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE device_rtt SET backoff = MIN(backoff * 2, ?) WHERE ip = ?",
+                (self.MAX_BACKOFF, ip)
+            )
+
+    def timeout(self, ip: str, default: float) -> float:
+        """
+        取得設備的逾時
+
+        Args:
+            ip: 設備 IP
+            default: 沒有樣本時使用的固定逾時
+
+        Returns:
+            逾時（秒）
+        """
+        state = self.state(ip)
+        if state is None:
+            return default
+
+        srtt, rttvar, backoff = state
+        rto = (srtt + max(self.GRANULARITY, self.K * rttvar)) * backoff
+        return min(max(rto, self.min_timeout), self.max_timeout)
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    from core.config_loader import ConfigLoader
+
+    parser = argparse.ArgumentParser(description='各設備 SNMP RTT 與逾時')
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    args = parser.parse_args()
+
+    config = ConfigLoader(args.config) if args.config else ConfigLoader()
+    estimator = RttEstimator(config.rtt_db, config.snmp_min_timeout, config.snmp_max_timeout)
+
+    with estimator._connect() as conn:
+        rows = conn.execute("SELECT ip, srtt, rttvar, backoff FROM device_rtt ORDER BY ip").fetchall()
+    for ip, srtt, rttvar, backoff in rows:
+        print(f"{ip}\tSRTT={srtt * 1000:.1f}ms\tRTTVAR={rttvar * 1000:.1f}ms\t"
+              f"x{backoff}\ttimeout={estimator.timeout(ip, 0):.2f}s")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+run_metrics.py - 收集過程的計數器、延遲直方圖與執行紀錄
+
+SNMPHelper 與 RRDManager 各自持有一個 MetricSet（PDU 數、接收位元組、
+重試、RRD 建立/更新數、每次寫入的延遲），收集器在每次收集結束時取出
+合併至 CollectionStats，連同各階段耗時輸出為一筆 JSON 紀錄：
+
+    {"device": "61.64.191.78", "phases": {"map_load": 0.41, "walk_out": 38.2, ...},
+     "counters": {"snmp_pdus_sent": 98211, "rrd_updated": 97990, ...},
+     "histograms": {"rrd_write_seconds": {"count": 97990, "p50": 0.002, ...}}}
+
+紀錄以 JSON Lines 附加於 [monitoring] run_log，每次收集一行。
+"""
+
+import os
+import json
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+# 預設延遲分桶上限（秒）
+LATENCY_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class LatencyHistogram:
+    """固定分桶的延遲直方圖"""
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BOUNDS):
+        """
+        Args:
+            bounds: 各分桶上限（秒，遞增），超過最後一個上限者計入 +Inf
+        """
+        self.bounds = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float):
+        """記錄一次延遲"""
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    def merge(self, other: 'LatencyHistogram'):
+        """合併另一個相同分桶的直方圖"""
+        if other.bounds != self.bounds:
+            raise ValueError("直方圖分桶不同，無法合併")
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        估算分位數（返回所在分桶的上限）
+
+        Returns:
+            延遲上限（秒）；沒有資料返回 None，落在 +Inf 分桶返回 inf
+        """
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def to_dict(self) -> Dict:
+        """輸出為 JSON 可序列化的字典（分桶為累計數）"""
+        buckets = {}
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            buckets[f"{bound:g}"] = cumulative
+        buckets['+Inf'] = cumulative + self.counts[-1]
+        return {
+            'count': buckets['+Inf'],
+            'sum': round(self.sum, 6),
+            'p50': _bound(self.quantile(0.5)),
+            'p99': _bound(self.quantile(0.99)),
+            'buckets': buckets,
+        }
+
+
+def _bound(value: Optional[float]):
+    """JSON 不支援 inf，以 "+Inf" 表示"""
+    return '+Inf' if value == float('inf') else value
+
+
+class MetricSet:
+    """
+    一組計數器與直方圖
+
+    count() 以鎖保護（兩個 walk 執行緒共用同一個 SNMPHelper），
+    observe() 只由寫入執行緒呼叫；take() 取出目前內容並歸零，
+    供分片子進程傳回與每次收集結算
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        """累加計數器"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        """記錄一次延遲"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def take(self) -> 'MetricSet':
+        """取出目前內容並歸零"""
+        taken = MetricSet()
+        with self._lock:
+            taken.counters, self.counters = self.counters, {}
+            taken.histograms, self.histograms = self.histograms, {}
+        return taken
+
+    def merge(self, other: 'MetricSet'):
+        """合併另一組內容"""
+        with self._lock:
+            for name, n in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for name, histogram in other.histograms.items():
+                mine = self.histograms.get(name)
+                if mine is None:
+                    mine = self.histograms[name] = LatencyHistogram(histogram.bounds)
+                mine.merge(histogram)
+
+    def to_dict(self) -> Dict:
+        return {
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+        }
+
+    def __getstate__(self):
+        # Lock 無法 pickle（分片子進程以 take() 傳回）
+        return {'counters': self.counters, 'histograms': self.histograms}
+
+    def __setstate__(self, state):
+        self.counters = state['counters']
+        self.histograms = state['histograms']
+        self._lock = threading.Lock()
+
+
+def append_run_record(path: str, record: Dict):
+    """
+    將一筆執行紀錄附加於 JSON Lines 檔案
+
+    整行以單次 O_APPEND 寫入，多個收集器子進程同時寫入時不會交錯
+
+    Args:
+        path: 紀錄檔案路徑
+        record: 執行紀錄
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
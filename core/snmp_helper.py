@@ -9,15 +9,28 @@ import time
 import logging
 import subprocess
 import re
-from typing import Dict, Optional, List, Tuple, Set
-from pysnmp.hlapi import (
-    SnmpEngine, CommunityData, UdpTransportTarget, ContextData,
-    ObjectType, ObjectIdentity, getCmd, bulkCmd
-)
+import tempfile
+import threading
+from array import array
+from typing import Dict, Iterator, Optional, List, Tuple, Set
+
+from core.interface_codec import normalize_interface_name
+from core.run_metrics import MetricSet
 
 logger = logging.getLogger(__name__)
 
 
+def _hlapi():
+    """
+    延遲載入 pysnmp.hlapi
+    
+    載入 pysnmp 需要數百毫秒，只有 get() / bulk_walk() 使用；
+    snmpwalk 命令列路徑與不做 SNMP 查詢的程式不需載入
+    """
+    from pysnmp import hlapi
+    return hlapi
+
+
 class SNMPHelper:
     """SNMP 輔助工具類別"""
     
@@ -29,8 +42,11 @@ class SNMPHelper:
     OID_IF_HC_IN_OCTETS = '1.3.6.1.2.1.31.1.1.1.6'
     OID_IF_HC_OUT_OCTETS = '1.3.6.1.2.1.31.1.1.1.10'
     
+    # snmpwalk -On 計數器輸出行: .{oid}.{ifindex} = Counter64: {value}
+    _COUNTER_LINE = re.compile(r'^\s*\.?[\d.]*\.(\d+)\s*=\s*(?:\w+:\s*)?(\d+)\s*$', re.M)
+    
     def __init__(self, device_ip: str, community: str = 'public',
-                 timeout: int = 5, retries: int = 2):
+                 timeout: int = 5, retries: int = 2, snmp_version: str = '2c'):
         """
         初始化 SNMP Helper
         
@@ -39,17 +55,41 @@ class SNMPHelper:
             community: SNMP Community
             timeout: 超時時間（秒）
             retries: 重試次數
+            snmp_version: 命令行 snmpwalk 使用的 SNMP 版本
         """
         self.device_ip = device_ip
         self.community = community
         self.timeout = timeout
         self.retries = retries
+        self.snmp_version = snmp_version
+        
+        # 命令行 snmpwalk 每個 PDU 的逾時，None 則與 GET 相同
+        # （GET 逾時可依 RTT 調整，walk 另行指定，見 BaseCollector.walk_timeout）
+        self.walk_timeout: Optional[float] = None
+        
+        # 最近一次第一次送出即成功的 GET 回應時間（秒），供逾時估算
+        self.last_rtt: Optional[float] = None
+        
+        # 因時間預算用盡而中斷的 walk（OID），結果只包含中斷前取得的部分
+        self.truncated_walks: Set[str] = set()
+        
+        # 執行中的 snmpwalk_stream 程序（OID -> 程序），供 cancel_streams() 終止
+        self._streams: Dict[str, subprocess.Popen] = {}
+        self._cancelled_streams: Set[str] = set()
+        self._streams_lock = threading.Lock()
+        
+        # PDU 數、接收位元組、重試等計數與 GET 回應時間，由收集器每次收集取出（metrics.take()）
+        self.metrics = MetricSet()
         
         # 介面快取
         self._interface_cache = {}
         self._cache_timestamp = 0
         self._cache_ttl = 3600  # 快取 1 小時
         
+        # 介面名稱 -> 索引的反向索引（每次更新介面描述時重建）
+        self._name_index: Dict[str, int] = {}
+        self._normalized_index: Dict[Tuple, Optional[int]] = {}
+        
         logger.debug(f"SNMP Helper 初始化: {device_ip} (timeout={timeout}s, retries={retries})")
     
     def get(self, oid: str, max_retries: int = None) -> Optional[any]:
@@ -66,23 +106,30 @@ class SNMPHelper:
         if max_retries is None:
             max_retries = self.retries
         
+        hlapi = _hlapi()
+        self.last_rtt = None
         for attempt in range(max_retries + 1):
+            self.metrics.count('snmp_pdus_sent')
+            if attempt:
+                self.metrics.count('snmp_retries')
             try:
+                sent_at = time.monotonic()
                 errorIndication, errorStatus, errorIndex, varBinds = next(
-                    getCmd(
-                        SnmpEngine(),
-                        CommunityData(self.community, mpModel=1),  # SNMPv2c
-                        UdpTransportTarget((self.device_ip, 161), 
-                                         timeout=self.timeout, 
-                                         retries=0),  # 自己處理重試
-                        ContextData(),
-                        ObjectType(ObjectIdentity(oid))
+                    hlapi.getCmd(
+                        hlapi.SnmpEngine(),
+                        hlapi.CommunityData(self.community, mpModel=1),  # SNMPv2c
+                        hlapi.UdpTransportTarget((self.device_ip, 161), 
+                                                 timeout=self.timeout, 
+                                                 retries=0),  # 自己處理重試
+                        hlapi.ContextData(),
+                        hlapi.ObjectType(hlapi.ObjectIdentity(oid))
                     )
                 )
                 
                 if errorIndication:
+                    self.metrics.count('snmp_errors')
                     if attempt < max_retries:
-                        logger.debug(f"SNMP GET 失敗 (嘗試 {attempt+1}/{max_retries+1}): {errorIndication}")
+                        logger.debug("SNMP GET 失敗 (嘗試 %d/%d): %s", attempt + 1, max_retries + 1, errorIndication)
                         time.sleep(1)
                         continue
                     else:
@@ -93,13 +140,17 @@ class SNMPHelper:
                     logger.error(f"SNMP Error: {errorStatus.prettyPrint()}")
                     return None
                 
-                # 成功取得值
+                # 成功取得值（重試後的回應時間不明確，不記錄）
+                if attempt == 0:
+                    self.last_rtt = time.monotonic() - sent_at
+                    self.metrics.observe('snmp_rtt_seconds', self.last_rtt)
                 for varBind in varBinds:
                     return varBind[1]
                 
             except Exception as e:
+                self.metrics.count('snmp_errors')
                 if attempt < max_retries:
-                    logger.debug(f"SNMP GET 異常 (嘗試 {attempt+1}/{max_retries+1}): {e}")
+                    logger.debug("SNMP GET 異常 (嘗試 %d/%d): %s", attempt + 1, max_retries + 1, e)
                     time.sleep(1)
                     continue
                 else:
@@ -120,17 +171,18 @@ class SNMPHelper:
             OID -> 值的字典
         """
         results = {}
+        hlapi = _hlapi()
         
         try:
-            for (errorIndication, errorStatus, errorIndex, varBinds) in bulkCmd(
-                SnmpEngine(),
-                CommunityData(self.community, mpModel=1),
-                UdpTransportTarget((self.device_ip, 161), 
-                                 timeout=self.timeout, 
-                                 retries=self.retries),
-                ContextData(),
+            for (errorIndication, errorStatus, errorIndex, varBinds) in hlapi.bulkCmd(
+                hlapi.SnmpEngine(),
+                hlapi.CommunityData(self.community, mpModel=1),
+                hlapi.UdpTransportTarget((self.device_ip, 161), 
+                                         timeout=self._walk_timeout(), 
+                                         retries=self.retries),
+                hlapi.ContextData(),
                 0, max_repetitions,  # non-repeaters, max-repetitions
-                ObjectType(ObjectIdentity(oid)),
+                hlapi.ObjectType(hlapi.ObjectIdentity(oid)),
                 lexicographicMode=False
             ):
                 if errorIndication:
@@ -149,10 +201,258 @@ class SNMPHelper:
             logger.debug(f"Bulk Walk 完成: {len(results)} 個結果")
             
         except Exception as e:
+            self.metrics.count('snmp_errors')
             logger.error(f"Bulk Walk 失敗: {e}")
         
+        # 每個 GETBULK 最多取回 max_repetitions 筆，最後一個回應超出子樹
+        self.metrics.count('snmp_pdus_sent', len(results) // max_repetitions + 1)
         return results
     
+    def _count_walk_output(self, output: str):
+        """
+        記錄命令行 snmpwalk 的 PDU 數與接收量
+        
+        snmpwalk 以 GETNEXT 逐筆查詢，每一行輸出一個 PDU，另加走出子樹的最後一個；
+        接收量以輸出位元組數近似
+        """
+        self.metrics.count('snmp_pdus_sent', output.count('\n') + 1)
+        self.metrics.count('snmp_bytes_received', len(output))
+    
+    def _walk_timeout(self) -> float:
+        """命令行 snmpwalk 每個 PDU 的逾時（秒）"""
+        return self.timeout if self.walk_timeout is None else self.walk_timeout
+    
+    def _snmpwalk_command(self, oid: str) -> List[str]:
+        """建立命令行 snmpwalk 參數，使用 -On 輸出數字格式 OID"""
+        return [
+            'snmpwalk',
+            '-v', self.snmp_version,
+            '-c', self.community,
+            '-t', str(self._walk_timeout()),
+            '-r', str(self.retries),
+            '-On',  # 數字格式 OID
+            self.device_ip,
+            oid
+        ]
+    
+    def _snmpwalk_time_limit(self, deadline: float = None) -> float:
+        """
+        命令行 snmpwalk 的整體執行時間上限（秒）
+        
+        Args:
+            deadline: 時間預算截止時間（epoch 秒），None 則不限制
+        """
+        limit = self._walk_timeout() * (self.retries + 1) + 30
+        if deadline is not None:
+            limit = min(limit, max(0.0, deadline - time.time()))
+        return limit
+    
+    def _run_snmpwalk(self, oid: str, deadline: float = None) -> Optional[str]:
+        """
+        執行命令行 snmpwalk 並返回原始輸出
+        
+        Args:
+            oid: 要查詢的 OID
+            deadline: 時間預算截止時間（epoch 秒），None 則不限制
+        
+        Returns:
+            標準輸出內容，失敗則返回 None
+        
+        Raises:
+            subprocess.TimeoutExpired: 執行超時（output 為已取得的部分輸出）
+        """
+        cmd = self._snmpwalk_command(oid)
+        logger.debug(f"執行命令: {' '.join(cmd)}")
+        
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=self._snmpwalk_time_limit(deadline)
+        )
+        
+        self._count_walk_output(result.stdout)
+        if result.returncode != 0:
+            self.metrics.count('snmp_errors')
+            logger.error(f"snmpwalk 執行失敗: {result.stderr}")
+            return None
+        
+        return result.stdout
+    
+    def snmpwalk_columns(self, oid: str, deadline: float = None) -> Tuple[array, array]:
+        """
+        使用命令行 snmpwalk 取得計數器，以排序後的欄位陣列返回
+        
+        不建立逐筆字典，整段輸出以單一正規表示式解析，
+        供 core.counter_join 與用戶資料表做向量化合併
+        
+        Args:
+            oid: 要查詢的 OID（ifHCInOctets / ifHCOutOctets）
+            deadline: 時間預算截止時間（epoch 秒）；超過時中斷 walk，
+                返回已取得的部分並記錄於 truncated_walks
+        
+        Returns:
+            (ifindex 陣列, counter 陣列)，依 ifindex 遞增排序；失敗則為空陣列
+        """
+        logger.info(f"使用 snmpwalk 查詢 {self.device_ip} (timeout={self._walk_timeout()}s)...")
+        start_time = time.time()
+        self.truncated_walks.discard(oid)
+        
+        indexes = array('q')
+        values = array('Q')
+        
+        if deadline is not None and start_time >= deadline:
+            logger.warning(f"時間預算已用盡，略過 snmpwalk {oid}")
+            self.truncated_walks.add(oid)
+            return indexes, values
+        
+        try:
+            output = self._run_snmpwalk(oid, deadline)
+        except subprocess.TimeoutExpired as e:
+            if deadline is None or time.time() < deadline:
+                logger.error(f"snmpwalk 超時（{time.time() - start_time:.1f}秒）")
+                return indexes, values
+            # 時間預算用盡：保留中斷前已輸出的部分
+            output = e.output or ''
+            if isinstance(output, bytes):
+                output = output.decode('utf-8', errors='replace')
+            # 最後一行可能不完整
+            output = output[:output.rfind('\n') + 1]
+            self._count_walk_output(output)
+            self.truncated_walks.add(oid)
+            logger.warning(f"時間預算用盡，中斷 snmpwalk（{time.time() - start_time:.1f}秒）")
+        except Exception as e:
+            logger.error(f"snmpwalk 執行異常（{time.time() - start_time:.1f}秒）: {e}")
+            return indexes, values
+        
+        if output is None:
+            return indexes, values
+        
+        # 格式: .1.3.6.1.2.1.31.1.1.1.10.5933254 = Counter64: 12345678
+        pairs = self._COUNTER_LINE.findall(output)
+        indexes.extend(int(ifindex) for ifindex, _ in pairs)
+        values.extend(int(value) for _, value in pairs)
+        
+        # 單一欄位的 walk 依 OID 順序返回，ifindex 通常已遞增；否則重新排序
+        if any(indexes[i] > indexes[i + 1] for i in range(len(indexes) - 1)):
+            order = sorted(range(len(indexes)), key=indexes.__getitem__)
+            indexes = array('q', [indexes[i] for i in order])
+            values = array('Q', [values[i] for i in order])
+        
+        logger.info(
+            f"✓ snmpwalk 完成: 取得 {len(indexes)} 個介面, "
+            f"耗時 {time.time() - start_time:.1f} 秒"
+        )
+        return indexes, values
+    
+    def snmpwalk_stream(self, oid: str, batch_size: int = 500, deadline: float = None
+                        ) -> Iterator[List[Tuple[int, int]]]:
+        """
+        使用命令行 snmpwalk 取得計數器，邊接收邊分批產生結果
+        
+        snmpwalk 以 GETNEXT 逐筆查詢，每收到一個回應就輸出對應行，
+        因此呼叫端可在 walk 尚未結束時就開始處理前面的介面
+        
+        Args:
+            oid: 要查詢的 OID
+            batch_size: 每批最多筆數
+            deadline: 時間預算截止時間（epoch 秒）；超過時終止 walk，
+                並記錄於 truncated_walks
+        
+        Yields:
+            [(ifindex, counter), ...]
+        """
+        logger.info(f"使用 snmpwalk 串流查詢 {self.device_ip} (timeout={self._walk_timeout()}s)...")
+        start_time = time.time()
+        count = 0
+        self.truncated_walks.discard(oid)
+        
+        if deadline is not None and start_time >= deadline:
+            logger.warning(f"時間預算已用盡，略過 snmpwalk {oid}")
+            self.truncated_walks.add(oid)
+            return
+        
+        # stderr 寫入暫存檔：以管線接收時，設備輸出大量錯誤訊息會塞滿管線，
+        # 使 snmpwalk 阻塞到時間上限
+        errors = tempfile.TemporaryFile(mode='w+')
+        try:
+            proc = subprocess.Popen(
+                self._snmpwalk_command(oid),
+                stdout=subprocess.PIPE,
+                stderr=errors,
+                text=True
+            )
+        except OSError as e:
+            errors.close()
+            logger.error(f"snmpwalk 執行異常: {e}")
+            return
+        with self._streams_lock:
+            self._cancelled_streams.discard(oid)
+            self._streams[oid] = proc
+        
+        # 超過時間上限則終止程序
+        watchdog = threading.Timer(self._snmpwalk_time_limit(deadline), proc.kill)
+        watchdog.daemon = True
+        watchdog.start()
+        
+        received = 0
+        try:
+            batch = []
+            match = self._COUNTER_LINE.match
+            for line in proc.stdout:
+                received += len(line)
+                m = match(line)
+                # 程序被終止時最後一行可能不完整
+                if m is None or not line.endswith('\n'):
+                    continue
+                batch.append((int(m.group(1)), int(m.group(2))))
+                if len(batch) >= batch_size:
+                    count += len(batch)
+                    yield batch
+                    batch = []
+            if batch:
+                count += len(batch)
+                yield batch
+            
+            proc.wait()
+            errors.seek(0)
+            stderr = errors.read()
+        finally:
+            watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            errors.close()
+            with self._streams_lock:
+                self._streams.pop(oid, None)
+                cancelled = oid in self._cancelled_streams
+                self._cancelled_streams.discard(oid)
+            self.metrics.count('snmp_pdus_sent', count + 1)
+            self.metrics.count('snmp_bytes_received', received)
+        
+        elapsed = time.time() - start_time
+        if cancelled:
+            logger.warning(f"snmpwalk 已取消（{elapsed:.1f}秒, 已取得 {count} 筆）")
+        elif proc.returncode != 0 and deadline is not None and time.time() >= deadline:
+            self.truncated_walks.add(oid)
+            logger.warning(f"時間預算用盡，中斷 snmpwalk（{elapsed:.1f}秒, 已取得 {count} 筆）")
+        elif proc.returncode != 0:
+            self.metrics.count('snmp_errors')
+            logger.error(f"snmpwalk 執行失敗（{elapsed:.1f}秒, 已取得 {count} 筆）: {stderr}")
+        else:
+            logger.info(f"✓ snmpwalk 串流完成: 取得 {count} 個介面, 耗時 {elapsed:.1f} 秒")
+    
+    def cancel_streams(self):
+        """終止執行中的 snmpwalk_stream（呼叫端處理失敗、不再讀取結果時）"""
+        with self._streams_lock:
+            procs = list(self._streams.values())
+            self._cancelled_streams.update(self._streams)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+    
     def snmpwalk_cli(self, oid: str, required_indexes: Set[str] = None) -> Dict[str, int]:
         """
         使用命令行 snmpwalk 批次取得介面資料（效能優化版）
@@ -166,40 +466,18 @@ class SNMPHelper:
         Returns:
             {ifindex: counter_value} 字典
         """
-        logger.info(f"使用 snmpwalk 查詢 {self.device_ip} (timeout={self.timeout}s)...")
+        logger.info(f"使用 snmpwalk 查詢 {self.device_ip} (timeout={self._walk_timeout()}s)...")
         start_time = time.time()
         
         try:
-            # 執行 snmpwalk，使用 -On 輸出數字格式 OID
-            cmd = [
-                'snmpwalk',
-                '-v', self.snmp_version,
-                '-c', self.community,
-                '-t', str(self.timeout),
-                '-r', str(self.retries),
-                '-On',  # 數字格式 OID
-                self.device_ip,
-                oid
-            ]
-            
-            logger.debug(f"執行命令: {' '.join(cmd)}")
-            
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=self.timeout * (self.retries + 1) + 30
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"snmpwalk 執行失敗: {result.stderr}")
+            output = self._run_snmpwalk(oid)
+            if output is None:
                 return {}
             
             # 解析輸出
             # 格式: .1.3.6.1.2.1.31.1.1.1.10.5933254 = Counter64: 12345678
             results = {}
-            lines = result.stdout.strip().split('\n')
+            lines = output.strip().split('\n')
             
             logger.debug(f"snmpwalk 返回 {len(lines)} 行結果")
             
@@ -237,7 +515,7 @@ class SNMPHelper:
                     results[ifindex] = value
                 
                 except (ValueError, IndexError) as e:
-                    logger.debug(f"解析行失敗: {line} - {e}")
+                    logger.debug("解析行失敗: %s - %s", line, e)
                     continue
             
             elapsed = time.time() - start_time
@@ -264,18 +542,65 @@ class SNMPHelper:
             logger.error(f"snmpwalk 執行異常（{elapsed:.1f}秒）: {e}")
             return {}
     
-    def get_system_description(self) -> Optional[str]:
+    def get_system_description(self, max_retries: int = None) -> Optional[str]:
         """
         取得系統描述
         
+        Args:
+            max_retries: 最大重試次數，None 則使用預設值
+        
         Returns:
             系統描述字串
         """
-        result = self.get(self.OID_SYSTEM_DESC)
+        result = self.get(self.OID_SYSTEM_DESC, max_retries)
         if result:
             return str(result)
         return None
     
+    def clear_interface_cache(self):
+        """清除介面快取"""
+        self._interface_cache = {}
+        self._cache_timestamp = 0
+        self._name_index = {}
+        self._normalized_index = {}
+    
+    def _build_name_index(self, interfaces: Dict[int, str]):
+        """
+        建立介面名稱 -> 索引的反向索引
+        
+        正規化鍵對應到多個介面時（例如同時有 ge-1/0/0.5 與 ge-1/0/0:5）
+        標記為不明確，只能以完整名稱查詢
+        """
+        self._name_index = {if_descr: if_index for if_index, if_descr in interfaces.items()}
+        
+        normalized: Dict[Tuple, Optional[int]] = {}
+        for if_index, if_descr in interfaces.items():
+            key = normalize_interface_name(if_descr)
+            if key is None:
+                continue
+            normalized[key] = None if key in normalized else if_index
+        self._normalized_index = normalized
+    
+    def lookup_interface_index(self, interface_name: str) -> Optional[int]:
+        """
+        以目前的介面描述查詢介面索引（不查詢設備）
+        
+        先以完整名稱查詢，找不到再以正規化鍵查詢
+        
+        Args:
+            interface_name: 介面名稱
+        
+        Returns:
+            介面索引，找不到則返回 None
+        """
+        if_index = self._name_index.get(interface_name)
+        if if_index is not None:
+            return if_index
+        key = normalize_interface_name(interface_name)
+        if key is None:
+            return None
+        return self._normalized_index.get(key)
+    
     def get_interface_descriptions(self, use_cache: bool = True) -> Dict[int, str]:
         """
         取得所有介面描述
@@ -310,6 +635,7 @@ class SNMPHelper:
         # 更新快取
         self._interface_cache = interfaces
         self._cache_timestamp = time.time()
+        self._build_name_index(interfaces)
         
         logger.info(f"取得 {len(interfaces)} 個介面描述")
         return interfaces
@@ -318,6 +644,8 @@ class SNMPHelper:
         """
         根據介面名稱尋找介面索引
         
+        使用介面描述更新時建立的反向索引，每次查詢為一次 dict 查詢
+        
         Args:
             interface_name: 介面名稱 (例如: ge-1/2/0.3490)
             use_cache: 是否使用快取
@@ -325,13 +653,13 @@ class SNMPHelper:
         Returns:
             介面索引，找不到則返回 None
         """
-        interfaces = self.get_interface_descriptions(use_cache)
+        self.get_interface_descriptions(use_cache)
         
-        for if_index, if_descr in interfaces.items():
-            if if_descr == interface_name:
-                return if_index
+        if_index = self.lookup_interface_index(interface_name)
+        if if_index is not None:
+            return if_index
         
-        logger.warning(f"找不到介面: {interface_name}")
+        logger.debug("找不到介面: %s", interface_name)
         return None
     
     def get_interface_counters(self, interface_name: str) -> Optional[Tuple[int, int]]:
@@ -357,7 +685,7 @@ class SNMPHelper:
         outbound = self.get(out_oid)
         
         if inbound is None or outbound is None:
-            logger.warning(f"無法取得介面 {interface_name} 的計數器")
+            logger.debug("無法取得介面 %s 的計數器", interface_name)
             return None
         
         try:
@@ -390,16 +718,19 @@ class SNMPHelper:
         except (ValueError, TypeError):
             return None
     
-    def test_connectivity(self) -> bool:
+    def test_connectivity(self, max_retries: int = None) -> bool:
         """
         測試 SNMP 連線
         
+        Args:
+            max_retries: 最大重試次數，None 則使用預設值（0 為單次探測）
+        
         Returns:
             連線是否成功
         """
         logger.info(f"測試 SNMP 連線: {self.device_ip}")
         
-        result = self.get_system_description()
+        result = self.get_system_description(max_retries)
         if result:
             logger.info(f"連線成功: {result[:80]}")
             return True
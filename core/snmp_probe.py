@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+snmp_probe.py - 全設備並行 SNMP 探測
+
+以單一 UDP socket 同時對所有設備送出一個 SNMP GET（sysUpTime、sysDescr），
+依 request-id 對應回應。整個探測約在一個 timeout 內完成，而非逐台累加。
+
+只實作 SNMPv1 / v2c GET 所需的最小 BER 編解碼，不依賴 pysnmp。
+"""
+
+import os
+import time
+import socket
+import select
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OID_SYS_DESCR = '1.3.6.1.2.1.1.1.0'
+OID_SYS_UPTIME = '1.3.6.1.2.1.1.3.0'
+
+# BER 標籤
+_INTEGER = 0x02
+_OCTET_STRING = 0x04
+_NULL = 0x05
+_OID = 0x06
+_SEQUENCE = 0x30
+_TIMETICKS = 0x43
+_GET_REQUEST = 0xA0
+_GET_RESPONSE = 0xA2
+
+_SNMP_VERSIONS = {'1': 0, '2c': 1}
+
+# sysUpTime 為 32 位元 TimeTicks，約 497 天歸零一次
+TIMETICKS_MODULUS = 2 ** 32
+# 歸零前後兩次探測的間隔上限（1/100 秒）：超過則視為重新開機
+_WRAP_WINDOW = 24 * 3600 * 100
+
+
+@dataclass
+class ProbeResult:
+    """單一設備的探測結果"""
+    ip: str
+    reachable: bool = False
+    rtt: Optional[float] = None         # 秒（自最後一次送出起算）
+    attempts: int = 0                   # 送出次數，大於 1 時 RTT 樣本不明確
+    sys_uptime: Optional[int] = None    # TimeTicks（1/100 秒）
+    sys_descr: Optional[str] = None
+    timed_out: bool = False
+    rebooted: bool = False              # sysUpTime 小於上次探測且非歸零（重新開機，計數器已歸零）
+    probed_at: float = 0                # 探測時間（epoch 秒）
+    error: str = ''
+
+
+def uptime_reset(last: int, current: int) -> bool:
+    """
+    sysUpTime 是否因重新開機而重置
+
+    TimeTicks 約 497 天歸零一次：上次接近 2**32、本次很小，且換算的間隔
+    在一天內時視為歸零而非重新開機
+
+    Args:
+        last: 上次探測的 sysUpTime
+        current: 本次探測的 sysUpTime
+    """
+    if current >= last:
+        return False
+    return current + TIMETICKS_MODULUS - last > _WRAP_WINDOW
+
+
+def _encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    body = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(body)]) + body
+
+
+def _tlv(tag: int, value: bytes) -> bytes:
+    return bytes([tag]) + _encode_length(len(value)) + value
+
+
+def _encode_integer(value: int) -> bytes:
+    length = max(1, (value.bit_length() + 8) // 8)
+    return _tlv(_INTEGER, value.to_bytes(length, 'big', signed=True))
+
+
+def _encode_oid(oid: str) -> bytes:
+    parts = [int(p) for p in oid.strip('.').split('.')]
+    body = bytearray([parts[0] * 40 + parts[1]])
+    for part in parts[2:]:
+        chunk = [part & 0x7F]
+        part >>= 7
+        while part:
+            chunk.append(0x80 | (part & 0x7F))
+            part >>= 7
+        body.extend(reversed(chunk))
+    return _tlv(_OID, bytes(body))
+
+
+def encode_get(request_id: int, community: str, oids: List[str], version: str = '2c') -> bytes:
+    """
+    編碼 SNMP GET 請求
+
+    Args:
+        request_id: 請求 ID
+        community: SNMP Community
+        oids: 查詢的 OID
+        version: SNMP 版本（1 或 2c）
+
+    Returns:
+        UDP 封包內容
+    """
+    varbinds = b''.join(_tlv(_SEQUENCE, _encode_oid(oid) + _tlv(_NULL, b'')) for oid in oids)
+    pdu = _tlv(_GET_REQUEST,
+               _encode_integer(request_id) + _encode_integer(0) + _encode_integer(0)
+               + _tlv(_SEQUENCE, varbinds))
+    return _tlv(_SEQUENCE,
+                _encode_integer(_SNMP_VERSIONS[version])
+                + _tlv(_OCTET_STRING, community.encode('utf-8')) + pdu)
+
+
+def _read_tlv(data: bytes, pos: int) -> Tuple[int, bytes, int]:
+    """讀取一個 TLV，返回 (標籤, 內容, 下一個位置)"""
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    end = pos + length
+    if end > len(data):
+        raise ValueError("BER 長度超出封包")
+    return tag, data[pos:end], end
+
+
+def _decode_oid(body: bytes) -> str:
+    parts = list(divmod(body[0], 40))
+    value = 0
+    for byte in body[1:]:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(value)
+            value = 0
+    return '.'.join(map(str, parts))
+
+
+def decode_response(data: bytes) -> Tuple[int, int, Dict[str, object]]:
+    """
+    解碼 SNMP GET 回應
+
+    Returns:
+        (request_id, error_status, {oid: 值})；
+        值為 int（INTEGER / TimeTicks 等）、str（OCTET STRING）或 None（例外值）
+    """
+    _, message, _ = _read_tlv(data, 0)
+    _, _, pos = _read_tlv(message, 0)          # version
+    _, _, pos = _read_tlv(message, pos)        # community
+    tag, pdu, _ = _read_tlv(message, pos)
+    if tag != _GET_RESPONSE:
+        raise ValueError(f"非 GetResponse PDU: 0x{tag:02x}")
+
+    _, request_id, pos = _read_tlv(pdu, 0)
+    _, error_status, pos = _read_tlv(pdu, pos)
+    _, _, pos = _read_tlv(pdu, pos)            # error-index
+    _, varbinds, _ = _read_tlv(pdu, pos)
+
+    values: Dict[str, object] = {}
+    pos = 0
+    while pos < len(varbinds):
+        _, varbind, pos = _read_tlv(varbinds, pos)
+        _, oid, value_pos = _read_tlv(varbind, 0)
+        value_tag, value, _ = _read_tlv(varbind, value_pos)
+        if value_tag == _OCTET_STRING:
+            values[_decode_oid(oid)] = value.decode('utf-8', errors='replace')
+        elif value_tag in (_INTEGER, 0x41, 0x42, _TIMETICKS, 0x46, 0x47):
+            values[_decode_oid(oid)] = int.from_bytes(value, 'big', signed=value_tag == _INTEGER)
+        else:
+            values[_decode_oid(oid)] = None
+
+    return (int.from_bytes(request_id, 'big', signed=True),
+            int.from_bytes(error_status, 'big'), values)
+
+
+def probe_devices(targets: Dict[str, float], community: str, version: str = '2c',
+                  retries: int = 1, port: int = 161) -> Dict[str, ProbeResult]:
+    """
+    並行探測所有設備
+
+    所有請求同時送出，未回應的設備在各自 timeout 內平均重送 retries 次。
+
+    Args:
+        targets: {設備 IP: timeout 秒}
+        community: SNMP Community
+        version: SNMP 版本（1 或 2c）
+        retries: 重送次數
+        port: SNMP 埠
+
+    Returns:
+        {設備 IP: ProbeResult}
+    """
+    probed_at = time.time()
+    results = {ip: ProbeResult(ip, probed_at=probed_at) for ip in targets}
+    if not targets:
+        return results
+
+    oids = [OID_SYS_UPTIME, OID_SYS_DESCR]
+    base_id = int.from_bytes(os.urandom(3), 'big')
+    request_ids: Dict[int, str] = {}
+    packets: Dict[str, bytes] = {}
+    for i, ip in enumerate(targets):
+        request_id = (base_id + i) & 0x7FFFFFFF
+        request_ids[request_id] = ip
+        packets[ip] = encode_get(request_id, community, oids, version)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        start = time.monotonic()
+        sent_at: Dict[str, float] = {}
+        next_send: Dict[str, float] = {ip: start for ip in targets}
+        deadline: Dict[str, float] = {ip: start + timeout for ip, timeout in targets.items()}
+        pending = set(targets)
+
+        while pending:
+            now = time.monotonic()
+
+            # 送出到期的請求（首次或重送）
+            for ip in [ip for ip in pending if next_send[ip] <= now]:
+                if now >= deadline[ip]:
+                    pending.discard(ip)
+                    results[ip].timed_out = True
+                    results[ip].error = '逾時'
+                    continue
+                try:
+                    sock.sendto(packets[ip], (ip, port))
+                except BlockingIOError:
+                    # 送出緩衝區已滿，稍後再送
+                    select.select([], [sock], [], 0.05)
+                    break
+                except OSError as e:
+                    pending.discard(ip)
+                    results[ip].error = str(e)
+                    continue
+                sent_at[ip] = now
+                results[ip].attempts += 1
+                next_send[ip] = now + targets[ip] / (retries + 1)
+
+            if not pending:
+                break
+
+            wake = min(min(next_send[ip], deadline[ip]) for ip in pending)
+            readable, _, _ = select.select([sock], [], [], max(0.0, wake - time.monotonic()))
+            if not readable:
+                continue
+
+            while True:
+                try:
+                    data, (source, _) = sock.recvfrom(65535)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    # ICMP port unreachable 等錯誤（Linux 會回報於 socket 上）
+                    continue
+                received = time.monotonic()
+
+                try:
+                    request_id, error_status, values = decode_response(data)
+                except (ValueError, IndexError):
+                    logger.debug(f"無法解碼來自 {source} 的回應")
+                    continue
+
+                ip = request_ids.get(request_id)
+                if ip is None or ip != source or ip not in pending:
+                    continue
+
+                pending.discard(ip)
+                result = results[ip]
+                result.reachable = True
+                result.rtt = received - sent_at[ip]
+                if error_status:
+                    # 設備有回應，只是不支援其中一個 OID（例如 SNMPv1 的 noSuchName）
+                    logger.debug(f"{ip} 探測回應 error-status {error_status}")
+                    continue
+                uptime = values.get(OID_SYS_UPTIME)
+                result.sys_uptime = uptime if isinstance(uptime, int) else None
+                descr = values.get(OID_SYS_DESCR)
+                result.sys_descr = descr if isinstance(descr, str) else None
+    finally:
+        sock.close()
+
+    return results
+
+
+# 測試程式
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 2:
+        print("用法: python3 snmp_probe.py <IP> [IP ...] [--community public]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    community = 'public'
+    if '--community' in args:
+        i = args.index('--community')
+        community = args[i + 1]
+        del args[i:i + 2]
+
+    start = time.time()
+    for ip, result in probe_devices({ip: 5.0 for ip in args}, community).items():
+        if result.reachable:
+            print(f"✓ {ip}\tRTT={result.rtt * 1000:.1f}ms\tuptime={result.sys_uptime}\t"
+                  f"{(result.sys_descr or '')[:60]}")
+        else:
+            print(f"✗ {ip}\t{result.error}")
+    print(f"耗時 {time.time() - start:.2f} 秒")
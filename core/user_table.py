@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+user_table.py - 用戶資料表
+
+以欄位式（struct-of-arrays）儲存用戶資料，取代每位用戶一個 dataclass 物件，
+整數欄位使用 typed array，字串欄位使用字串池，大幅降低每位用戶的記憶體成本。
+"""
+
+import logging
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 整數欄位與 array typecode
+INT_COLUMNS = {
+    'slot': 'i',
+    'port': 'i',
+    'vpi': 'i',
+    'vci': 'i',
+    'download': 'q',
+    'upload': 'q',
+}
+
+# if_index 為 0 表示尚未解析（SNMP ifIndex 從 1 開始）
+UNRESOLVED = 0
+
+
+@dataclass
+class TableDiff:
+    """
+    兩份用戶資料表的差異（以用戶名稱對應）
+
+    位置皆指新資料表，removed 除外（指舊資料表）
+    """
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    # 介面 (slot, port, vpi, vci) 變更，需重新解析 ifindex
+    moved: List[int] = field(default_factory=list)
+    # 頻寬方案變更（介面不變，沿用 ifindex）
+    changed: List[int] = field(default_factory=list)
+    # 介面未變更，已沿用舊資料表 ifindex 的用戶數
+    carried: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.moved or self.changed)
+
+    def summary(self) -> str:
+        return (f"新增 {len(self.added)}、移除 {len(self.removed)}、"
+                f"介面變更 {len(self.moved)}、方案變更 {len(self.changed)}")
+
+
+class StringPool:
+    """字串池：相同字串只保存一份，以整數 id 參照"""
+
+    def __init__(self, strings: Iterable[str] = ()):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for s in strings:
+            self.intern(s)
+
+    def intern(self, s: str) -> int:
+        """取得字串 id，不存在則加入"""
+        sid = self._ids.get(s)
+        if sid is None:
+            sid = len(self.strings)
+            self.strings.append(s)
+            self._ids[s] = sid
+        return sid
+
+    def get_id(self, s: str) -> Optional[int]:
+        """查詢字串 id，不存在則返回 None"""
+        return self._ids.get(s)
+
+    def __getitem__(self, sid: int) -> str:
+        return self.strings[sid]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class UserView:
+    """
+    單一用戶的輕量檢視
+
+    提供與 UserData 相同的屬性，資料直接讀寫 UserTable，不另外複製
+    """
+
+    __slots__ = ('_table', '_pos')
+
+    def __init__(self, table: 'UserTable', pos: int):
+        self._table = table
+        self._pos = pos
+
+    @property
+    def username(self) -> str:
+        return self._table.usernames[self._pos]
+
+    @property
+    def account(self) -> str:
+        return self._table.account_at(self._pos)
+
+    @property
+    def slot(self) -> int:
+        return self._table.slot[self._pos]
+
+    @property
+    def port(self) -> int:
+        return self._table.port[self._pos]
+
+    @property
+    def vpi(self) -> int:
+        return self._table.vpi[self._pos]
+
+    @property
+    def vci(self) -> int:
+        return self._table.vci[self._pos]
+
+    @property
+    def download(self) -> int:
+        return self._table.download[self._pos]
+
+    @property
+    def upload(self) -> int:
+        return self._table.upload[self._pos]
+
+    @property
+    def interface_name(self) -> Optional[str]:
+        return self._table.interface_name(self._pos)
+
+    @property
+    def if_index(self) -> Optional[int]:
+        value = self._table.if_index[self._pos]
+        return value if value != UNRESOLVED else None
+
+    @if_index.setter
+    def if_index(self, value: Optional[int]):
+        self._table.if_index[self._pos] = value or UNRESOLVED
+
+    def __repr__(self) -> str:
+        return (f"UserView(username={self.username!r}, slot={self.slot}, port={self.port}, "
+                f"vpi={self.vpi}, vci={self.vci}, if_index={self.if_index})")
+
+
+class UserTable:
+    """欄位式用戶資料表"""
+
+    def __init__(self, usernames: List[str], accounts: StringPool, account_ids: array,
+                 columns: Dict[str, Iterable[int]], if_index: array = None,
+                 namer: Callable = None, source=None):
+        """
+        Args:
+            usernames: 用戶名稱列表
+            accounts: 帳號字串池
+            account_ids: 每位用戶的帳號 id
+            columns: 整數欄位（slot/port/vpi/vci/download/upload）
+            if_index: 介面索引陣列，None 則全部設為未解析
+            namer: 介面名稱產生函式，接受 UserView 返回介面名稱
+            source: 底層資料來源（例如 mmap 的 CompiledMap），需保持存活
+        """
+        self.usernames = usernames
+        self.accounts = accounts
+        self.account_ids = account_ids
+        self.slot = columns['slot']
+        self.port = columns['port']
+        self.vpi = columns['vpi']
+        self.vci = columns['vci']
+        self.download = columns['download']
+        self.upload = columns['upload']
+        if if_index is None:
+            if_index = array('q', bytes(8 * len(usernames)))
+        self.if_index = if_index
+        self.namer = namer
+        self._source = source
+        self._username_index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def empty(cls, namer: Callable = None) -> 'UserTable':
+        """建立空的用戶資料表"""
+        columns = {name: array(code) for name, code in INT_COLUMNS.items()}
+        return cls([], StringPool(), array('I'), columns, namer=namer)
+
+    @classmethod
+    def from_compiled(cls, compiled, namer: Callable = None) -> 'UserTable':
+        """
+        由編譯後的 Map 資料建立用戶資料表
+
+        整數欄位直接沿用編譯結果（可能為 mmap 的 memoryview），不複製
+
+        Args:
+            compiled: core.map_cache.CompiledMap
+            namer: 介面名稱產生函式
+        """
+        accounts = StringPool()
+        account_ids = array('I', map(accounts.intern, compiled.accounts))
+        return cls(compiled.usernames, accounts, account_ids, compiled.columns,
+                   namer=namer, source=compiled)
+
+    @classmethod
+    def from_users(cls, users: Iterable, namer: Callable = None) -> 'UserTable':
+        """
+        由 UserData（或具相同屬性的物件）序列建立用戶資料表
+
+        Args:
+            users: 用戶物件序列
+            namer: 介面名稱產生函式
+        """
+        table = cls.empty(namer)
+        for user in users:
+            table.append(user.username, user.slot, user.port, user.vpi, user.vci,
+                         user.download, user.upload, user.account,
+                         getattr(user, 'if_index', None))
+        return table
+
+    def append(self, username: str, slot: int, port: int, vpi: int, vci: int,
+               download: int, upload: int, account: str, if_index: int = None):
+        """新增一位用戶（僅適用於可寫入的 array 欄位）"""
+        self.usernames.append(username)
+        self.account_ids.append(self.accounts.intern(account))
+        self.slot.append(slot)
+        self.port.append(port)
+        self.vpi.append(vpi)
+        self.vci.append(vci)
+        self.download.append(download)
+        self.upload.append(upload)
+        self.if_index.append(if_index or UNRESOLVED)
+        self._username_index = None
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def __getitem__(self, pos: int) -> UserView:
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        return UserView(self, pos)
+
+    def __iter__(self) -> Iterator[UserView]:
+        for pos in range(len(self)):
+            yield UserView(self, pos)
+
+    def account_at(self, pos: int) -> str:
+        """取得指定位置的帳號"""
+        return self.accounts[self.account_ids[pos]]
+
+    def interface_name(self, pos: int) -> Optional[str]:
+        """產生指定位置的介面名稱（不快取，避免每位用戶保存一個字串）"""
+        if self.namer is None:
+            return None
+        return self.namer(UserView(self, pos))
+
+    # 查詢
+
+    def find(self, username: str) -> Optional[int]:
+        """
+        依用戶名稱查詢位置
+
+        Returns:
+            位置，找不到則返回 None
+        """
+        if self._username_index is None:
+            self._username_index = {name: pos for pos, name in enumerate(self.usernames)}
+        return self._username_index.get(username)
+
+    def positions_of(self, usernames: Iterable[str]) -> List[int]:
+        """批次查詢多位用戶的位置（略過不存在的用戶）"""
+        if self._username_index is None:
+            self.find('')
+        index = self._username_index
+        return [index[name] for name in usernames if name in index]
+
+    def unresolved_positions(self) -> List[int]:
+        """尚未解析 if_index 的用戶位置"""
+        return [pos for pos, value in enumerate(self.if_index) if value == UNRESOLVED]
+
+    def clear_if_index(self):
+        """將所有用戶的 if_index 設為未解析（設備重新開機後 ifIndex 可能重新編號）"""
+        self.if_index = array('q', bytes(8 * len(self)))
+
+    def resolved_indexes(self) -> set:
+        """所有已解析的 if_index（不重複）"""
+        indexes = set(self.if_index)
+        indexes.discard(UNRESOLVED)
+        return indexes
+
+    def select(self, positions: Iterable[int]) -> 'UserTable':
+        """
+        取出部分用戶組成新的資料表（複製欄位）
+
+        Args:
+            positions: 用戶位置序列
+
+        Returns:
+            新的用戶資料表
+        """
+        positions = list(positions)
+        columns = {}
+        for name, code in INT_COLUMNS.items():
+            column = getattr(self, name)
+            columns[name] = array(code, [column[pos] for pos in positions])
+
+        accounts = StringPool()
+        account_ids = array('I', [accounts.intern(self.account_at(pos)) for pos in positions])
+        if_index = array('q', [self.if_index[pos] for pos in positions])
+
+        return UserTable([self.usernames[pos] for pos in positions], accounts,
+                         account_ids, columns, if_index=if_index, namer=self.namer)
+
+    def adopt(self, old: 'UserTable') -> TableDiff:
+        """
+        與先前載入的資料表比對，沿用未變更用戶的 ifindex
+
+        以 (用戶名稱, slot, port, vpi, vci) 對應：介面未變更的用戶直接沿用
+        舊的 ifindex，只有新增與介面變更的用戶需要重新解析。頻寬方案與
+        電路彙總每次收集依欄位計算，不需另外更新。
+        比對以 zip / dict 批次進行，不逐一建立 UserView
+
+        Args:
+            old: 先前載入的資料表
+
+        Returns:
+            差異
+        """
+        diff = TableDiff()
+        old_positions = dict(zip(zip(old.usernames, old.slot, old.port, old.vpi, old.vci),
+                                 range(len(old))))
+        matched = list(map(old_positions.get, zip(self.usernames, self.slot, self.port,
+                                                  self.vpi, self.vci)))
+
+        old_if_index = old.if_index
+        self.if_index = array('q', [UNRESOLVED if pos is None else old_if_index[pos]
+                                    for pos in matched])
+        diff.carried = len(matched) - matched.count(None)
+
+        old_plans = list(zip(old.download, old.upload))
+        for pos, (old_pos, plan) in enumerate(zip(matched, zip(self.download, self.upload))):
+            if old_pos is not None and old_plans[old_pos] != plan:
+                diff.changed.append(pos)
+
+        if diff.carried < len(self):
+            old_names = set(old.usernames)
+            for pos, old_pos in enumerate(matched):
+                if old_pos is None:
+                    if self.usernames[pos] in old_names:
+                        diff.moved.append(pos)
+                    else:
+                        diff.added.append(pos)
+
+        if diff.carried < len(old):
+            names = set(self.usernames)
+            diff.removed = [pos for pos, name in enumerate(old.usernames) if name not in names]
+        return diff
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+cluster.py - 多節點分散收集
+
+多台收集主機共用同一份 BRAS-Map 與 RRD 根目錄（共享儲存），各自以
+rendezvous hashing（最高隨機權重）在存活節點之間認領設備：
+
+- 成員清單為共享目錄中每個節點一個 JSON 檔，定期更新心跳時間，
+  超過 member_ttl 未更新視為離線
+- 節點加入或離開時，只有歸屬改變的設備（約 1/N）會移動
+- 共用電路的設備視為一組，整組歸屬同一節點，Circuit RRD 才能完整彙總
+"""
+
+import os
+import re
+import json
+import time
+import socket
+import hashlib
+import logging
+import tempfile
+from typing import Dict, List, Optional
+
+from core.config_loader import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+_NODE_ID = re.compile(r'^[A-Za-z0-9._-]+$')
+
+
+def rendezvous_score(node_id: str, key: str) -> int:
+    """節點對指定鍵的權重"""
+    digest = hashlib.blake2b(f"{node_id}\0{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def owner(key: str, nodes: List[str]) -> Optional[str]:
+    """
+    以 rendezvous hashing 決定鍵的歸屬節點
+
+    Args:
+        key: 設備（或設備組）鍵
+        nodes: 存活節點
+
+    Returns:
+        權重最高的節點，沒有節點則返回 None
+    """
+    if not nodes:
+        return None
+    return max(nodes, key=lambda node_id: (rendezvous_score(node_id, key), node_id))
+
+
+def device_groups(jobs) -> Dict[str, str]:
+    """
+    將共用電路的設備分為一組
+
+    Args:
+        jobs: DeviceJob 列表
+
+    Returns:
+        {ip: 組鍵}，組鍵為組內最小的 IP
+    """
+    parent = {job.ip: job.ip for job in jobs}
+
+    def find(ip: str) -> str:
+        while parent[ip] != ip:
+            parent[ip] = parent[parent[ip]]
+            ip = parent[ip]
+        return ip
+
+    first_ip: Dict[str, str] = {}
+    for job in jobs:
+        for circuit_id in job.circuits:
+            other = first_ip.setdefault(circuit_id, job.ip)
+            a, b = find(job.ip), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    return {ip: find(ip) for ip in parent}
+
+
+class Membership:
+    """檔案式成員清單（共享目錄，每個節點一個檔案）"""
+
+    def __init__(self, directory: str, node_id: str, ttl: float):
+        """
+        Args:
+            directory: 成員目錄（所有節點共用）
+            node_id: 本節點 ID
+            ttl: 心跳逾時（秒）
+        """
+        if not _NODE_ID.match(node_id):
+            raise ValueError(f"節點 ID 只能包含英數字與 . _ -: {node_id}")
+        self.directory = directory
+        self.node_id = node_id
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        """本節點的成員檔案"""
+        return os.path.join(self.directory, f"{self.node_id}.json")
+
+    def heartbeat(self):
+        """更新本節點心跳"""
+        record = {
+            'node_id': self.node_id,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'heartbeat': time.time(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def leave(self):
+        """移除本節點（其他節點下次認領時接手其設備）"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def members(self) -> List[str]:
+        """
+        取得存活節點
+
+        Returns:
+            排序後的節點 ID（一定包含本節點）
+        """
+        now = time.time()
+        nodes = {self.node_id}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if now - record.get('heartbeat', 0) <= self.ttl:
+                nodes.add(record.get('node_id', name[:-5]))
+        return sorted(nodes)
+
+
+class ClusterNode:
+    """分散收集的單一節點"""
+
+    def __init__(self, config: ConfigLoader, node_id: str = None):
+        """
+        Args:
+            config: 配置載入器
+            node_id: 節點 ID，None 則使用配置（預設為主機名稱）
+        """
+        self.node_id = node_id or config.cluster_node_id
+        self.membership = Membership(config.cluster_membership_dir, self.node_id,
+                                     config.cluster_member_ttl)
+        self.members: List[str] = []
+
+    def claim(self, jobs):
+        """
+        更新心跳並認領本節點負責的設備
+
+        Args:
+            jobs: 全部收集工作
+
+        Returns:
+            本節點負責的工作（保持原順序）
+        """
+        self.membership.heartbeat()
+        self.members = self.membership.members()
+        groups = device_groups(jobs)
+
+        owners: Dict[str, str] = {}
+        claimed = []
+        for job in jobs:
+            group = groups[job.ip]
+            node_id = owners.get(group)
+            if node_id is None:
+                node_id = owners[group] = owner(group, self.members)
+            if node_id == self.node_id:
+                claimed.append(job)
+
+        logger.info(
+            f"節點 {self.node_id}: 認領 {len(claimed)}/{len(jobs)} 個設備 "
+            f"(存活節點 {len(self.members)}: {', '.join(self.members)})"
+        )
+        return claimed
+
+    def leave(self):
+        """離開叢集"""
+        self.membership.leave()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+daemon.py - 常駐收集程式
+
+以 `python -m orchestrator.daemon` 常駐執行，取代每個 step 重新啟動
+收集器程式：配置快照、SNMP Helper、RRD Manager 與已解析的用戶資料
+（包含 ifindex）都保留在記憶體中，只在配置、BRAS-Map 或 Map 檔案
+變更時重新載入。每個 step 只剩實際的 SNMP 查詢與 RRD 寫入。
+
+排程沿用 scheduler.py 的相位分散規則；收集在執行緒中進行，
+以便沿用同一個收集器實例。本程式另有控制 socket、HTTP 等執行緒，
+fork 可能複製到其他執行緒持有的鎖（logging、SQLite）而死結，
+因此收集器不以 fork 分片寫入 RRD（停用 enable_multiprocessing）。
+
+設定 [monitoring] metrics_http_port 時，另以 HTTP 提供 OpenMetrics 指標（GET /metrics）。
+
+本機控制 socket（每行一個指令，回應為一行 JSON）：
+    status              執行狀態與各設備最近一次結果
+    run [IP ...]        立即收集指定設備（未指定則全部）
+    stop                停止常駐程式
+"""
+
+import sys
+import os
+import json
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import asdict, replace
+from typing import Dict, List, Optional
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.config_loader import ConfigLoader, ConfigWatcher
+from core.inventory import open_inventory
+from core.openmetrics import start_http_server
+from orchestrator.cluster import ClusterNode
+from orchestrator.dispatcher import DeviceJob, DeviceResult, Dispatcher, build_jobs, run_device
+from orchestrator.history import RunHistory
+from orchestrator.scheduler import PollScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    """取得檔案修改時間，不存在則返回 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def send_command(socket_path: str, command: str, timeout: float = 5.0) -> Dict:
+    """
+    傳送控制指令給常駐程式
+
+    Args:
+        socket_path: 控制 socket 路徑
+        command: 指令（例如 "status"、"run 10.0.0.1"）
+        timeout: 逾時（秒）
+
+    Returns:
+        常駐程式的回應
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(command.encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline().decode('utf-8'))
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """控制 socket 連線處理"""
+
+    def handle(self):
+        line = self.rfile.readline().decode('utf-8', errors='replace').strip()
+        try:
+            response = self.server.owner.handle_command(line)
+        except Exception as e:
+            logger.error(f"控制指令失敗: {line}: {e}", exc_info=True)
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+class CollectorDaemon(PollScheduler):
+    """常駐收集程式"""
+
+    def __init__(self, config: ConfigLoader, area: str = None, socket_path: str = None,
+                 cluster: ClusterNode = None):
+        """
+        初始化常駐程式
+
+        Args:
+            config: 配置載入器
+            area: 只收集指定區域
+            socket_path: 控制 socket 路徑，None 則使用配置
+            cluster: 多節點分散收集，None 則收集全部
+        """
+        history = RunHistory(config.dispatcher_history_db)
+        super().__init__(config, Dispatcher(config, history=history), area, cluster=cluster)
+        self.socket_path = socket_path or config.daemon_socket
+        self.started_at = time.time()
+        self.steps = 0
+
+        self._lock = threading.Lock()
+        self._collectors: Dict = {}
+        self._results: Dict[str, Dict] = {}
+        self._jobs_cache: List[DeviceJob] = []
+        self._jobs_signature = None
+        self._watcher = ConfigWatcher(self.config)
+
+    def reload(self):
+        """要求下一個 step 重新載入配置與 BRAS-Map"""
+        self._watcher.invalidate()
+        self._jobs_signature = None
+
+    def _reload_config(self):
+        """配置內容變更時換用新快照，並捨棄以舊配置建立的收集器"""
+        if not self._watcher.poll():
+            return
+
+        config = self._watcher.snapshot
+        if config.rrd_step != self.step:
+            logger.warning(f"rrd_step 變更 ({self.step} -> {config.rrd_step}) 需重新啟動才會生效")
+        if config.dispatcher_max_workers != self.dispatcher.max_workers:
+            logger.warning("max_workers 變更需重新啟動才會生效")
+
+        self.config = config
+        self.dispatcher.config = config
+        self.dispatcher.type_limits = dict(config.dispatcher_type_limits)
+        self.spread = config.scheduler_spread
+        self.jitter = config.scheduler_jitter
+        with self._lock:
+            self._collectors.clear()
+        self._jobs_signature = None
+        logger.info(f"已重新載入配置: {config.config_file}")
+
+    def _jobs(self) -> List[DeviceJob]:
+        """BRAS-Map 或 Map 目錄變更時才重建工作列表"""
+        self._reload_config()
+        self.steps += 1
+
+        inventory = open_inventory(self.config)
+
+        signature = (_mtime_ns(self.config.bras_map_file), _mtime_ns(self.config.map_file_dir))
+        if signature != self._jobs_signature:
+            jobs = build_jobs(self.config, self.area, inventory)
+            types = {job.ip: job.device_type for job in jobs}
+            with self._lock:
+                for ip in list(self._collectors):
+                    if self._collectors[ip].device_type != types.get(ip):
+                        del self._collectors[ip]
+                self._jobs_cache = jobs
+            self._jobs_signature = signature
+
+        return list(self._jobs_cache)
+
+    def _executor(self, max_workers: int) -> Executor:
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='collect')
+
+    def _submit(self, pool: Executor, job: DeviceJob) -> Future:
+        return pool.submit(self._collect, job)
+
+    def _collect(self, job: DeviceJob) -> DeviceResult:
+        """以常駐的收集器執行單一設備收集（於工作執行緒中執行）"""
+        from collectors.registry import get_collector_class
+
+        with self._lock:
+            collector = self._collectors.get(job.ip)
+            # 多執行緒程序不可 fork，不使用分片寫入
+            config = replace(self.config, enable_multiprocessing=False)
+
+        if collector is None:
+            collector_class = get_collector_class(job.device_type)
+            if collector_class is None:
+                return DeviceResult(job.ip, job.device_type,
+                                    error=f"不支援的設備類型: {job.device_type}")
+            collector = collector_class(job.ip, job.map_file, config)
+            with self._lock:
+                self._collectors[job.ip] = collector
+
+        result = run_device(job, config, collector)
+
+        record = asdict(result)
+        metrics = record.pop('metrics')
+        record['counters'] = metrics.counters if metrics is not None else {}
+        with self._lock:
+            self._results[job.ip] = dict(record, finished_at=time.time())
+        return result
+
+    def status(self) -> Dict:
+        """執行狀態"""
+        with self._lock:
+            return {
+                'ok': True,
+                'pid': os.getpid(),
+                'uptime': round(time.time() - self.started_at, 1),
+                'config': self.config.config_file,
+                'step': self.step,
+                'steps': self.steps,
+                'devices': len(self._jobs_cache),
+                'loaded': len(self._collectors),
+                'node': self.cluster.node_id if self.cluster else None,
+                'members': self.cluster.members if self.cluster else [],
+                'results': dict(self._results),
+            }
+
+    def handle_command(self, line: str) -> Dict:
+        """
+        處理控制指令
+
+        Args:
+            line: 指令行
+
+        Returns:
+            回應
+        """
+        parts = line.split()
+        if not parts:
+            return {'ok': False, 'error': '空指令'}
+
+        command, args = parts[0], parts[1:]
+        if command == 'status':
+            return self.status()
+
+        if command == 'run':
+            jobs = list(self.planned)
+            if args:
+                unknown = set(args) - {job.ip for job in jobs}
+                if unknown:
+                    return {'ok': False,
+                            'error': f"未知或不屬於本節點的設備: {', '.join(sorted(unknown))}"}
+                jobs = [job for job in jobs if job.ip in args]
+            self.trigger(jobs)
+            return {'ok': True, 'queued': [job.ip for job in jobs]}
+
+        if command == 'stop':
+            self.stop()
+            return {'ok': True}
+
+        return {'ok': False, 'error': f"未知指令: {command}"}
+
+    def _start_control(self) -> socketserver.BaseServer:
+        """啟動本機控制 socket"""
+        if os.path.exists(self.socket_path):
+            try:
+                send_command(self.socket_path, 'status', timeout=1.0)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"常駐程式已在執行: {self.socket_path}")
+
+        socket_dir = os.path.dirname(self.socket_path)
+        if socket_dir:
+            os.makedirs(socket_dir, exist_ok=True)
+
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, _ControlHandler)
+        server.daemon_threads = True
+        server.owner = self
+        os.chmod(self.socket_path, 0o600)
+
+        threading.Thread(target=server.serve_forever, name='control', daemon=True).start()
+        logger.info(f"控制 socket: {self.socket_path}")
+        return server
+
+    def run(self, until: float = None):
+        """執行常駐程式直到 stop()、stop 指令或指定時間"""
+        server = self._start_control()
+        metrics_server = None
+        try:
+            if self.config.monitoring_metrics_http_port:
+                metrics_server = start_http_server(self.dispatcher.registry,
+                                                   self.config.monitoring_metrics_http_port,
+                                                   self.config.monitoring_metrics_http_host)
+            super().run(until)
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+            server.shutdown()
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.dispatcher.history.close()
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(
+        description='常駐收集程式',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用範例:
+  python3 -m orchestrator.daemon
+  python3 -m orchestrator.daemon --area taipei_4
+  python3 -m orchestrator.daemon --ctl status
+  python3 -m orchestrator.daemon --ctl run 61.64.191.78
+        """
+    )
+
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    parser.add_argument('--area', help='只收集指定區域')
+    parser.add_argument('--socket', help='控制 socket 路徑')
+    parser.add_argument('--node-id', help='以指定節點 ID 參與多節點分散收集')
+    parser.add_argument('--ctl', nargs='+', metavar='COMMAND',
+                        help='傳送控制指令給執行中的常駐程式 (status | run [IP ...] | stop)')
+    parser.add_argument('--debug', action='store_true', help='啟用除錯模式')
+
+    args = parser.parse_args()
+
+    # 設定日誌
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(threadName)s - %(message)s'
+    )
+
+    try:
+        config = ConfigLoader(args.config) if args.config else ConfigLoader()
+
+        if args.ctl:
+            response = send_command(args.socket or config.daemon_socket, ' '.join(args.ctl))
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+            sys.exit(0 if response.get('ok') else 1)
+
+        cluster = None
+        if config.cluster_enabled or args.node_id:
+            cluster = ClusterNode(config, args.node_id)
+        daemon = CollectorDaemon(config, args.area, args.socket, cluster)
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+        signal.signal(signal.SIGHUP, lambda signum, frame: daemon.reload())
+        daemon.run()
+        sys.exit(0)
+
+    except KeyboardInterrupt:
+        logger.warning("\n常駐程式被用戶中斷")
+        sys.exit(130)
+    except Exception as e:
+        logger.error(f"常駐程式執行失敗: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
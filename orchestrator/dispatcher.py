@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+"""
+dispatcher.py - 收集調度器
+
+讀取 BRAS-Map，依設備 IP 分組，並行執行對應設備類型的收集器，
+受全域與各設備類型的並行上限限制，讓整個設備群在一個 RRD step 內完成。
+"""
+
+import sys
+import os
+import time
+import logging
+import argparse
+import heapq
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.config_loader import ConfigLoader, ConfigSnapshot
+from core.inventory import Inventory, open_inventory
+from core.map_cache import cached_user_count
+from core.openmetrics import FAMILIES, MetricsRegistry, write_textfile
+from core.radius_source import RadiusMapSource
+from core.rrd_manager import RRDManager
+from core.run_metrics import MetricSet
+from core.snmp_probe import ProbeResult, probe_devices, uptime_reset
+from core.rtt_estimator import RttEstimator
+from orchestrator.cluster import ClusterNode
+from orchestrator.history import RunHistory
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceJob:
+    """單一設備的收集工作"""
+    ip: str
+    device_type: int
+    map_file: str
+    areas: List[str] = field(default_factory=list)
+    circuits: List[str] = field(default_factory=list)
+    # (slot, port, pic) -> CircuitID，收集器據此將計數器分送至各電路
+    circuit_ports: Dict[Tuple[int, int, int], str] = field(default_factory=dict)
+    users: Optional[int] = None
+    estimate: float = 0
+    optional: bool = False
+    # 調度前的並行預檢結果，傳給收集器以省去各自的連線測試
+    probe: Optional[ProbeResult] = None
+
+
+@dataclass
+class DeviceResult:
+    """單一設備的收集結果"""
+    ip: str
+    device_type: int
+    success: bool = False
+    total: int = 0
+    collected: int = 0
+    failed: int = 0
+    skipped: int = 0
+    duration: float = 0
+    error: str = ''
+    # 依電路彙總: {circuit_id: [inbound_rate, outbound_rate, user_count]}（位元組/秒）
+    circuits: Dict[str, List[float]] = field(default_factory=dict)
+    # 沒有前次計數器，本次電路速率不可用
+    circuit_baseline: bool = False
+    # 各階段耗時與 SNMP / RRD 計數（見 CollectionStats）
+    phases: Dict[str, float] = field(default_factory=dict)
+    metrics: Optional[MetricSet] = None
+
+
+def build_jobs(config: ConfigLoader, area: str = None,
+               inventory: Inventory = None) -> List[DeviceJob]:
+    """
+    由 BRAS-Map 建立收集工作，同一 IP 只建立一個工作
+
+    BRAS-Map 每個電路一行，同一設備會出現多次；合併後每台設備每個 step
+    只 walk 一次，結果再依 (slot, port, pic) 分送至各電路
+
+    Args:
+        config: 配置載入器
+        area: 只收集指定區域，None 表示全部
+        inventory: 已更新的清冊；提供時由清冊查詢電路與用戶數，不解析文字檔案
+
+    Returns:
+        收集工作列表（依 BRAS-Map 首次出現順序）
+    """
+    jobs: "OrderedDict[str, DeviceJob]" = OrderedDict()
+
+    if inventory is not None:
+        rows = inventory.bras_map_rows(area)
+    else:
+        rows = config.load_bras_map()
+
+    for row in rows:
+        if area and row['area'] != area:
+            continue
+
+        ip = row['ip']
+        job = jobs.get(ip)
+        if job is None:
+            job = DeviceJob(ip, row['device_type'], config.get_map_file_path(ip))
+            jobs[ip] = job
+        elif job.device_type != row['device_type']:
+            logger.warning(
+                f"設備 {ip} 在 BRAS-Map 中有不同的 DeviceType "
+                f"({job.device_type}, {row['device_type']})，使用 {job.device_type}"
+            )
+
+        if row['area'] not in job.areas:
+            job.areas.append(row['area'])
+        if row['circuit_id'] not in job.circuits:
+            job.circuits.append(row['circuit_id'])
+
+        key = (row['slot'], row['port'], row['pic'])
+        existing = job.circuit_ports.setdefault(key, row['circuit_id'])
+        if existing != row['circuit_id']:
+            logger.warning(
+                f"設備 {ip} 的 {key} 同時對應電路 {existing} 與 {row['circuit_id']}，使用 {existing}"
+            )
+
+    optional_areas = set(config.dispatcher_optional_areas)
+
+    # 用戶數（依歷史耗時排程使用）；由資料庫載入用戶時於 plan() 查詢資料庫
+    user_counts = {}
+    if inventory is not None and not config.database_map_source:
+        user_counts = inventory.user_counts()
+
+    result = []
+    for job in jobs.values():
+        # 由資料庫載入用戶時不需要 Map 檔案
+        if not config.database_map_source and not os.path.exists(job.map_file):
+            logger.warning(f"設備 {job.ip} 的 Map 檔案不存在，略過: {job.map_file}")
+            continue
+        job.optional = bool(optional_areas) and set(job.areas) <= optional_areas
+        job.users = user_counts.get(job.ip)
+        result.append(job)
+
+    logger.info(f"BRAS-Map 共 {len(jobs)} 個設備，{len(result)} 個可收集")
+    return result
+
+
+def count_map_users(map_file: str) -> int:
+    """
+    估算 Map 檔案的用戶數
+
+    優先讀取編譯快取標頭，否則計算非註解行數
+    """
+    count = cached_user_count(map_file)
+    if count is not None:
+        return count
+
+    count = 0
+    with open(map_file, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(b'#'):
+                count += 1
+    return count
+
+
+def run_device(job: DeviceJob, config: ConfigSnapshot, collector=None) -> DeviceResult:
+    """
+    執行單一設備收集（於子進程中執行）
+
+    Args:
+        job: 收集工作
+        config: 配置快照（隨工作傳入子進程，不需重新解析配置檔案）
+        collector: 沿用的收集器實例（常駐模式），None 則新建
+
+    Returns:
+        收集結果
+    """
+    from collectors.registry import get_collector_class
+
+    result = DeviceResult(job.ip, job.device_type)
+    start_time = time.time()
+
+    try:
+        if collector is None:
+            collector_class = get_collector_class(job.device_type)
+            if collector_class is None:
+                result.error = f"不支援的設備類型: {job.device_type}"
+                return result
+
+            collector = collector_class(job.ip, job.map_file, config)
+        collector.circuit_ports = job.circuit_ports
+        collector.probe = job.probe
+        result.success = collector.run()
+
+        stats = collector.stats
+        result.total = stats.total
+        result.collected = stats.success
+        result.failed = stats.failed
+        result.skipped = stats.skipped
+        result.circuits = stats.circuit_totals
+        result.circuit_baseline = stats.circuit_baseline
+        result.phases = stats.phases
+        result.metrics = stats.metrics
+        if stats.breaker_open:
+            result.error = '斷路器開啟，略過'
+        elif job.probe is not None and not job.probe.reachable:
+            result.error = f"預檢無法連線: {job.probe.error}"
+        elif stats.skipped:
+            result.error = f"超過時間預算，略過 {stats.skipped} 個用戶"
+    except Exception as e:
+        logger.error(f"設備 {job.ip} 收集失敗: {e}", exc_info=True)
+        result.error = str(e)
+    finally:
+        result.duration = time.time() - start_time
+
+    return result
+
+
+class Dispatcher:
+    """並行收集調度器"""
+
+    # 沒有任何歷史資料時的預估耗時（秒）
+    DEFAULT_ESTIMATE = 60.0
+
+    def __init__(self, config: ConfigLoader, max_workers: int = None,
+                 type_limits: Dict[int, int] = None, history: RunHistory = None):
+        """
+        初始化調度器
+
+        Args:
+            config: 配置載入器或快照
+            max_workers: 同時收集的設備數上限，None 則使用配置
+            type_limits: 各設備類型的並行上限，None 則使用配置
+            history: 收集歷史，None 則依 BRAS-Map 順序調度
+        """
+        self.config = config = config.snapshot()
+        self.max_workers = max_workers or config.dispatcher_max_workers
+        # 複製一份，不與快照或呼叫端共用
+        self.type_limits: Dict[int, int] = dict(
+            type_limits if type_limits is not None else config.dispatcher_type_limits
+        )
+        self.history = history
+        # 無收集歷史時，於記憶體保存上次探測的 sysUpTime
+        self._uptimes: Dict[str, int] = {}
+        self.rtt: Optional[RttEstimator] = None
+        if config.snmp_adaptive_timeout:
+            self.rtt = RttEstimator(config.rtt_db, config.snmp_min_timeout, config.snmp_max_timeout)
+        # OpenMetrics 指標（每台設備收集完成時更新）
+        self.registry = MetricsRegistry()
+
+    def next_job(self, pending: deque, running_types: Dict[int, int]) -> Optional[DeviceJob]:
+        """取出第一個未超過設備類型上限的工作"""
+        for i, job in enumerate(pending):
+            limit = self.type_limits.get(job.device_type)
+            if limit is None or running_types.get(job.device_type, 0) < limit:
+                del pending[i]
+                return job
+        return None
+
+    def finish(self, job: DeviceJob, future) -> DeviceResult:
+        """
+        取得已完成工作的結果，記錄歷史與日誌
+
+        Args:
+            job: 收集工作
+            future: 已完成的 Future
+
+        Returns:
+            收集結果
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            result = DeviceResult(job.ip, job.device_type, error=str(e))
+
+        if self.history is not None:
+            self.history.record(job.ip, job.device_type, result.duration,
+                                result.total, result.success)
+
+        status = '✓' if result.success else '✗'
+        logger.info(
+            f"{status} {job.ip} (type={job.device_type}): "
+            f"{result.collected}/{result.total}, 耗時 {result.duration:.1f} 秒"
+            + (f", 錯誤: {result.error}" if result.error else '')
+        )
+        self.record_metrics(result)
+        return result
+
+    def record_metrics(self, result: DeviceResult):
+        """將單一設備的收集結果更新至 OpenMetrics 指標"""
+        registry = self.registry
+        labels = {'device': result.ip, 'device_type': result.device_type}
+
+        registry.set('device_up', int(result.success), **labels)
+        registry.set('device_poll_duration_seconds', round(result.duration, 3), **labels)
+        ratio = result.collected / result.total if result.total else 0.0
+        registry.set('device_success_ratio', round(ratio, 4), **labels)
+        for state, count in (('total', result.total), ('collected', result.collected),
+                             ('failed', result.failed), ('skipped', result.skipped)):
+            registry.set('device_users', count, state=state, **labels)
+        registry.set('device_last_run_timestamp_seconds', round(time.time(), 3), **labels)
+        registry.inc('device_polls', result='success' if result.success else 'failure', **labels)
+
+        # 各階段只保留最近一次收集的結果
+        registry.discard(['device_phase_seconds'], **labels)
+        for phase, seconds in result.phases.items():
+            registry.set('device_phase_seconds', round(seconds, 4), phase=phase, **labels)
+
+        if result.metrics is not None:
+            for name, count in result.metrics.counters.items():
+                if FAMILIES.get(name, ('',))[0] == 'counter':
+                    registry.inc(name, count, **labels)
+            for name, histogram in result.metrics.histograms.items():
+                if FAMILIES.get(name, ('',))[0] == 'histogram':
+                    registry.merge_histogram(name, histogram, **labels)
+
+    def publish_metrics(self):
+        """設定 [monitoring] metrics_textfile 時，更新 node_exporter 指標檔案"""
+        path = self.config.monitoring_metrics_textfile
+        if not path:
+            return
+        try:
+            write_textfile(self.registry, path)
+        except OSError as e:
+            logger.warning(f"無法寫入指標檔案 {path}: {e}")
+
+    def preflight(self, jobs: List[DeviceJob]):
+        """
+        並行探測所有設備（sysUpTime / sysDescr），結果附加於各工作
+
+        所有設備同時送出一個 GET，整體約在一個 timeout 內完成；
+        sysUpTime 小於上次探測時標記為重新開機
+
+        Args:
+            jobs: 收集工作
+        """
+        targets = self.preflight_targets(jobs)
+        if targets:
+            start_time = time.time()
+            self.apply_preflight(jobs, self.probe(targets), start_time)
+
+    def preflight_targets(self, jobs: List[DeviceJob]) -> Dict[str, float]:
+        """
+        預檢的探測對象
+
+        Args:
+            jobs: 收集工作
+
+        Returns:
+            {設備 IP: timeout 秒}；停用預檢時為空
+        """
+        if not jobs or not self.config.dispatcher_preflight:
+            return {}
+        if self.config.snmp_version not in ('1', '2c'):
+            logger.warning(f"預檢不支援 SNMP 版本 {self.config.snmp_version}，改由各收集器測試連線")
+            return {}
+
+        targets = {}
+        for job in jobs:
+            timeout = float(self.config.get_device_timeout(job.device_type))
+            if self.rtt is not None:
+                # 預檢總耗時取決於最慢的設備，不超過固定逾時
+                timeout = min(timeout, self.rtt.timeout(job.ip, timeout))
+            targets[job.ip] = timeout
+        return targets
+
+    def probe(self, targets: Dict[str, float]) -> Dict[str, ProbeResult]:
+        """
+        送出預檢探測（只使用網路，可在其他執行緒執行）
+
+        Args:
+            targets: preflight_targets() 的結果
+
+        Returns:
+            {設備 IP: ProbeResult}
+        """
+        return probe_devices(targets, self.config.snmp_community, self.config.snmp_version)
+
+    def apply_preflight(self, jobs: List[DeviceJob], results: Dict[str, ProbeResult],
+                        start_time: float):
+        """
+        記錄預檢結果（RTT、sysUpTime）並附加於各工作
+
+        Args:
+            jobs: 收集工作
+            results: probe() 的結果
+            start_time: 開始探測的時間
+        """
+        samples = {ip: r.rtt for ip, r in results.items() if r.reachable and r.attempts == 1}
+        for job in jobs:
+            if job.ip in samples:
+                self.registry.observe('snmp_rtt_seconds', samples[job.ip],
+                                      device=job.ip, device_type=job.device_type)
+
+        if self.rtt is not None:
+            self.rtt.sample_many(samples)
+            for ip, r in results.items():
+                if r.timed_out:
+                    self.rtt.backoff(ip)
+
+        previous = self.history.last_uptimes() if self.history is not None else self._uptimes
+        uptimes: Dict[str, int] = {}
+        for job in jobs:
+            probe = results.get(job.ip)
+            if probe is None:
+                continue
+            if probe.sys_uptime is not None:
+                last = previous.get(job.ip)
+                if last is not None and uptime_reset(last, probe.sys_uptime):
+                    probe.rebooted = True
+                    logger.warning(f"設備 {job.ip} sysUpTime 重置，判定為重新開機")
+                uptimes[job.ip] = probe.sys_uptime
+            job.probe = probe
+
+        self._uptimes.update(uptimes)
+        if self.history is not None:
+            self.history.save_uptimes(uptimes)
+
+        reachable = [r for r in results.values() if r.reachable]
+        slowest = max((r.rtt for r in reachable), default=0)
+        logger.info(
+            f"預檢: {len(reachable)}/{len(jobs)} 個設備可連線, "
+            f"最慢 RTT {slowest * 1000:.0f}ms, 耗時 {time.time() - start_time:.1f} 秒"
+        )
+        for result in results.values():
+            if not result.reachable:
+                logger.warning(f"預檢: 設備 {result.ip} 無法連線 ({result.error})")
+
+    def write_circuits(self, jobs: List[DeviceJob], results: List[DeviceResult],
+                       others: List[DeviceJob] = ()) -> int:
+        """
+        彙總各設備的電路速率並寫入 Circuit RRD
+
+        各設備以用戶速率加總（見 BaseCollector._circuit_totals），電路 RRD
+        的 inbound / outbound 為 GAUGE。同一電路可能跨多台設備；任一台收集
+        失敗、因時間預算只收集部分用戶、沒有前次計數器或不由本次執行收集時
+        略過該電路，避免只寫入部分設備的速率
+
+        Args:
+            jobs: 本次執行的收集工作
+            results: 收集結果
+            others: 未由本次執行收集的設備（例如由其他節點負責），其電路略過
+
+        Returns:
+            寫入的電路數
+        """
+        by_ip = {result.ip: result for result in results}
+        totals: Dict[str, List[float]] = {}
+        incomplete = set()
+
+        for job in others:
+            incomplete.update(job.circuit_ports.values())
+
+        for job in jobs:
+            result = by_ip.get(job.ip)
+            for circuit_id in set(job.circuit_ports.values()):
+                if (result is None or not result.success or result.skipped
+                        or result.circuit_baseline):
+                    incomplete.add(circuit_id)
+                    continue
+                total = totals.setdefault(circuit_id, [0.0, 0.0, 0, 0])
+                inbound, outbound, users = result.circuits.get(circuit_id, (0.0, 0.0, 0))
+                total[0] += inbound
+                total[1] += outbound
+                total[2] += 1
+                total[3] += users
+
+        skipped = incomplete & totals.keys()
+        if skipped:
+            logger.warning(f"{len(skipped)} 個電路有設備收集失敗、不完整或尚無速率基準，略過更新")
+
+        rrd = RRDManager(self.config.rrd_base_dir, self.config.rrd_step, self.config.rrd_heartbeat)
+        written = 0
+        for circuit_id, (inbound, outbound, devices, users) in totals.items():
+            if circuit_id in incomplete:
+                continue
+            if rrd.update_circuit_rrd(circuit_id, inbound, outbound, devices, users):
+                written += 1
+            else:
+                logger.warning(f"更新電路 {circuit_id} RRD 失敗")
+
+        logger.info(f"更新 {written} 個電路 RRD")
+        return written
+
+    def simulate(self, jobs: List[DeviceJob]) -> float:
+        """
+        以與實際調度相同的規則模擬執行，預測整體完成時間
+
+        Args:
+            jobs: 已排序且已預估耗時的工作
+
+        Returns:
+            預測完成時間（秒）
+        """
+        pending = deque(jobs)
+        running = []
+        running_types: Dict[int, int] = {}
+        now = 0.0
+        seq = 0
+
+        while pending or running:
+            while pending and len(running) < self.max_workers:
+                job = self.next_job(pending, running_types)
+                if job is None:
+                    break
+                heapq.heappush(running, (now + job.estimate, seq, job.device_type))
+                running_types[job.device_type] = running_types.get(job.device_type, 0) + 1
+                seq += 1
+
+            now, _, device_type = heapq.heappop(running)
+            running_types[device_type] -= 1
+
+        return now
+
+    def plan(self, jobs: List[DeviceJob]) -> List[DeviceJob]:
+        """
+        依歷史耗時排序工作（最長者優先），並檢查預測完成時間
+
+        預測超過 RRD step 時發出警告；若有可略過的工作（optional_areas），
+        由預估最久者開始略過，直到預測完成時間落在 step 內
+
+        Args:
+            jobs: 收集工作
+
+        Returns:
+            排序後實際要執行的工作
+        """
+        if self.history is None:
+            return jobs
+
+        type_rates = self.history.seconds_per_user()
+        db_counts = None
+        if self.config.database_map_source and any(job.users is None for job in jobs):
+            db_counts = RadiusMapSource(self.config).counts()
+        unknown = 0
+        for job in jobs:
+            if job.users is None:
+                if db_counts is not None:
+                    job.users = db_counts.get(job.ip, 0)
+                else:
+                    job.users = count_map_users(job.map_file)
+            estimate = self.history.estimate(job.ip, job.device_type, job.users, type_rates)
+            if estimate is None:
+                estimate = self.DEFAULT_ESTIMATE
+                unknown += 1
+            job.estimate = estimate
+
+        ordered = sorted(jobs, key=lambda j: j.estimate, reverse=True)
+        deadline = self.config.rrd_step
+        makespan = self.simulate(ordered)
+        logger.info(f"預測完成時間: {makespan:.1f} 秒 (RRD step {deadline} 秒)")
+
+        if makespan > deadline and unknown:
+            # 預估不完整時不略過任何設備，待累積歷史後再判斷
+            logger.warning(
+                f"預測完成時間 {makespan:.1f} 秒超過 RRD step ({deadline} 秒)，"
+                f"其中 {unknown} 個設備尚無歷史資料"
+            )
+        elif makespan > deadline:
+            for job in [j for j in ordered if j.optional]:
+                ordered.remove(job)
+                logger.warning(f"預測超過 RRD step，略過選用設備 {job.ip} (預估 {job.estimate:.1f} 秒)")
+                makespan = self.simulate(ordered)
+                if makespan <= deadline:
+                    break
+
+            if makespan > deadline:
+                logger.warning(
+                    f"預測完成時間 {makespan:.1f} 秒超過 RRD step ({deadline} 秒)，"
+                    f"請增加 max_workers 或分散設備"
+                )
+            else:
+                logger.info(f"略過選用設備後預測完成時間: {makespan:.1f} 秒")
+
+        return ordered
+
+    def run(self, jobs: List[DeviceJob], others: List[DeviceJob] = ()) -> List[DeviceResult]:
+        """
+        並行執行所有收集工作
+
+        Args:
+            jobs: 收集工作列表
+            others: 由其他節點負責的設備（共用電路時略過該電路的更新）
+
+        Returns:
+            收集結果列表（依完成順序）
+        """
+        results: List[DeviceResult] = []
+        if not jobs:
+            return results
+
+        self.preflight(jobs)
+        planned = self.plan(jobs)
+        # 略過的選用設備與其他節點的設備同樣不更新共用的電路
+        kept = {job.ip for job in planned}
+        others = list(others) + [job for job in jobs if job.ip not in kept]
+        jobs = planned
+        pending = deque(jobs)
+        running = {}
+        running_types: Dict[int, int] = {}
+        start_time = time.time()
+
+        logger.info(
+            f"開始調度 {len(jobs)} 個設備 (max_workers={self.max_workers}, "
+            f"type_limits={self.type_limits or '無'})"
+        )
+
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+            while pending or running:
+                # 補滿可用的工作槽
+                while pending and len(running) < self.max_workers:
+                    job = self.next_job(pending, running_types)
+                    if job is None:
+                        break
+                    future = pool.submit(run_device, job, self.config)
+                    running[future] = job
+                    running_types[job.device_type] = running_types.get(job.device_type, 0) + 1
+                self.registry.set('dispatch_queue_depth', len(pending), queue='pending')
+                self.registry.set('dispatch_queue_depth', len(running), queue='running')
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    running_types[job.device_type] -= 1
+
+                    results.append(self.finish(job, future))
+
+        self.write_circuits(jobs, results, others)
+
+        elapsed = time.time() - start_time
+        success = sum(1 for r in results if r.success)
+        logger.info(f"調度完成: 成功 {success}/{len(results)} 個設備, 耗時 {elapsed:.1f} 秒")
+
+        self.registry.set('dispatch_queue_depth', 0, queue='running')
+        self.registry.set('dispatch_duration_seconds', round(elapsed, 3))
+        self.publish_metrics()
+
+        if elapsed > self.config.rrd_step:
+            logger.warning(f"調度耗時 {elapsed:.1f} 秒超過 RRD step ({self.config.rrd_step} 秒)")
+
+        return results
+
+
+def main(argv: List[str] = None, prog: str = None):
+    """
+    主程式
+
+    Args:
+        argv: 命令列參數，None 則使用 sys.argv
+        prog: 程式名稱（由 python -m rrdw dispatch 轉呼叫時使用）
+    """
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description='收集調度器',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用範例:
+  python3 dispatcher.py
+  python3 dispatcher.py --area taipei_4
+  python3 dispatcher.py --dry-run
+  python3 dispatcher.py --config /path/to/config.ini --max-workers 16
+  python3 dispatcher.py --node-id collector-2
+        """
+    )
+
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    parser.add_argument('--area', help='只收集指定區域')
+    parser.add_argument('--max-workers', type=int, help='同時收集的設備數上限')
+    parser.add_argument('--node-id', help='以指定節點 ID 參與多節點分散收集')
+    parser.add_argument('--no-history', action='store_true',
+                        help='不使用收集歷史，依 BRAS-Map 順序調度')
+    parser.add_argument('--dry-run', action='store_true', help='乾跑模式（不實際收集）')
+    parser.add_argument('--debug', action='store_true', help='啟用除錯模式')
+
+    args = parser.parse_args(argv)
+
+    # 設定日誌
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        config = ConfigLoader(args.config) if args.config else ConfigLoader()
+        inventory = open_inventory(config)
+        all_jobs = jobs = build_jobs(config, args.area, inventory)
+        if config.cluster_enabled or args.node_id:
+            jobs = ClusterNode(config, args.node_id).claim(all_jobs)
+        claimed = {job.ip for job in jobs}
+        others = [job for job in all_jobs if job.ip not in claimed]
+        history = None if args.no_history else RunHistory(config.dispatcher_history_db)
+        dispatcher = Dispatcher(config, max_workers=args.max_workers, history=history)
+
+        if args.dry_run:
+            for job in dispatcher.plan(jobs):
+                print(f"{job.ip}\ttype={job.device_type}\t{job.map_file}\t"
+                      f"estimate={job.estimate:.1f}s\tcircuits={','.join(job.circuits)}")
+            sys.exit(0)
+
+        results = dispatcher.run(jobs, others)
+        sys.exit(0 if all(r.success for r in results) else 1)
+
+    except KeyboardInterrupt:
+        logger.warning("\n調度被用戶中斷")
+        sys.exit(130)
+    except Exception as e:
+        logger.error(f"調度器執行失敗: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+history.py - 設備收集歷史
+
+以本機 SQLite 保存每台設備每次收集的耗時與用戶數，
+供調度器預估工作時間、排序並預測整體完成時間。
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_runs (
+    ip          TEXT    NOT NULL,
+    device_type INTEGER NOT NULL,
+    started_at  REAL    NOT NULL,
+    duration    REAL    NOT NULL,
+    users       INTEGER NOT NULL,
+    success     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_device_runs_ip ON device_runs (ip, started_at);
+CREATE TABLE IF NOT EXISTS device_uptime (
+    ip         TEXT PRIMARY KEY,
+    sys_uptime INTEGER NOT NULL,
+    probed_at  REAL    NOT NULL
+);
+"""
+
+
+class RunHistory:
+    """設備收集歷史（SQLite）"""
+
+    def __init__(self, db_path: str, window: int = 5, keep: int = 50):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+            window: 預估時採用的最近次數
+            keep: 每台設備保留的紀錄數
+        """
+        self.db_path = db_path
+        self.window = window
+        self.keep = keep
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """關閉資料庫"""
+        self.conn.close()
+
+    def record(self, ip: str, device_type: int, duration: float, users: int,
+               success: bool, started_at: float = None):
+        """
+        記錄一次收集結果
+
+        Args:
+            ip: 設備 IP
+            device_type: 設備類型
+            duration: 耗時（秒）
+            users: 用戶數
+            success: 是否成功
+            started_at: 開始時間，None 則以現在時間減去耗時
+        """
+        if started_at is None:
+            started_at = time.time() - duration
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO device_runs (ip, device_type, started_at, duration, users, success) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (ip, device_type, started_at, duration, users, int(success))
+            )
+            self.conn.execute(
+                "DELETE FROM device_runs WHERE ip = ? AND rowid NOT IN ("
+                "SELECT rowid FROM device_runs WHERE ip = ? ORDER BY started_at DESC LIMIT ?)",
+                (ip, ip, self.keep)
+            )
+
+    def recent(self, ip: str) -> List[Tuple[float, int]]:
+        """取得設備最近的 (耗時, 用戶數)"""
+        rows = self.conn.execute(
+            "SELECT duration, users FROM device_runs WHERE ip = ? AND success = 1 "
+            "ORDER BY started_at DESC LIMIT ?",
+            (ip, self.window)
+        )
+        return rows.fetchall()
+
+    def last_uptimes(self) -> Dict[str, int]:
+        """各設備上次探測的 sysUpTime"""
+        rows = self.conn.execute("SELECT ip, sys_uptime FROM device_uptime")
+        return dict(rows.fetchall())
+
+    def save_uptimes(self, uptimes: Dict[str, int]):
+        """保存本次探測的 sysUpTime"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO device_uptime (ip, sys_uptime, probed_at) VALUES (?, ?, ?)",
+                [(ip, uptime, now) for ip, uptime in uptimes.items()]
+            )
+
+    def seconds_per_user(self) -> Dict[int, float]:
+        """各設備類型每位用戶的耗時中位數（秒），用於沒有歷史的設備"""
+        rates: Dict[int, List[float]] = {}
+        rows = self.conn.execute(
+            "SELECT device_type, duration, users FROM device_runs "
+            "WHERE success = 1 AND users > 0"
+        )
+        for device_type, duration, users in rows:
+            rates.setdefault(device_type, []).append(duration / users)
+        return {device_type: median(values) for device_type, values in rates.items()}
+
+    def estimate(self, ip: str, device_type: int, users: Optional[int] = None,
+                 type_rates: Dict[int, float] = None) -> Optional[float]:
+        """
+        預估設備收集耗時
+
+        有歷史時取最近幾次的中位數，並依用戶數變化比例調整；
+        沒有歷史時以同類型設備的每用戶耗時乘上用戶數估算。
+
+        Args:
+            ip: 設備 IP
+            device_type: 設備類型
+            users: 目前用戶數，None 表示未知
+            type_rates: seconds_per_user() 的結果，None 則即時查詢
+
+        Returns:
+            預估耗時（秒），無任何可參考資料則返回 None
+        """
+        recent = self.recent(ip)
+        if recent:
+            duration = median(d for d, _ in recent)
+            last_users = recent[0][1]
+            if users and last_users:
+                duration *= users / last_users
+            return duration
+
+        if type_rates is None:
+            type_rates = self.seconds_per_user()
+        rate = type_rates.get(device_type)
+        if rate is not None and users:
+            return rate * users
+        return None
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+scheduler.py - 錯開相位的常駐輪詢排程器
+
+取代每 20 分鐘由 cron 同時啟動所有收集器的方式：每台設備依其 IP
+雜湊取得一個固定的相位偏移，分散在 RRD step 內，並加上有限的隨機抖動。
+每個週期都在相同相位取樣，負載平均分散，RRD 取樣間隔也保持規律。
+"""
+
+import sys
+import os
+import time
+import random
+import signal
+import hashlib
+import logging
+import argparse
+import heapq
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import (FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from typing import Dict, List, Optional, Set, Tuple
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.config_loader import ConfigLoader
+from core.inventory import open_inventory
+from orchestrator.cluster import ClusterNode
+from orchestrator.dispatcher import DeviceJob, DeviceResult, Dispatcher, build_jobs, run_device
+from orchestrator.history import RunHistory
+
+logger = logging.getLogger(__name__)
+
+
+def phase_offset(ip: str, step: int, spread: float) -> float:
+    """
+    計算設備在 step 內的固定相位偏移
+
+    以 IP 雜湊決定，重新啟動後仍相同
+
+    Args:
+        ip: 設備 IP
+        step: RRD step（秒）
+        spread: 分散範圍佔 step 的比例（保留 step 末段給收集完成）
+
+    Returns:
+        相位偏移（秒），範圍 [0, step * spread)
+    """
+    digest = hashlib.blake2b(ip.encode('utf-8'), digest_size=8).digest()
+    fraction = int.from_bytes(digest, 'big') / 2 ** 64
+    return fraction * step * spread
+
+
+@dataclass
+class _StepCircuits:
+    """一個 step 內有電路的設備，全部完成後更新 Circuit RRD"""
+    jobs: List[DeviceJob]
+    # 共用電路但本 step 不收集的設備（其他節點負責、啟動時相位已過）
+    others: List[DeviceJob]
+    pending: Set[str] = field(default_factory=set)
+    results: List[DeviceResult] = field(default_factory=list)
+
+
+class PollScheduler:
+    """錯開相位的常駐輪詢排程器"""
+
+    def __init__(self, config: ConfigLoader, dispatcher: Dispatcher = None,
+                 area: str = None, spread: float = None, jitter: float = None,
+                 cluster: ClusterNode = None):
+        """
+        初始化排程器
+
+        Args:
+            config: 配置載入器或快照
+            dispatcher: 提供並行上限與歷史紀錄的調度器，None 則自動建立
+            area: 只收集指定區域
+            spread: 相位分散範圍佔 step 的比例，None 則使用配置
+            jitter: 每次取樣的隨機抖動上限（秒），None 則使用配置
+            cluster: 多節點分散收集，每個 step 重新認領設備；None 則收集全部
+        """
+        self.config = config = config.snapshot()
+        self.dispatcher = dispatcher or Dispatcher(config)
+        self.area = area
+        self.step = config.rrd_step
+        self.spread = spread if spread is not None else config.scheduler_spread
+        self.jitter = jitter if jitter is not None else config.scheduler_jitter
+        self.cluster = cluster
+        # 最近一次排程的工作（多節點時僅含本節點負責的設備）
+        self.planned: List[DeviceJob] = []
+        self._stop = threading.Event()
+        self._seq = itertools.count()
+        self._triggered: deque = deque()
+        # 背景執行的預檢: (探測結果, 工作, 開始時間)
+        self._probe_pool: Optional[ThreadPoolExecutor] = None
+        self._probing: Optional[Tuple[Future, List[DeviceJob], float]] = None
+        # step 起始時間 -> 等待完成後更新 Circuit RRD 的設備
+        self._circuit_steps: Dict[float, _StepCircuits] = {}
+
+    def stop(self):
+        """要求排程器停止（等待執行中的收集完成）"""
+        self._stop.set()
+
+    def trigger(self, jobs: List[DeviceJob]):
+        """要求立即收集指定設備（可由其他執行緒呼叫）"""
+        self._triggered.extend(jobs)
+
+    def _jobs(self) -> List[DeviceJob]:
+        """取得本 step 要排程的工作"""
+        return build_jobs(self.config, self.area, open_inventory(self.config))
+
+    def _executor(self, max_workers: int) -> Executor:
+        """建立執行收集的 Executor"""
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+    def _submit(self, pool: Executor, job: DeviceJob) -> Future:
+        """提交單一設備收集"""
+        return pool.submit(run_device, job, self.config)
+
+    def due_time(self, job: DeviceJob, step_start: float) -> float:
+        """
+        計算設備在指定 step 內的取樣時間
+
+        Args:
+            job: 收集工作
+            step_start: step 起始時間（step 的整數倍）
+
+        Returns:
+            取樣時間（epoch 秒），保持在該 step 內
+        """
+        due = step_start + phase_offset(job.ip, self.step, self.spread)
+        if self.jitter > 0:
+            due += random.uniform(-self.jitter, self.jitter)
+        return min(max(due, step_start), step_start + self.step - 1)
+
+    def _plan_step(self, heap: list, step_start: float, not_before: float = 0):
+        """
+        將一個 step 內所有設備的取樣時間加入排程
+
+        Args:
+            heap: 排程 heap
+            step_start: step 起始時間
+            not_before: 取樣時間早於此時間的設備不排入（啟動時本 step 相位已過者，
+                由下一個 step 的排程負責，避免同一 step 排入兩次）
+        """
+        all_jobs = jobs = self._jobs()
+        if self.cluster is not None:
+            jobs = self.cluster.claim(all_jobs)
+        self.planned = jobs
+        # 已不在 BRAS-Map 或改由其他節點負責的設備不再輸出指標
+        self.dispatcher.registry.retain('device', [job.ip for job in jobs])
+        self._start_preflight(jobs)
+        planned = []
+        for job in jobs:
+            due = self.due_time(job, step_start)
+            if due < not_before:
+                continue
+            heapq.heappush(heap, (due, next(self._seq), job, step_start))
+            planned.append(job)
+        self._track_circuits(step_start, all_jobs, planned)
+        logger.info(f"排程 step {time.strftime('%H:%M:%S', time.localtime(step_start))}: "
+                    f"{len(planned)} 個設備")
+
+    def _track_circuits(self, step_start: float, all_jobs: List[DeviceJob],
+                        planned: List[DeviceJob]):
+        """記錄本 step 有電路的設備；更早的 step 仍未完成者以已有的結果更新"""
+        for started in [s for s in self._circuit_steps if s < step_start - self.step]:
+            self._write_circuits(started)
+
+        jobs = [job for job in planned if job.circuit_ports]
+        if not jobs:
+            return
+        planned_ips = {job.ip for job in planned}
+        others = [job for job in all_jobs if job.circuit_ports and job.ip not in planned_ips]
+        self._circuit_steps[step_start] = _StepCircuits(jobs, others, {job.ip for job in jobs})
+
+    def _record_circuit(self, step_start: Optional[float], job: DeviceJob,
+                        result: Optional[DeviceResult]):
+        """
+        記錄設備在指定 step 的結果，該 step 的設備全部完成時更新 Circuit RRD
+
+        Args:
+            step_start: 排程的 step（立即收集為 None，不計入電路）
+            job: 收集工作
+            result: 收集結果，略過本次取樣時為 None
+        """
+        step = self._circuit_steps.get(step_start)
+        if step is None or job.ip not in step.pending:
+            return
+        step.pending.discard(job.ip)
+        if result is not None:
+            step.results.append(result)
+        if not step.pending:
+            self._write_circuits(step_start)
+
+    def _write_circuits(self, step_start: float):
+        """以一個 step 的結果更新 Circuit RRD（缺少結果的電路略過）"""
+        step = self._circuit_steps.pop(step_start)
+        try:
+            self.dispatcher.write_circuits(step.jobs, step.results, step.others)
+        except Exception as e:
+            logger.error(f"更新 Circuit RRD 失敗: {e}", exc_info=True)
+
+    def _start_preflight(self, jobs: List[DeviceJob]):
+        """
+        於背景執行緒探測本 step 的設備
+
+        探測期間排程迴圈照常調度；探測完成前開始的收集沒有預檢結果，
+        由收集器自行測試連線
+        """
+        for job in jobs:
+            job.probe = None
+        if self._probing is not None:
+            logger.warning("上一次預檢尚未完成，略過本 step 的預檢")
+            return
+        targets = self.dispatcher.preflight_targets(jobs)
+        if targets:
+            future = self._probe_pool.submit(self.dispatcher.probe, targets)
+            self._probing = (future, jobs, time.time())
+
+    def _finish_preflight(self):
+        """預檢完成時於排程執行緒記錄結果（RTT 與收集歷史的 SQLite 連線不跨執行緒）"""
+        if self._probing is None or not self._probing[0].done():
+            return
+        future, jobs, start_time = self._probing
+        self._probing = None
+        try:
+            self.dispatcher.apply_preflight(jobs, future.result(), start_time)
+        except Exception as e:
+            logger.error(f"預檢失敗: {e}", exc_info=True)
+
+    def run(self, until: float = None):
+        """
+        執行排程迴圈直到 stop() 或指定時間
+
+        Args:
+            until: 結束時間（epoch 秒），None 表示持續執行
+        """
+        heap: list = []
+        ready: deque = deque()
+        running: Dict = {}
+        running_ips = set()
+        # 待執行設備 -> 排定的取樣時間與 step
+        ready_due: Dict[str, float] = {}
+        ready_step: Dict[str, Optional[float]] = {}
+        running_step: Dict[Future, Optional[float]] = {}
+        running_types: Dict[int, int] = {}
+
+        self._probe_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preflight')
+        now = time.time()
+        step_start = now - now % self.step
+        self._plan_step(heap, step_start, not_before=now)
+        next_plan = step_start + self.step
+
+        max_workers = self.dispatcher.max_workers
+        logger.info(
+            f"輪詢排程器啟動: step={self.step}s, spread={self.spread:.2f}, "
+            f"jitter=±{self.jitter}s, max_workers={max_workers}"
+        )
+
+        with self._executor(max_workers) as pool:
+            while not self._stop.is_set():
+                now = time.time()
+                if until is not None and now >= until:
+                    break
+
+                self._finish_preflight()
+
+                if now >= next_plan:
+                    self._plan_step(heap, next_plan)
+                    next_plan += self.step
+
+                while self._triggered:
+                    heapq.heappush(heap, (now, next(self._seq), self._triggered.popleft(), None))
+
+                # 到期的設備移入待執行佇列
+                while heap and heap[0][0] <= now:
+                    due, _, job, step_start = heapq.heappop(heap)
+                    if job.ip in running_ips or job.ip in ready_due:
+                        logger.warning(f"設備 {job.ip} 上一次收集尚未完成，略過本次取樣")
+                        self._record_circuit(step_start, job, None)
+                        continue
+                    ready.append(job)
+                    ready_due[job.ip] = due
+                    ready_step[job.ip] = step_start
+
+                # 依並行上限啟動
+                while ready and len(running) < max_workers:
+                    job = self.dispatcher.next_job(ready, running_types)
+                    if job is None:
+                        break
+                    lag = time.time() - ready_due.pop(job.ip)
+                    self.dispatcher.registry.set('scheduler_lag_seconds', round(lag, 3),
+                                                 device=job.ip, device_type=job.device_type)
+                    future = self._submit(pool, job)
+                    running[future] = job
+                    running_step[future] = ready_step.pop(job.ip)
+                    running_ips.add(job.ip)
+                    running_types[job.device_type] = running_types.get(job.device_type, 0) + 1
+                self.dispatcher.registry.set('dispatch_queue_depth', len(ready), queue='pending')
+                self.dispatcher.registry.set('dispatch_queue_depth', len(running), queue='running')
+
+                # 等待下一個到期時間或有收集完成
+                wake = min(heap[0][0] if heap else next_plan, next_plan)
+                if until is not None:
+                    wake = min(wake, until)
+                timeout = max(0.0, min(wake - time.time(), 1.0))
+
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        running_ips.discard(job.ip)
+                        running_types[job.device_type] -= 1
+                        result = self.dispatcher.finish(job, future)
+                        self._record_circuit(running_step.pop(future), job, result)
+                    if done:
+                        self.dispatcher.publish_metrics()
+                else:
+                    self._stop.wait(timeout)
+
+            if running:
+                logger.info(f"等待 {len(running)} 個執行中的收集完成")
+                for future in wait(running).done:
+                    job = running[future]
+                    self._record_circuit(running_step[future], job,
+                                         self.dispatcher.finish(job, future))
+                self.dispatcher.registry.set('dispatch_queue_depth', 0, queue='running')
+                self.dispatcher.publish_metrics()
+
+        # 預檢最長約一個 timeout，不等待
+        self._probe_pool.shutdown(wait=False)
+        self._probing = None
+        if self.cluster is not None:
+            self.cluster.leave()
+        logger.info("輪詢排程器已停止")
+
+
+def main():
+    """主程式"""
+    parser = argparse.ArgumentParser(
+        description='錯開相位的常駐輪詢排程器',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用範例:
+  python3 scheduler.py
+  python3 scheduler.py --area taipei_4 --jitter 5
+  python3 scheduler.py --show-phases
+        """
+    )
+
+    parser.add_argument('--config', help='配置檔案路徑（選用）')
+    parser.add_argument('--area', help='只收集指定區域')
+    parser.add_argument('--spread', type=float, help='相位分散範圍佔 step 的比例 (0-1)')
+    parser.add_argument('--jitter', type=float, help='隨機抖動上限（秒）')
+    parser.add_argument('--node-id', help='以指定節點 ID 參與多節點分散收集')
+    parser.add_argument('--show-phases', action='store_true', help='顯示各設備相位後結束')
+    parser.add_argument('--debug', action='store_true', help='啟用除錯模式')
+
+    args = parser.parse_args()
+
+    # 設定日誌
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        config = ConfigLoader(args.config) if args.config else ConfigLoader()
+        dispatcher = Dispatcher(config, history=RunHistory(config.dispatcher_history_db))
+        cluster = None
+        if config.cluster_enabled or args.node_id:
+            cluster = ClusterNode(config, args.node_id)
+        scheduler = PollScheduler(config, dispatcher, args.area, args.spread, args.jitter,
+                                  cluster)
+
+        if args.show_phases:
+            for job in sorted(build_jobs(config, args.area),
+                              key=lambda j: phase_offset(j.ip, scheduler.step, scheduler.spread)):
+                offset = phase_offset(job.ip, scheduler.step, scheduler.spread)
+                print(f"{offset:8.1f}s\t{job.ip}\ttype={job.device_type}")
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+        scheduler.run()
+        sys.exit(0)
+
+    except KeyboardInterrupt:
+        logger.warning("\n排程器被用戶中斷")
+        sys.exit(130)
+    except Exception as e:
+        logger.error(f"排程器執行失敗: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""
+rrdw - 統一命令列入口
+
+以 `python3 -m rrdw <子命令>` 執行（於安裝目錄下）：
+    collect     收集單一設備
+    dispatch    依 BRAS-Map 調度所有設備
+    validate    檢查配置、BRAS-Map 與 Map 檔案
+    bench       量測各模組冷啟動載入時間（-X importtime）
+
+各子命令只在執行時才載入所需模組，pysnmp 等較重的套件只在實際需要時載入。
+"""
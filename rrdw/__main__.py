@@ -0,0 +1,7 @@
+"""python3 -m rrdw 入口"""
+
+import sys
+
+from rrdw.cli import main
+
+sys.exit(main())
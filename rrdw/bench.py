@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+bench.py - 冷啟動載入時間量測
+
+以 `python -X importtime -c "import <模組>"` 在新的直譯器中載入模組，
+解析 stderr 的 importtime 輸出，取得模組的累計載入時間，
+並檢查是否載入了 pysnmp 等較重的套件。
+"""
+
+import os
+import sys
+import time
+import subprocess
+from dataclasses import dataclass, field
+from statistics import median
+from typing import Dict, List, Sequence, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 預設量測的模組（各命令列入口實際載入的模組）
+DEFAULT_MODULES = (
+    'rrdw.cli',
+    'core.config_loader',
+    'core.snmp_helper',
+    'collectors.registry',
+    'orchestrator.dispatcher',
+    'orchestrator.daemon',
+)
+
+# 只應在實際需要時才載入的套件
+HEAVY_PACKAGES = ('pysnmp', 'pymysql', 'numpy', 'rrdtool')
+
+
+@dataclass
+class ImportProfile:
+    """單一模組的載入時間量測結果"""
+    module: str
+    import_ms: float = 0          # 模組累計載入時間（中位數）
+    process_ms: float = 0         # 直譯器啟動至結束（中位數）
+    heavy: List[str] = field(default_factory=list)
+    # 各模組本身載入時間（最後一次量測）: [(模組, ms)]
+    slowest: List[Tuple[str, float]] = field(default_factory=list)
+
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """
+    解析 -X importtime 輸出
+
+    格式: "import time:      self [us] |  cumulative | imported package"
+
+    Returns:
+        {模組: (self 微秒, cumulative 微秒)}
+    """
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 標題行
+        times[parts[2].strip()] = (self_us, cumulative_us)
+    return times
+
+
+def _run_once(module: str, python: str) -> Tuple[Dict[str, Tuple[int, int]], float]:
+    """在新的直譯器中載入模組，返回 (importtime 結果, 程序耗時 ms)"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(f"載入 {module} 失敗: {lines[-1] if lines else proc.returncode}")
+    return parse_importtime(proc.stderr), elapsed
+
+
+def profile_import(module: str, runs: int = 5, top: int = 5,
+                   python: str = sys.executable) -> ImportProfile:
+    """
+    量測模組的冷啟動載入時間
+
+    每次都使用新的直譯器（不共用已載入的模組），取中位數
+
+    Args:
+        module: 模組名稱
+        runs: 量測次數
+        top: 記錄本身載入時間最長的模組數
+        python: Python 直譯器
+
+    Returns:
+        量測結果
+    """
+    import_times = []
+    process_times = []
+    times: Dict[str, Tuple[int, int]] = {}
+    for _ in range(max(1, runs)):
+        times, elapsed = _run_once(module, python)
+        import_times.append(times.get(module, (0, 0))[1] / 1000)
+        process_times.append(elapsed)
+
+    heavy = sorted({name.split('.')[0] for name in times} & set(HEAVY_PACKAGES))
+    slowest = sorted(((name, self_us / 1000) for name, (self_us, _) in times.items()),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return ImportProfile(module, median(import_times), median(process_times), heavy, slowest)
+
+
+def run(modules: Sequence[str] = DEFAULT_MODULES, runs: int = 5, top: int = 0,
+        max_ms: float = None) -> int:
+    """
+    量測並輸出各模組的載入時間
+
+    Args:
+        modules: 模組名稱
+        runs: 每個模組的量測次數
+        top: 列出本身載入時間最長的模組數（0 則不列出）
+        max_ms: 載入時間上限（毫秒），超過則返回 1
+
+    Returns:
+        結束碼
+    """
+    status = 0
+    print(f"{'模組':<28}{'載入(ms)':>10}{'程序(ms)':>10}  重量級套件")
+    for module in modules:
+        try:
+            profile = profile_import(module, runs, top)
+        except RuntimeError as e:
+            print(f"✗ {e}")
+            status = 1
+            continue
+
+        over = max_ms is not None and profile.import_ms > max_ms
+        mark = '✗' if over else ' '
+        print(f"{mark}{module:<27}{profile.import_ms:>10.1f}{profile.process_ms:>10.1f}  "
+              f"{', '.join(profile.heavy) or '-'}")
+        for name, ms in profile.slowest:
+            print(f"    {name:<40}{ms:>8.1f}")
+        if over:
+            status = 1
+
+    return status
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+cli.py - python3 -m rrdw 子命令
+
+本模組只載入標準函式庫，各子命令在執行時才載入所需的模組：
+collect 不做 pysnmp GET 時不載入 pysnmp，validate / bench 完全不需要 SNMP。
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+logger = logging.getLogger(__name__)
+
+PROG = 'python3 -m rrdw'
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _load_config(path: str = None):
+    from core.config_loader import ConfigLoader
+    return ConfigLoader(path) if path else ConfigLoader()
+
+
+def cmd_collect(args) -> int:
+    """收集單一設備"""
+    from collectors.registry import get_collector_class
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format=LOG_FORMAT)
+    config = _load_config(args.config)
+
+    device_type = args.type
+    if device_type is None:
+        # 未指定類型時由 BRAS-Map 查詢
+        types = {row['ip']: row['device_type'] for row in config.load_bras_map()}
+        device_type = types.get(args.ip)
+        if device_type is None:
+            logger.error(f"BRAS-Map 中沒有設備 {args.ip}，請以 --type 指定設備類型")
+            return 2
+
+    collector_class = get_collector_class(device_type)
+    if collector_class is None:
+        logger.error(f"不支援的設備類型: {device_type}")
+        return 2
+
+    map_file = args.map or config.get_map_file_path(args.ip)
+    try:
+        collector = collector_class(args.ip, map_file, config)
+        success = collector.run()
+    except KeyboardInterrupt:
+        logger.warning("收集被用戶中斷")
+        return 130
+
+    stats = collector.stats
+    logger.info(
+        f"完成: 成功={stats.success}, 失敗={stats.failed}, 跳過={stats.skipped}, "
+        f"總數={stats.total}, 耗時={stats.duration:.1f}秒, 成功率={stats.success_rate:.1f}%"
+    )
+    if args.json:
+        print(json.dumps(collector.run_record(), ensure_ascii=False, indent=2))
+    return 0 if success else 1
+
+
+def cmd_dispatch(args) -> int:
+    """依 BRAS-Map 調度所有設備（參數同 orchestrator/dispatcher.py）"""
+    from orchestrator import dispatcher
+
+    try:
+        dispatcher.main(args.args, prog=f'{PROG} dispatch')
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    return 0
+
+
+def _validate_map(ip: str, device_type: int, map_file: str, config) -> List[str]:
+    """
+    檢查單一設備
+
+    Returns:
+        問題列表（空列表表示正常）
+    """
+    from collectors.registry import get_collector_class
+    from core.interface_codec import get_template
+    from core.map_cache import load_map
+
+    problems = []
+    template = get_template(device_type)
+    if get_collector_class(device_type) is None or template is None:
+        problems.append(f"不支援的設備類型 {device_type}")
+
+    if config.database_map_source:
+        print(f"  {ip}\ttype={device_type}\t用戶由資料庫載入")
+        return problems
+
+    if not os.path.exists(map_file):
+        problems.append(f"Map 檔案不存在: {map_file}")
+        return problems
+
+    with open(map_file, 'rb') as f:
+        lines = sum(1 for line in f if line.strip() and not line.strip().startswith(b'#'))
+    compiled = load_map(map_file, use_cache=False)
+
+    invalid = lines - len(compiled)
+    if invalid:
+        problems.append(f"{invalid} 行格式錯誤")
+    duplicates = len(compiled) - len(set(compiled.usernames))
+    if duplicates:
+        problems.append(f"{duplicates} 個重複的用戶名稱")
+
+    sample = ''
+    if template is not None and len(compiled):
+        c = compiled.columns
+        sample = template.format(c['slot'][0], c['port'][0], c['vpi'][0], c['vci'][0])
+    print(f"  {ip}\ttype={device_type}\t用戶={len(compiled)}\t{sample}")
+    return problems
+
+
+def cmd_validate(args) -> int:
+    """檢查配置、BRAS-Map 與 Map 檔案"""
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING, format=LOG_FORMAT)
+    config = _load_config(args.config)
+
+    if args.map:
+        if args.type is None:
+            print("✗ 檢查單一 Map 檔案需要以 --type 指定設備類型")
+            return 2
+        devices = [(args.ip or '-', args.type, args.map)]
+    else:
+        devices = {}
+        for row in config.load_bras_map():
+            if args.area and row['area'] != args.area:
+                continue
+            devices.setdefault(row['ip'], (row['ip'], row['device_type'],
+                                           config.get_map_file_path(row['ip'])))
+        devices = list(devices.values())
+        if not devices:
+            print(f"✗ BRAS-Map 沒有設備: {config.bras_map_file}")
+            return 1
+
+    failed = 0
+    for ip, device_type, map_file in devices:
+        for problem in _validate_map(ip, device_type, map_file, config):
+            print(f"✗ {ip}: {problem}")
+            failed += 1
+
+    if failed:
+        print(f"✗ {len(devices)} 個設備，{failed} 個問題")
+        return 1
+    print(f"✓ {len(devices)} 個設備檢查通過")
+    return 0
+
+
+def cmd_bench(args) -> int:
+    """量測冷啟動載入時間"""
+    from rrdw import bench
+    return bench.run(args.modules or bench.DEFAULT_MODULES, args.runs, args.top, args.max_ms)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """建立命令列解析器"""
+    parser = argparse.ArgumentParser(
+        prog=PROG,
+        description='RRDW 流量收集系統',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用範例:
+  python3 -m rrdw collect --ip 61.64.191.78
+  python3 -m rrdw collect --ip 61.64.191.78 --type 3 --map /path/to/map.txt
+  python3 -m rrdw dispatch --area taipei_4 --dry-run
+  python3 -m rrdw validate
+  python3 -m rrdw bench --top 5
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', metavar='<子命令>')
+    subparsers.required = True
+
+    collect = subparsers.add_parser('collect', help='收集單一設備')
+    collect.add_argument('--ip', required=True, help='設備 IP 位址')
+    collect.add_argument('--type', type=int, help='設備類型（未指定則由 BRAS-Map 查詢）')
+    collect.add_argument('--map', help='Map 檔案路徑（未指定則使用 map_dir/map_<IP>.txt）')
+    collect.add_argument('--config', help='配置檔案路徑（選用）')
+    collect.add_argument('--json', action='store_true',
+                         help='輸出執行紀錄（各階段耗時、SNMP/RRD 計數）為 JSON')
+    collect.add_argument('--debug', action='store_true', help='啟用除錯模式')
+    collect.set_defaults(func=cmd_collect)
+
+    # 其餘參數（包含 --help）原樣交給 dispatcher.py 解析
+    dispatch = subparsers.add_parser('dispatch', add_help=False,
+                                     help='依 BRAS-Map 調度所有設備（參數同 dispatcher.py）')
+    dispatch.set_defaults(func=cmd_dispatch, passthrough=True)
+
+    validate = subparsers.add_parser('validate', help='檢查配置、BRAS-Map 與 Map 檔案')
+    validate.add_argument('--config', help='配置檔案路徑（選用）')
+    validate.add_argument('--area', help='只檢查指定區域')
+    validate.add_argument('--map', help='只檢查指定的 Map 檔案')
+    validate.add_argument('--type', type=int, help='設備類型（搭配 --map）')
+    validate.add_argument('--ip', help='設備 IP（搭配 --map，僅供顯示）')
+    validate.add_argument('--debug', action='store_true', help='啟用除錯模式')
+    validate.set_defaults(func=cmd_validate)
+
+    bench = subparsers.add_parser('bench', help='量測各模組冷啟動載入時間（-X importtime）')
+    bench.add_argument('modules', nargs='*', help='模組名稱（未指定則量測各入口模組）')
+    bench.add_argument('--runs', type=int, default=5, help='每個模組的量測次數（取中位數）')
+    bench.add_argument('--top', type=int, default=0, help='列出本身載入時間最長的 N 個模組')
+    bench.add_argument('--max-ms', type=float, help='載入時間上限（毫秒），超過則結束碼為 1')
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    主程式
+
+    Args:
+        argv: 命令列參數，None 則使用 sys.argv
+
+    Returns:
+        結束碼
+    """
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if getattr(args, 'passthrough', False):
+        args.args = extra
+    elif extra:
+        parser.error(f"無法辨識的參數: {' '.join(extra)}")
+
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.error(f"{args.command} 執行失敗: {e}", exc_info=True)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
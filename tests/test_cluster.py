@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+test_cluster.py - 多節點分散收集測試
+
+以多個本機進程模擬收集節點，共用暫存目錄中的檔案式成員清單，
+確認每台設備恰好由一個節點認領，節點離開或心跳逾時後由其他節點接手。
+
+執行: python3 -m pytest tests/test_cluster.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from collections import namedtuple
+from types import SimpleNamespace
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from orchestrator.cluster import ClusterNode
+
+# 只需要 ip 與 circuits 欄位（與 DeviceJob 相同）
+Job = namedtuple('Job', 'ip circuits')
+
+NODES = 4
+TTL = 2.0
+
+
+def make_jobs():
+    """200 台設備，每 10 台中有 2 台共用電路"""
+    jobs = []
+    for i in range(200):
+        circuits = [f"CIR{i}"]
+        if i % 10 == 1:
+            circuits.append(f"CIR{i - 1}")
+        jobs.append(Job(f"10.0.{i // 250}.{i % 250}", circuits))
+    return jobs
+
+
+def node_main(node_id, directory, connection):
+    """節點進程：依序執行主進程送來的指令"""
+    config = SimpleNamespace(cluster_node_id=node_id, cluster_membership_dir=directory,
+                             cluster_member_ttl=TTL)
+    node = ClusterNode(config)
+    jobs = make_jobs()
+    while True:
+        command = connection.recv()
+        if command == 'claim':
+            connection.send(sorted(job.ip for job in node.claim(jobs)))
+        elif command == 'heartbeat':
+            node.membership.heartbeat()
+            connection.send(None)
+        elif command == 'leave':
+            node.leave()
+            connection.send(None)
+        else:
+            connection.send(None)
+            return
+
+
+class ClusterProcessTest(unittest.TestCase):
+    """以多個進程共用成員目錄"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='rrdw-cluster-')
+        context = multiprocessing.get_context('spawn')
+        self.nodes = {}
+        for n in range(NODES):
+            node_id = f"node-{n}"
+            parent, child = context.Pipe()
+            process = context.Process(target=node_main, args=(node_id, self.directory, child),
+                                      daemon=True)
+            process.start()
+            self.nodes[node_id] = (process, parent)
+
+    def tearDown(self):
+        for process, connection in self.nodes.values():
+            if process.is_alive():
+                connection.send('exit')
+                process.join(10)
+            if process.is_alive():
+                process.terminate()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def send(self, node_ids, command):
+        """對多個節點送出指令並取得回應"""
+        for node_id in node_ids:
+            self.nodes[node_id][1].send(command)
+        return {node_id: self.nodes[node_id][1].recv() for node_id in node_ids}
+
+    def claim_all(self, node_ids):
+        """所有節點先更新心跳再認領，各節點看到相同的成員清單"""
+        self.send(node_ids, 'heartbeat')
+        return self.send(node_ids, 'claim')
+
+    def assert_partition(self, claims):
+        """每台設備恰好由一個節點認領，共用電路的設備歸屬同一節點"""
+        owners = {}
+        for node_id, ips in claims.items():
+            for ip in ips:
+                self.assertNotIn(ip, owners, f"{ip} 同時由 {owners.get(ip)} 與 {node_id} 認領")
+                owners[ip] = node_id
+        jobs = make_jobs()
+        self.assertEqual(set(owners), {job.ip for job in jobs})
+        for i in range(1, len(jobs), 10):
+            self.assertEqual(owners[jobs[i].ip], owners[jobs[i - 1].ip])
+        return owners
+
+    def test_every_device_claimed_once(self):
+        claims = self.claim_all(list(self.nodes))
+        owners = self.assert_partition(claims)
+        # 每個節點都分到設備
+        self.assertEqual(set(owners.values()), set(self.nodes))
+
+    def test_reassigned_when_node_leaves(self):
+        before = self.assert_partition(self.claim_all(list(self.nodes)))
+
+        self.send(['node-0'], 'leave')
+        remaining = [node_id for node_id in self.nodes if node_id != 'node-0']
+        after = self.assert_partition(self.claim_all(remaining))
+
+        self.assertNotIn('node-0', after.values())
+        # 只有離開節點的設備移動
+        for ip, node_id in before.items():
+            if node_id != 'node-0':
+                self.assertEqual(after[ip], node_id)
+
+    def test_reassigned_when_node_goes_stale(self):
+        before = self.assert_partition(self.claim_all(list(self.nodes)))
+
+        # node-3 停止更新心跳，超過 TTL 後視為離線
+        time.sleep(TTL + 0.5)
+        remaining = [node_id for node_id in self.nodes if node_id != 'node-3']
+        after = self.assert_partition(self.claim_all(remaining))
+
+        self.assertNotIn('node-3', after.values())
+        for ip, node_id in before.items():
+            if node_id != 'node-3':
+                self.assertEqual(after[ip], node_id)
+
+        # 恢復心跳後重新認領原本的設備
+        restored = self.assert_partition(self.claim_all(list(self.nodes)))
+        self.assertEqual(restored, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+test_import_time.py - 冷啟動載入測試
+
+以 `python -X importtime` 在新的直譯器中執行命令列入口，解析 importtime 輸出，
+確認 pysnmp、numpy 與 SQLite 相關模組只在實際需要時才載入。
+
+執行: python3 -m pytest tests/test_import_time.py
+"""
+
+import os
+import sys
+import subprocess
+import unittest
+
+# 添加父目錄到路徑
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from rrdw.bench import HEAVY_PACKAGES, parse_importtime
+
+# SQLite 與使用 SQLite 的模組（斷路器、RTT、清冊、RADIUS 來源、收集歷史）
+SQLITE_MODULES = (
+    'sqlite3',
+    'core.device_breaker',
+    'core.rtt_estimator',
+    'core.inventory',
+    'core.radius_source',
+    'orchestrator.history',
+)
+
+
+def import_times(*args):
+    """以 -X importtime 執行，返回 {模組: (self 微秒, cumulative 微秒)}"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + list(args),
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    if proc.returncode != 0:
+        raise AssertionError(f"{' '.join(args)} 結束碼 {proc.returncode}:\n{proc.stderr}")
+    return parse_importtime(proc.stderr)
+
+
+class ImportTimeTest(unittest.TestCase):
+    """命令列入口不載入較重的套件"""
+
+    def assert_not_loaded(self, times, modules):
+        for module in modules:
+            loaded = [name for name in times
+                      if name == module or name.startswith(module + '.')]
+            self.assertEqual(loaded, [], f"不應載入 {module}")
+
+    def test_cli_help(self):
+        times = import_times('-m', 'rrdw', '--help')
+        self.assertIn('rrdw.cli', times)
+        self.assert_not_loaded(times, HEAVY_PACKAGES + SQLITE_MODULES)
+        # --help 不需要任何收集或調度模組
+        self.assert_not_loaded(times, ('core', 'collectors', 'orchestrator'))
+
+    def test_collector_modules(self):
+        # collect 子命令載入的收集器（未啟用斷路器、RTT、清冊、RADIUS 來源時）
+        times = import_times('-c', 'import collectors.registry')
+        self.assertIn('collectors.base_collector', times)
+        self.assert_not_loaded(times, HEAVY_PACKAGES + SQLITE_MODULES)
+
+
+if __name__ == '__main__':
+    unittest.main()
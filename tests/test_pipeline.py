@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+test_pipeline.py - 串流管線失敗處理測試
+
+以假的 SNMPHelper 與收集器執行 WalkPipeline，分別在 walk、join 與 RRD 寫入
+階段注入錯誤，確認 run() 在時限內結束並拋出該錯誤，snmpwalk 被終止。
+
+執行: python3 -m pytest tests/test_pipeline.py
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.pipeline import WalkPipeline
+
+IN_OID = 'in'
+OUT_OID = 'out'
+USERS = 1000
+
+
+class FakeSNMP:
+    """不斷產生計數器直到被取消的 snmpwalk_stream"""
+
+    OID_IF_HC_IN_OCTETS = IN_OID
+    OID_IF_HC_OUT_OCTETS = OUT_OID
+
+    def __init__(self, fail_oid=None, malformed=False, endless=True):
+        self.fail_oid = fail_oid
+        self.malformed = malformed
+        self.endless = endless
+        self.truncated_walks = set()
+        self.cancelled = threading.Event()
+        self.closed = []
+
+    def snmpwalk_stream(self, oid, batch_size=500, deadline=None):
+        try:
+            if_index = 0
+            while not self.cancelled.is_set():
+                if oid == self.fail_oid:
+                    raise RuntimeError('walk failed')
+                if self.malformed:
+                    yield [(if_index + 1,)]
+                else:
+                    yield [(if_index + n, 1000 + n) for n in range(1, 11)]
+                if_index += 10
+                if not self.endless and if_index >= USERS:
+                    return
+        finally:
+            self.closed.append(oid)
+
+    def cancel_streams(self):
+        self.cancelled.set()
+
+
+class FakeCollector:
+    """WalkPipeline 使用的收集器介面"""
+
+    def __init__(self, snmp, write_error=None):
+        self.snmp = snmp
+        self.users = SimpleNamespace(if_index=list(range(1, USERS + 1)))
+        self.stats = SimpleNamespace(phase=self._phase)
+        self.write_error = write_error
+        self.written = 0
+
+    @contextmanager
+    def _phase(self, name):
+        yield
+
+    def _write_user_counters(self, positions, inbound, outbound):
+        if self.write_error is not None:
+            raise self.write_error
+        self.written += len(positions)
+        return len(positions), {}
+
+    def _circuit_totals(self, positions, inbound, outbound):
+        return {}
+
+
+class WalkPipelineFailureTest(unittest.TestCase):
+    """任一階段失敗時 run() 結束並拋出錯誤"""
+
+    def run_pipeline(self, collector):
+        """於背景執行緒執行 run()，返回 (結果, 錯誤)；逾時視為卡住"""
+        outcome = {}
+
+        def target():
+            try:
+                outcome['result'] = WalkPipeline(collector, queue_size=2, batch_size=10).run()
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        start = time.monotonic()
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "WalkPipeline.run() 未結束")
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertFalse([t for t in threading.enumerate()
+                          if t.name in ('walk-in', 'walk-out', 'join')], "管線執行緒未結束")
+        return outcome.get('result'), outcome.get('error')
+
+    def test_success(self):
+        collector = FakeCollector(FakeSNMP(endless=False))
+        result, error = self.run_pipeline(collector)
+        self.assertIsNone(error)
+        self.assertEqual(result[0], USERS)
+
+    def test_walk_failure(self):
+        snmp = FakeSNMP(fail_oid=IN_OID)
+        result, error = self.run_pipeline(FakeCollector(snmp))
+        self.assertIsInstance(error, RuntimeError)
+        self.assertTrue(snmp.cancelled.is_set())
+        self.assertEqual(sorted(snmp.closed), [IN_OID, OUT_OID])
+
+    def test_join_failure(self):
+        snmp = FakeSNMP(malformed=True)
+        result, error = self.run_pipeline(FakeCollector(snmp))
+        self.assertIsInstance(error, ValueError)
+        self.assertTrue(snmp.cancelled.is_set())
+        self.assertEqual(sorted(snmp.closed), [IN_OID, OUT_OID])
+
+    def test_write_failure(self):
+        snmp = FakeSNMP()
+        result, error = self.run_pipeline(FakeCollector(snmp, write_error=OSError('disk full')))
+        self.assertIsInstance(error, OSError)
+        self.assertTrue(snmp.cancelled.is_set())
+        self.assertEqual(sorted(snmp.closed), [IN_OID, OUT_OID])
+
+
+if __name__ == '__main__':
+    unittest.main()
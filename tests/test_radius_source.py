@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+test_radius_source.py - RADIUS 資料庫用戶來源測試
+
+以暫存 SQLite（driver = sqlite）建立 subscriber_map 資料表，確認
+RadiusMapSource 的載入、各設備用戶數與變更水位。
+
+執行: python3 -m pytest tests/test_radius_source.py
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+# 添加父目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.radius_source import RadiusMapSource
+
+DEVICE = '10.0.0.1'
+OTHER = '10.0.0.2'
+
+# username, device_ip, slot, port, vpi, vci, download, upload, account, updated_at
+ROWS = [
+    ('u1', DEVICE, 1, 0, 0, 101, 102400, 40960, 'acc1', '2024-01-01 00:00:00'),
+    ('u2', DEVICE, 1, 0, 0, 102, 51200, 10240, 'acc2', '2024-01-01 00:00:00'),
+    ('u3', DEVICE, 2, 1, 0, 201, 25600, 5120, None, '2024-01-02 00:00:00'),
+    ('u4', OTHER, 3, 0, 0, 300, 10240, 2048, 'acc4', '2024-01-01 00:00:00'),
+    # 不合法：欄位缺漏、非數字、超出範圍、沒有用戶名稱
+    ('bad1', DEVICE, None, 0, 0, 1, 1024, 512, 'x', '2024-01-01 00:00:00'),
+    ('bad2', DEVICE, 'a', 0, 0, 1, 1024, 512, 'x', '2024-01-01 00:00:00'),
+    ('bad3', DEVICE, 1, 0, 0, 2 ** 31, 1024, 512, 'x', '2024-01-01 00:00:00'),
+    ('bad4', DEVICE, 1, 0, 0, 5, -1, 512, 'x', '2024-01-01 00:00:00'),
+    (None, DEVICE, 1, 0, 0, 6, 1024, 512, 'x', '2024-01-01 00:00:00'),
+]
+
+
+class RadiusMapSourceTest(unittest.TestCase):
+    """以本機 SQLite 代替 RADIUS 資料庫"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='rrdw-radius-')
+        self.db_path = os.path.join(self.directory, 'radius.sqlite')
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE subscriber_map (username TEXT, device_ip TEXT, slot, port, vpi, "
+                "vci, download, upload, account TEXT, updated_at TEXT)"
+            )
+            conn.executemany("INSERT INTO subscriber_map VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             ROWS)
+        conn.close()
+        config = SimpleNamespace(
+            database_driver='sqlite', database_path=self.db_path,
+            database_map_table='subscriber_map', database_chunk_size=2
+        )
+        self.source = RadiusMapSource(config)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def execute(self, sql, params=()):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(sql, params)
+        conn.close()
+
+    def test_load(self):
+        namer = lambda u: f"ge-{u.slot}/{u.port}/{u.vpi}.{u.vci}"
+        with self.assertLogs('core.radius_source', 'WARNING') as logs:
+            users = self.source.load(DEVICE, namer=namer)
+        self.assertIn('5 筆', logs.output[0])
+
+        self.assertEqual([user.username for user in users], ['u1', 'u2', 'u3'])
+        u1, u2, u3 = users
+        self.assertEqual((u1.slot, u1.port, u1.vpi, u1.vci), (1, 0, 0, 101))
+        self.assertEqual((u2.download, u2.upload, u2.account), (51200, 10240, 'acc2'))
+        self.assertEqual(u3.account, '')
+        self.assertEqual(u3.interface_name, 'ge-2/1/0.201')
+        self.assertIsNone(u3.if_index)
+
+    def test_load_unknown_device(self):
+        self.assertEqual(len(self.source.load('10.9.9.9')), 0)
+
+    def test_counts(self):
+        # counts() 計算資料表的所有列（不合法的列於載入時才略過）
+        self.assertEqual(self.source.counts(), {DEVICE: 8, OTHER: 1})
+
+    def test_watermark(self):
+        initial = self.source.watermark(DEVICE)
+        other = self.source.watermark(OTHER)
+        self.assertEqual(self.source.watermark(DEVICE), initial)
+
+        # 新增
+        self.execute("INSERT INTO subscriber_map VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     ('u5', DEVICE, 1, 0, 0, 105, 1024, 512, 'acc5', '2024-01-03 00:00:00'))
+        added = self.source.watermark(DEVICE)
+        self.assertNotEqual(added, initial)
+        self.assertEqual(self.source.watermark(DEVICE), added)
+
+        # 更新（資料庫更新 updated_at）
+        self.execute("UPDATE subscriber_map SET download = 2048, updated_at = ? WHERE username = 'u1'",
+                     ('2024-01-04 00:00:00',))
+        updated = self.source.watermark(DEVICE)
+        self.assertNotEqual(updated, added)
+
+        # 刪除（非最後更新的用戶）
+        self.execute("DELETE FROM subscriber_map WHERE username = 'u2'")
+        deleted = self.source.watermark(DEVICE)
+        self.assertNotEqual(deleted, updated)
+        self.assertEqual(self.source.watermark(DEVICE), deleted)
+
+        # 其他設備不受影響
+        self.assertEqual(self.source.watermark(OTHER), other)
+
+
+if __name__ == '__main__':
+    unittest.main()
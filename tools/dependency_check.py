@@ -68,6 +68,12 @@ def check_python_packages():
     
     optional_packages = {
         'rrdtool': '0.1.0',
+        'numpy': None,
+    }
+    
+    optional_usage = {
+        'rrdtool': '用於 Python RRD 綁定',
+        'numpy': '用於向量化計數器合併',
     }
     
     all_ok = True
@@ -91,7 +97,7 @@ def check_python_packages():
             version = getattr(mod, '__version__', 'Unknown')
             print_success(f"{package}: {version}")
         except ImportError:
-            print_warning(f"{package}: 未安裝 (可選，用於 Python RRD 綁定)")
+            print_warning(f"{package}: 未安裝 (可選，{optional_usage[package]})")
     
     return all_ok
 
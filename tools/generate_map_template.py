@@ -3,12 +3,19 @@
 generate_map_template.py - Map 檔案範本產生器
 
 根據 SNMP 查詢結果產生 Map 檔案範本
+
+指定 --config 且啟用清冊（[inventory] enabled）時，由清冊查詢設備類型，
+並略過已有用戶的介面，不需解析 BRAS-Map 與既有的 Map 檔案
 """
 
 import sys
 import argparse
 import os
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.interface_codec import KEY_FIELDS, get_template
 
 try:
     from pysnmp.hlapi import (
@@ -74,7 +81,7 @@ def get_interfaces(host: str, community: str, timeout: int = 5) -> List[Dict]:
 
 def parse_interface_name(if_name: str, device_type: int) -> Dict:
     """
-    解析介面名稱
+    解析介面名稱（使用收集器相同的介面範本，見 core/interface_codec.py）
     
     Args:
         if_name: 介面名稱
@@ -85,49 +92,32 @@ def parse_interface_name(if_name: str, device_type: int) -> Dict:
     """
     # E320: ge-1/2/0.3490
     # MX/ACX: ge-1/0/2:3490
+    template = get_template(device_type)
+    key = template.parse(if_name) if template else None
+    if key is None:
+        return None
+    return dict(zip(KEY_FIELDS, key))
+
+
+def load_inventory(config_file: str):
+    """
+    載入並更新清冊
     
-    if device_type == 3:  # E320
-        # 格式: ge-slot/port/pic.vci 或 xe-slot/port/pic.vci
-        if '.' not in if_name:
-            return None
-        
-        try:
-            # 移除介面類型前綴
-            parts = if_name.split('-', 1)[1]  # 移除 ge- 或 xe-
-            path, vci = parts.split('.')
-            slot, port, pic = path.split('/')
-            
-            return {
-                'slot': int(slot),
-                'port': int(port),
-                'vpi': int(pic),  # E320 的 PIC 對應 VPI
-                'vci': int(vci)
-            }
-        except:
-            return None
+    Returns:
+        清冊，配置未啟用清冊時返回 None
+    """
+    from core.config_loader import ConfigLoader
+    from core.inventory import open_inventory
     
-    else:  # MX/ACX
-        # 格式: ge-fpc/pic/port:vci
-        if ':' not in if_name:
-            return None
-        
-        try:
-            parts = if_name.split('-', 1)[1]
-            path, vci = parts.split(':')
-            fpc, pic, port = path.split('/')
-            
-            return {
-                'slot': int(fpc),   # FPC → Slot
-                'port': int(port),
-                'vpi': int(pic),    # PIC → VPI
-                'vci': int(vci)
-            }
-        except:
-            return None
+    inventory = open_inventory(ConfigLoader(config_file))
+    if inventory is None:
+        print("⚠ 配置未啟用清冊（[inventory] enabled），不查詢既有用戶")
+    return inventory
 
 
 def generate_map_file(host: str, community: str, device_type: int, 
-                     output_file: str, timeout: int = 5):
+                     output_file: str, timeout: int = 5,
+                     used_ports: Set[Tuple[int, int, int, int]] = frozenset()):
     """
     產生 Map 檔案範本
     
@@ -137,7 +127,13 @@ def generate_map_file(host: str, community: str, device_type: int,
         device_type: 設備類型
         output_file: 輸出檔案路徑
         timeout: SNMP 超時時間
+        used_ports: 已有用戶的 (slot, port, vpi, vci)，不列入範本
     """
+    template = get_template(device_type)
+    if template is None:
+        print(f"✗ 不支援的設備類型 {device_type}")
+        return False
+    
     # 取得介面清單
     interfaces = get_interfaces(host, community, timeout)
     
@@ -145,15 +141,20 @@ def generate_map_file(host: str, community: str, device_type: int,
         print("✗ 無法取得介面清單")
         return False
     
-    # 篩選有效的 VLAN 介面
-    valid_interfaces = []
-    for iface in interfaces:
-        parsed = parse_interface_name(iface['name'], device_type)
-        if parsed:
-            valid_interfaces.append({
-                'name': iface['name'],
-                'parsed': parsed
-            })
+    # 篩選有效的 VLAN 介面（整張介面表一次解析）
+    table = {iface['index']: iface['name'] for iface in interfaces}
+    resolved = template.resolve(table)
+    ambiguous = sum(1 for if_index in resolved.values() if if_index is None)
+    if ambiguous:
+        print(f"⚠ {ambiguous} 組 slot/port/vpi/vci 對應多個介面，已略過")
+    used = sum(1 for key in resolved if key in used_ports)
+    if used:
+        print(f"✓ 略過 {used} 個已有用戶的介面")
+    valid_interfaces = [
+        {'name': table[if_index], 'parsed': dict(zip(KEY_FIELDS, key))}
+        for key, if_index in sorted(resolved.items(), key=lambda item: item[1] or 0)
+        if if_index is not None and key not in used_ports
+    ]
     
     if not valid_interfaces:
         print("✗ 沒有找到有效的 VLAN 介面")
@@ -228,6 +229,10 @@ def main():
   python3 generate_map_template.py --host 61.64.191.78 --type 3 \\
     --output map_61.64.191.78.txt
   
+  # 由清冊查詢設備類型，並略過已有用戶的介面
+  python3 generate_map_template.py --host 61.64.191.78 \
+    --config ../config/config.ini --output map_new_users.txt
+  
   # 指定 community 和 timeout
   python3 generate_map_template.py --host 61.64.191.78 --type 3 \\
     --community private --timeout 10 \\
@@ -242,14 +247,28 @@ def main():
     )
     
     parser.add_argument('--host', required=True, help='設備 IP 位址')
-    parser.add_argument('--type', type=int, required=True, choices=[1,2,3,4],
-                       help='設備類型 (1=MX240, 2=MX960, 3=E320, 4=ACX7024)')
+    parser.add_argument('--type', type=int, choices=[1,2,3,4],
+                       help='設備類型 (1=MX240, 2=MX960, 3=E320, 4=ACX7024)；'
+                            '指定 --config 時可由清冊查詢')
     parser.add_argument('--output', required=True, help='輸出檔案路徑')
     parser.add_argument('--community', default='public', help='SNMP Community')
     parser.add_argument('--timeout', type=int, default=5, help='SNMP 超時時間（秒）')
+    parser.add_argument('--config', help='配置檔案路徑（查詢清冊）')
     
     args = parser.parse_args()
     
+    # 由清冊查詢設備類型與已有用戶的介面
+    used_ports = frozenset()
+    inventory = load_inventory(args.config) if args.config else None
+    if inventory is not None:
+        if args.type is None:
+            args.type = inventory.device_type(args.host)
+            if args.type is not None:
+                print(f"✓ 清冊中的設備類型: {args.type}")
+        used_ports = inventory.device_ports(args.host)
+    if args.type is None:
+        parser.error('請指定 --type（清冊中沒有此設備）')
+    
     # 檢查輸出目錄
     output_dir = os.path.dirname(args.output)
     if output_dir and not os.path.exists(output_dir):
@@ -262,7 +281,8 @@ def main():
         args.community,
         args.type,
         args.output,
-        args.timeout
+        args.timeout,
+        used_ports
     )
     
     sys.exit(0 if success else 1)